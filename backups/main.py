@@ -1,15 +1,30 @@
 # main.py
 
-from fastapi import FastAPI, HTTPException, Response
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from fastapi import FastAPI, Header, HTTPException, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 import instaloader
-import requests
+import httpx
+import asyncio
+import contextvars
 import logging
 import os
 import json
+import hashlib
 import http.cookiejar as cookiejar
 from dotenv import load_dotenv
 
+from profile_cache import get_profile_cache, profile_to_node
+from rate_limiter import TokenBucketRateController
+from proxy_pool import attach_proxy_pool
+from fast_fetch import fetch_profile_fast
+from image_cache import ImageCache, etag_matches, DEFAULT_MAX_BYTES, DEFAULT_TTL
+from metrics import get_metrics, run_context, span, incr
+from snapshots import picture_identity
+
 # Carrega as variáveis do arquivo .env (se existir)
 load_dotenv()
 
@@ -17,11 +32,123 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Limite de chamadas bloqueantes (Instaloader/cache) executadas em paralelo
+INSTALOADER_WORKERS = int(os.getenv("INSTALOADER_WORKERS", "8"))
+# Limite de conexões do cliente HTTP usado para baixar as imagens
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+# Cache em memória das imagens (limite total em bytes e TTL em segundos)
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+IMAGE_CACHE_TTL = int(os.getenv("IMAGE_CACHE_TTL", DEFAULT_TTL))
+
+# Tamanho máximo de uma imagem repassada do CDN (bytes)
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", 8 * 1024 * 1024))
+# Total de bytes de imagens em trânsito no processo; acima disso as novas
+# requisições esperam até INFLIGHT_WAIT segundos e então recebem 503
+INFLIGHT_MAX_BYTES = int(os.getenv("INFLIGHT_MAX_BYTES", 64 * 1024 * 1024))
+INFLIGHT_WAIT = float(os.getenv("INFLIGHT_WAIT", "10"))
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Consulta direta ao web_profile_info (fast_fetch.py) em vez de instaloader.Profile
+USE_FAST_FETCH = os.getenv("FAST_FETCH", "").lower() in ("1", "true", "sim")
+
+# Limite de usernames por chamada do endpoint em lote
+BATCH_MAX_USERNAMES = int(os.getenv("BATCH_MAX_USERNAMES", "500"))
+
+image_cache = ImageCache(max_bytes=IMAGE_CACHE_MAX_BYTES, ttl=IMAGE_CACHE_TTL)
+executor = ThreadPoolExecutor(max_workers=INSTALOADER_WORKERS, thread_name_prefix="instaloader")
+http_client: httpx.AsyncClient = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Cria o cliente HTTP assíncrono (com pool de conexões) na subida do
+    serviço e libera os recursos no encerramento.
+    """
+    global http_client
+    http_client = httpx.AsyncClient(
+        timeout=HTTP_TIMEOUT,
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                            max_keepalive_connections=HTTP_MAX_CONNECTIONS),
+        follow_redirects=True,
+    )
+    try:
+        yield
+    finally:
+        await http_client.aclose()
+        executor.shutdown(wait=False)
+
+app = FastAPI(lifespan=lifespan)
+
+class SingleFlight:
+    """
+    Agrupa chamadas simultâneas com a mesma chave numa única execução.
+    Quem chega enquanto a busca está em andamento recebe o mesmo resultado
+    (ou a mesma exceção).
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    async def do(self, key, fn):
+        task = self._tasks.get(key)
+        if task is None:
+            # A busca roda numa task própria: se o primeiro cliente
+            # desconectar, os demais continuam esperando o resultado
+            task = asyncio.create_task(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+profile_flight = SingleFlight()
+
+class ByteBudget:
+    """
+    Limite global de bytes de imagens em trânsito. Cada download reserva o
+    tamanho da imagem antes de ler o corpo e libera ao terminar; com o
+    limite atingido, as novas reservas esperam (backpressure) em vez de
+    aumentar o uso de memória.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_use = 0
+        self.waits = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self, size, timeout):
+        """Reserva `size` bytes; levanta TimeoutError se não couber em `timeout` segundos"""
+        size = min(size, self.limit)
+        async with self._cond:
+            if self.in_use + size > self.limit:
+                self.waits += 1
+                incr("api_backpressure")
+                await asyncio.wait_for(
+                    self._cond.wait_for(lambda: self.in_use + size <= self.limit), timeout)
+            self.in_use += size
+        return size
+
+    async def release(self, size):
+        async with self._cond:
+            self.in_use -= size
+            self._cond.notify_all()
+
+    def stats(self):
+        return {"bytes_em_transito": self.in_use, "limite": self.limit, "esperas": self.waits}
+
+inflight_bytes = ByteBudget(INFLIGHT_MAX_BYTES)
 
 class InstagramProfile(BaseModel):
     username: str
 
+class InstagramProfiles(BaseModel):
+    usernames: list[str]
+
 def load_cookies(cookies_file: str) -> cookiejar.CookieJar:
     """
     Carrega cookies de um arquivo JSON e os converte para CookieJar.
@@ -59,7 +186,7 @@ def load_cookies(cookies_file: str) -> cookiejar.CookieJar:
     return jar
 
 # Inicializa Instaloader e carrega os cookies
-loader = instaloader.Instaloader()
+loader = instaloader.Instaloader(rate_controller=TokenBucketRateController)
 
 cookies_file = 'cookies.json'  # Caminho para o arquivo de cookies
 
@@ -76,26 +203,165 @@ else:
     # Opcional: você pode optar por sair ou continuar sem autenticação
     # Aqui, continuaremos sem autenticação
 
+# Consultas ao Instagram saem pelos proxies de proxies.txt, se houver
+attach_proxy_pool(loader)
+
+def fetch_profile(username: str):
+    """
+    Busca o perfil no cache ou no Instagram (bloqueante; roda no executor).
+    """
+    def _fetch():
+        if USE_FAST_FETCH:
+            return fetch_profile_fast(loader.context, username)
+        return instaloader.Profile.from_username(loader.context, username)
+
+    with span("perfil"):
+        return get_profile_cache().get_or_fetch(username, _fetch)
+
+async def lookup_profile(username: str):
+    """
+    Busca o perfil sem bloquear o event loop. Chamadas simultâneas para o
+    mesmo usuário compartilham uma única consulta.
+    """
+    async def _fetch():
+        loop = asyncio.get_running_loop()
+        # copy_context leva o run_id das métricas para a thread do executor
+        return await loop.run_in_executor(executor, contextvars.copy_context().run,
+                                          fetch_profile, username)
+    return await profile_flight.do(username.lower(), _fetch)
+
+async def open_profile_image(profile_pic_url: str):
+    """
+    Abre o download da imagem no cliente HTTP compartilhado (sem ler o
+    corpo) e reserva o tamanho dela no limite de bytes em trânsito.
+    Retorna (resposta, bytes reservados, tamanho ou None).
+    """
+    with span("imagem"):
+        upstream = await http_client.send(http_client.build_request("GET", profile_pic_url),
+                                          stream=True)
+    try:
+        if upstream.status_code != 200:
+            logger.error("Erro ao baixar a imagem de perfil.")
+            raise HTTPException(status_code=500, detail="Erro ao baixar a imagem de perfil.")
+        length = upstream.headers.get("Content-Length")
+        length = int(length) if length and length.isdigit() else None
+        if length is not None and length > IMAGE_MAX_BYTES:
+            incr("api_imagens_recusadas", motivo="tamanho")
+            raise HTTPException(status_code=502, detail="Imagem de perfil excede o tamanho máximo.")
+        try:
+            # Sem Content-Length, reserva o máximo permitido
+            reserved = await inflight_bytes.acquire(length or IMAGE_MAX_BYTES, INFLIGHT_WAIT)
+        except asyncio.TimeoutError:
+            incr("api_imagens_recusadas", motivo="sobrecarga")
+            raise HTTPException(status_code=503, detail="Serviço sobrecarregado, tente novamente.",
+                                headers={"Retry-After": str(max(1, int(INFLIGHT_WAIT)))})
+    except BaseException:
+        await upstream.aclose()
+        raise
+    return upstream, reserved, length
+
+def picture_etag(profile_pic_url: str) -> str:
+    """
+    ETag da foto derivado do nome do arquivo no CDN, que só muda quando a
+    foto é trocada (os parâmetros assinados da URL mudam a cada consulta).
+    """
+    identity = picture_identity(profile_pic_url) or profile_pic_url
+    return '"' + hashlib.sha1(identity.encode("utf-8")).hexdigest() + '"'
+
+async def relay_profile_image(key: str, upstream, reserved: int, content_type: str, etag: str):
+    """
+    Repassa o corpo da imagem em blocos. Se a imagem cabe no cache, os
+    blocos também são guardados (dentro da reserva) e a imagem completa vai
+    para o cache no final. Um corpo maior que o informado ou que
+    IMAGE_MAX_BYTES interrompe a resposta.
+    """
+    cacheable = reserved <= image_cache.max_item_bytes
+    chunks = []
+    size = 0
+    try:
+        async for chunk in upstream.aiter_bytes(STREAM_CHUNK_SIZE):
+            size += len(chunk)
+            if size > reserved:
+                incr("api_imagens_recusadas", motivo="tamanho")
+                raise ValueError(f"Imagem de perfil maior que {reserved} bytes; resposta interrompida")
+            if cacheable:
+                chunks.append(chunk)
+            yield chunk
+        if cacheable:
+            image_cache.put(key, b"".join(chunks), content_type, etag)
+        logger.info("Imagem de perfil repassada com sucesso.")
+    finally:
+        incr("bytes", size, direcao="download")
+        await upstream.aclose()
+        await inflight_bytes.release(reserved)
+
+async def stream_profile_image(username: str, if_none_match: Optional[str]) -> Response:
+    """
+    Obtém a URL da foto e repassa a imagem do CDN ao cliente em blocos,
+    com o tamanho e o tipo informados pelo CDN. O ETag vem da identidade da
+    foto, então o cliente que já tem a mesma foto recebe 304 sem que ela
+    seja baixada do CDN; a entrada do cache usa o mesmo ETag.
+    """
+    profile = await lookup_profile(username)
+    profile_pic_url = profile.profile_pic_url
+    logger.info(f"URL da foto de perfil: {profile_pic_url}")
+
+    etag = picture_etag(profile_pic_url)
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={image_cache.ttl}"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    upstream, reserved, length = await open_profile_image(profile_pic_url)
+    content_type = upstream.headers.get("Content-Type", "image/jpeg")
+    # Com Content-Encoding o corpo repassado é o decodificado, de outro tamanho
+    if length is not None and "Content-Encoding" not in upstream.headers:
+        headers["Content-Length"] = str(length)
+    return StreamingResponse(relay_profile_image(username.lower(), upstream, reserved,
+                                                 content_type, etag),
+                             media_type=content_type, headers=headers)
+
+def image_response(item, if_none_match: Optional[str]) -> Response:
+    """
+    Monta a resposta com ETag/Cache-Control; retorna 304 se o cliente já
+    tiver a mesma versão da imagem.
+    """
+    headers = {
+        "ETag": item.etag,
+        "Cache-Control": f"public, max-age={item.ttl_remaining()}",
+    }
+    if etag_matches(if_none_match, item.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=item.content, media_type=item.content_type, headers=headers)
+
 @app.post("/api/get_instagram_profile")
-async def get_instagram_profile(data: InstagramProfile):
+async def get_instagram_profile(data: InstagramProfile,
+                                if_none_match: Optional[str] = Header(None)):
     """
     Endpoint para obter a imagem de perfil de um usuário do Instagram.
-    Retorna a imagem como 'image/jpeg'.
+    Retorna a imagem com o tipo informado pelo CDN (normalmente 'image/jpeg').
+    Requisições simultâneas para o mesmo usuário compartilham uma única busca
+    do perfil; a imagem é repassada do CDN em blocos, sem carregá-la inteira
+    na memória, e fica em cache em memória (ETag/If-None-Match suportados).
     """
-    username = data.username
+    username = data.username.lstrip('@')
+    with run_context(username), span("api"):
+        return await _get_instagram_profile(username, if_none_match)
+
+async def _get_instagram_profile(username: str, if_none_match: Optional[str]) -> Response:
     try:
         logger.info(f"Buscando perfil: {username}")
-        profile = instaloader.Profile.from_username(loader.context, username)
-        profile_pic_url = profile.profile_pic_url
-        logger.info(f"URL da foto de perfil: {profile_pic_url}")
-
-        response = requests.get(profile_pic_url)
-        if response.status_code == 200:
-            logger.info("Imagem de perfil baixada com sucesso.")
-            return Response(content=response.content, media_type="image/jpeg")
-        else:
-            logger.error("Erro ao baixar a imagem de perfil.")
-            raise HTTPException(status_code=500, detail="Erro ao baixar a imagem de perfil.")
+        item = image_cache.get(username.lower())
+        if item is None:
+            incr("api_image_cache", resultado="miss")
+            return await stream_profile_image(username, if_none_match)
+        incr("api_image_cache", resultado="hit")
+        logger.info("Imagem de perfil obtida do cache.")
+        return image_response(item, if_none_match)
+    except HTTPException:
+        raise
+    except httpx.HTTPError as e:
+        logger.error(f"Erro ao baixar a imagem de perfil: {e}")
+        raise HTTPException(status_code=500, detail="Erro ao baixar a imagem de perfil.")
     except instaloader.exceptions.ProfileNotExistsException:
         logger.error(f"Perfil '{username}' não encontrado.")
         raise HTTPException(status_code=404, detail="Perfil não encontrado.")
@@ -105,3 +371,68 @@ async def get_instagram_profile(data: InstagramProfile):
     except Exception as e:
         logger.error(f"Erro inesperado: {e}")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
+
+async def profile_line(username: str) -> bytes:
+    """
+    Busca o perfil e retorna a linha NDJSON com os dados (ou com o erro).
+    """
+    with run_context(username):
+        try:
+            record = profile_to_node(await lookup_profile(username))
+        except instaloader.exceptions.ProfileNotExistsException:
+            record = {"username": username, "erro": "Perfil não encontrado."}
+        except Exception as e:
+            logger.error(f"Erro ao buscar perfil '{username}': {e}")
+            record = {"username": username, "erro": str(e)}
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+async def stream_profiles(usernames: list):
+    """
+    Gera uma linha por perfil, na ordem em que as buscas terminam, com no
+    máximo INSTALOADER_WORKERS buscas ao mesmo tempo.
+    """
+    semaphore = asyncio.Semaphore(INSTALOADER_WORKERS)
+
+    async def _line(username):
+        async with semaphore:
+            return await profile_line(username)
+
+    tasks = [asyncio.create_task(_line(username)) for username in usernames]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        # Cliente desconectou: cancela as buscas que ainda não começaram
+        for task in tasks:
+            task.cancel()
+
+@app.post("/api/get_instagram_profiles")
+async def get_instagram_profiles(data: InstagramProfiles):
+    """
+    Endpoint em lote: retorna os dados de vários perfis como NDJSON
+    (application/x-ndjson), uma linha por perfil, enviada assim que a busca
+    termina. Perfis com falha vêm com o campo 'erro'.
+    """
+    usernames = list(dict.fromkeys(u.strip().lstrip('@') for u in data.usernames if u.strip()))
+    if len(usernames) > BATCH_MAX_USERNAMES:
+        raise HTTPException(status_code=413,
+                            detail=f"Máximo de {BATCH_MAX_USERNAMES} usernames por chamada.")
+    incr("api_lote_perfis", len(usernames))
+    return StreamingResponse(stream_profiles(usernames), media_type="application/x-ndjson")
+
+@app.get("/api/cache_stats")
+async def cache_stats():
+    """
+    Retorna taxa de acerto e uso de memória do cache de imagens, o estado
+    do cache de perfis e os bytes de imagens em trânsito.
+    """
+    loop = asyncio.get_running_loop()
+    profiles = await loop.run_in_executor(executor, lambda: get_profile_cache().stats())
+    return {"imagens": image_cache.stats(), "perfis": profiles, "transito": inflight_bytes.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Métricas do serviço no formato texto do Prometheus.
+    """
+    return get_metrics().render_prometheus()
@@ -0,0 +1,216 @@
+import io
+import os
+import sys
+import gzip
+import json
+import uuid
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from metrics import span, incr
+
+# Lotes da execução: partes NDJSON comprimidas e um manifesto com o índice
+BATCH_DIR = Path("dados") / "lotes"
+OBJECT_PREFIX = "lotes"
+
+# Tamanho máximo (comprimido) de cada parte antes de iniciar a próxima
+DEFAULT_CHUNK_BYTES = 32 * 1024 * 1024
+
+# A cada quantos bytes (descomprimidos) o compressor esvazia o buffer; sem
+# isso o tamanho comprimido da parte só é conhecido no fechamento
+FLUSH_EVERY = 1024 * 1024
+
+COMPRESSIONS = ("gzip", "zstd")
+EXTENSIONS = {"gzip": ".ndjson.gz", "zstd": ".ndjson.zst"}
+
+MANIFEST_FILE = "manifest.json"
+
+def log_info(message):
+    print(f"[INFO] {message}")
+
+def log_error(message):
+    print(f"[ERROR] {message}")
+
+def new_run_id():
+    return f"{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+
+def _open_compressed(raw, compression):
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=False)
+    return gzip.GzipFile(filename="", mode="wb", fileobj=raw, mtime=0)
+
+def open_chunk(path, compression=None):
+    """Abre uma parte para leitura como texto, linha a linha"""
+    path = Path(path)
+    if compression == "zstd" or (compression is None and path.suffix == ".zst"):
+        if zstandard is None:
+            raise RuntimeError("zstandard não instalado; execute pip install zstandard")
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        return io.TextIOWrapper(reader, encoding="utf-8")
+    return gzip.open(path, "rt", encoding="utf-8")
+
+class BatchWriter:
+    """Grava os registros da execução em partes NDJSON comprimidas
+
+    Em vez de um objeto por perfil, os registros vão para poucas partes de
+    até `max_bytes` (comprimidos), enviadas ao Minio assim que fecham. Ao
+    final, o manifesto lista as partes e indica em qual parte e linha está
+    cada perfil. Ele é enviado por último, só depois de todas as partes: um
+    manifesto publicado garante que o lote está completo.
+    """
+
+    def __init__(self, uploader=None, run_id=None, compression="gzip",
+                 max_bytes=DEFAULT_CHUNK_BYTES, base_dir=BATCH_DIR):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Compressão inválida: {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise RuntimeError("zstandard não instalado; execute pip install zstandard")
+        self.uploader = uploader
+        self.run_id = run_id or new_run_id()
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.dir = Path(base_dir) / self.run_id
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.parts = []
+        self.index = {}
+        self._lock = threading.Lock()
+        self._futures = []
+        self._raw = None
+        self._stream = None
+        self._current = None
+        self._unflushed = 0
+
+    def object_name(self, file_name):
+        return f"{OBJECT_PREFIX}/{self.run_id}/{file_name}"
+
+    def _open_part(self):
+        file_name = f"part-{len(self.parts):05d}{EXTENSIONS[self.compression]}"
+        self._current = {"arquivo": file_name, "objeto": self.object_name(file_name),
+                         "registros": 0, "bytes_descomprimidos": 0}
+        self._raw = open(self.dir / file_name, "wb")
+        self._stream = _open_compressed(self._raw, self.compression)
+
+    def _seal_part(self):
+        """Fecha a parte atual, calcula o digest e agenda o upload"""
+        self._stream.close()
+        self._raw.close()
+        self._unflushed = 0
+        part, self._current = self._current, None
+        path = self.dir / part["arquivo"]
+        data = path.read_bytes()
+        part["bytes"] = len(data)
+        part["sha256"] = hashlib.sha256(data).hexdigest()
+        self.parts.append(part)
+        incr("lotes_partes")
+        if self.uploader:
+            self._futures.append(self.uploader.submit_file(path, part["objeto"]))
+
+    def add(self, record):
+        """Adiciona um registro (ex.: profile_info) ao lote"""
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            if self._current is None:
+                self._open_part()
+            self._stream.write(line)
+            username = record.get("username")
+            if username:
+                self.index[username] = [len(self.parts), self._current["registros"]]
+            self._current["registros"] += 1
+            self._current["bytes_descomprimidos"] += len(line)
+            self._unflushed += len(line)
+            if self._unflushed >= FLUSH_EVERY:
+                self._stream.flush()
+                self._unflushed = 0
+                if self._raw.tell() >= self.max_bytes:
+                    self._seal_part()
+
+    def close(self):
+        """Fecha a última parte, aguarda os uploads e publica o manifesto
+
+        Retorna o manifesto. Se alguma parte falhar no upload, o manifesto
+        fica só no disco e a exceção é levantada.
+        """
+        with self._lock:
+            if self._current is not None:
+                self._seal_part()
+        manifest = {
+            "run_id": self.run_id,
+            "criado_em": datetime.now().isoformat(timespec="seconds"),
+            "compressao": self.compression,
+            "registros": sum(p["registros"] for p in self.parts),
+            "partes": self.parts,
+            "indice": self.index,
+        }
+        manifest_path = self.dir / MANIFEST_FILE
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        log_info(f"Lote {self.run_id}: {manifest['registros']} registros em "
+                 f"{len(self.parts)} partes ({self.dir})")
+
+        if self.uploader:
+            with span("lote_upload", partes=len(self.parts)):
+                errors = [e for e in (f.exception() for f in self._futures) if e is not None]
+                if errors:
+                    raise Exception(f"Falha no upload do lote {self.run_id}: {str(errors[0])}")
+                self.uploader.upload_file(manifest_path, self.object_name(MANIFEST_FILE))
+            log_info(f"Lote enviado para {self.object_name('')}")
+        return manifest
+
+def open_batch_writer(uploader=None, compression=None):
+    """Cria o BatchWriter com BATCH_COMPRESSION e BATCH_CHUNK_BYTES do .env"""
+    return BatchWriter(uploader=uploader,
+                       compression=compression or os.getenv("BATCH_COMPRESSION", "gzip"),
+                       max_bytes=int(os.getenv("BATCH_CHUNK_BYTES", DEFAULT_CHUNK_BYTES)))
+
+def load_manifest(batch_dir):
+    with open(Path(batch_dir) / MANIFEST_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+def iter_records(batch_dir):
+    """Percorre todos os registros de um lote local, na ordem das partes"""
+    manifest = load_manifest(batch_dir)
+    for part in manifest["partes"]:
+        with open_chunk(Path(batch_dir) / part["arquivo"], manifest["compressao"]) as f:
+            for line in f:
+                yield json.loads(line)
+
+def find_record(batch_dir, username):
+    """Busca o registro de um perfil pelo índice do manifesto (lê só a parte dele)"""
+    manifest = load_manifest(batch_dir)
+    position = manifest["indice"].get(username)
+    if position is None:
+        return None
+    part, line_number = position
+    with open_chunk(Path(batch_dir) / manifest["partes"][part]["arquivo"],
+                    manifest["compressao"]) as f:
+        for i, line in enumerate(f):
+            if i == line_number:
+                return json.loads(line)
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Lê um lote NDJSON gravado pelo modo --batch-output')
+    parser.add_argument('batch_dir', type=str, help='Diretório do lote (dados/lotes/<run_id>)')
+    parser.add_argument('--username', type=str, help='Mostra apenas o registro deste perfil')
+    args = parser.parse_args()
+
+    if args.username:
+        record = find_record(args.batch_dir, args.username.lstrip('@'))
+        if record is None:
+            log_error(f"@{args.username.lstrip('@')} não está no lote")
+            sys.exit(1)
+        print(json.dumps(record, ensure_ascii=False, indent=4))
+        return
+    for record in iter_records(args.batch_dir):
+        print(json.dumps(record, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
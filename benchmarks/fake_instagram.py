@@ -0,0 +1,198 @@
+"""Stub local dos endpoints do Instagram e do CDN usados pelo scraper.
+
+Serve o web_profile_info (API do iPhone), o info por userid, a listagem de
+posts (GraphQL por doc_id) e as fotos/mídias do CDN, com latência e injeção
+de erros configuráveis.
+"""
+import json
+import time
+import random
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Posts por página na listagem (mesmo valor usado pelo Instagram)
+POSTS_PAGE_SIZE = 12
+
+# Usernames com este prefixo não existem (ProfileNotExistsException)
+MISSING_PREFIX = "naoexiste"
+
+class FakeInstagramConfig:
+    def __init__(self, latency_ms=50, jitter_ms=20, error_rate=0.0, rate_limit_rate=0.0,
+                 pic_size=100 * 1024, cdn_latency_ms=20):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.pic_size = pic_size
+        self.cdn_latency_ms = cdn_latency_ms
+
+def userid_for(username):
+    return int(hashlib.sha1(username.encode()).hexdigest()[:12], 16)
+
+def picture_for(username, size):
+    """Gera bytes determinísticos para a foto do usuário"""
+    seed = hashlib.sha256(username.encode()).digest()
+    return (seed * (size // len(seed) + 1))[:size]
+
+class FakeInstagramServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        super().__init__((host, port), FakeInstagramHandler)
+        self.config = config or FakeInstagramConfig()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+        self.errors_injected = 0
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, sent, injected=False):
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += sent
+            self.errors_injected += int(injected)
+
+    def stats(self):
+        with self._lock:
+            return {"requisicoes": self.requests, "bytes_enviados": self.bytes_sent,
+                    "erros_injetados": self.errors_injected}
+
+    def user_node(self, username):
+        return {
+            "id": str(userid_for(username)),
+            "username": username,
+            "full_name": username.replace(".", " ").title(),
+            "biography": f"Perfil de teste de @{username}",
+            "edge_owner_to_timeline_media": {"count": len(username) * 10},
+            "edge_followed_by": {"count": userid_for(username) % 100000},
+            "edge_follow": {"count": userid_for(username) % 1000},
+            "is_private": False,
+            "is_verified": username.endswith("oficial"),
+            "profile_pic_url": f"{self.base_url}/cdn/{username}.jpg?stp=s150",
+            "profile_pic_url_hd": f"{self.base_url}/cdn/{username}.jpg?stp=hd",
+        }
+
+    def post_count(self, username):
+        return len(username) * 10
+
+    def post_node(self, username, index):
+        """Post no formato da API do iPhone (o mais recente tem índice 0)"""
+        pk = userid_for(username) * 10000 + index
+        shortcode = f"P{pk:x}"[-11:]
+        node = {
+            "code": shortcode,
+            "pk": str(pk),
+            "media_type": 8 if index % 5 == 0 else 1,
+            "taken_at": 1700000000 - index * 3600,
+            "caption": {"text": f"Post {index} de @{username} #teste"},
+            "has_liked": False,
+            "like_count": index * 3,
+            "comment_count": index,
+            "image_versions2": {"candidates": [
+                {"url": f"{self.base_url}/cdn/{shortcode}.jpg"}]},
+        }
+        if node["media_type"] == 8:
+            node["carousel_media"] = [
+                {"media_type": 1, "image_versions2": {"candidates": [
+                    {"url": f"{self.base_url}/cdn/{shortcode}_{i}.jpg"}]}}
+                for i in range(3)]
+        return node
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+class FakeInstagramHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json", headers=None, injected=False):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count(len(body), injected)
+
+    def _send_json(self, status, data, **kwargs):
+        self._send(status, json.dumps(data).encode("utf-8"), **kwargs)
+
+    def _delay(self, base_ms):
+        config = self.server.config
+        delay = max(0.0, base_ms + random.uniform(-config.jitter_ms, config.jitter_ms))
+        time.sleep(delay / 1000)
+
+    def _inject_error(self):
+        config = self.server.config
+        roll = random.random()
+        if roll < config.rate_limit_rate:
+            self._send_json(429, {"message": "Please wait a few minutes", "status": "fail"},
+                            headers={"Retry-After": "1"}, injected=True)
+            return True
+        if roll < config.rate_limit_rate + config.error_rate:
+            self._send_json(500, {"message": "erro injetado", "status": "fail"}, injected=True)
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if url.path.startswith("/cdn/"):
+            self._delay(self.server.config.cdn_latency_ms)
+            if self._inject_error():
+                return
+            username = url.path[len("/cdn/"):].rsplit(".", 1)[0]
+            self._send(200, picture_for(username, self.server.config.pic_size), "image/jpeg")
+            return
+
+        self._delay(self.server.config.latency_ms)
+        if self._inject_error():
+            return
+
+        if url.path == "/api/v1/users/web_profile_info/":
+            username = query.get("username", [""])[0].lower()
+            user = None if username.startswith(MISSING_PREFIX) else self.server.user_node(username)
+            self._send_json(200, {"data": {"user": user}, "status": "ok"})
+            return
+
+        if url.path.startswith("/api/v1/users/") and url.path.endswith("/info/"):
+            self._send_json(200, {"user": {"hd_profile_pic_url_info": {
+                "url": f"{self.server.base_url}/cdn/{url.path.split('/')[4]}.jpg?stp=hd"}},
+                "status": "ok"})
+            return
+
+        self._send_json(404, {"message": "not found", "status": "fail"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode("utf-8")
+        form = parse_qs(body)
+        self._delay(self.server.config.latency_ms)
+        if self._inject_error():
+            return
+
+        if url.path == "/graphql/query":
+            variables = json.loads(form.get("variables", ["{}"])[0])
+            username = variables.get("username", "")
+            start = int(variables.get("after") or 0)
+            total = self.server.post_count(username)
+            end = min(start + POSTS_PAGE_SIZE, total)
+            self._send_json(200, {"data": {"xdt_api__v1__feed__user_timeline_graphql_connection": {
+                "edges": [{"node": self.server.post_node(username, i)} for i in range(start, end)],
+                "page_info": {"has_next_page": end < total, "end_cursor": str(end)},
+            }}, "status": "ok"})
+            return
+
+        self._send_json(404, {"message": "not found", "status": "fail"})
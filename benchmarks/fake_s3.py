@@ -0,0 +1,247 @@
+"""Stub local compatível com S3, suficiente para o cliente Minio do scraper.
+
+Guarda os objetos em memória e suporta bucket (HEAD/PUT/?location),
+PUT/HEAD/GET/DELETE de objetos e multipart upload, com latência e injeção
+de erros (503 SlowDown) configuráveis. Assinaturas não são verificadas.
+"""
+import time
+import uuid
+import random
+import hashlib
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+S3_NS = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+class FakeS3Config:
+    def __init__(self, latency_ms=10, jitter_ms=5, error_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+class StoredObject:
+    __slots__ = ("data", "etag", "content_type", "metadata", "modified")
+
+    def __init__(self, data, content_type, metadata, etag=None):
+        self.data = data
+        self.etag = etag or hashlib.md5(data).hexdigest()
+        self.content_type = content_type
+        self.metadata = metadata
+        self.modified = time.time()
+
+class FakeS3Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        super().__init__((host, port), FakeS3Handler)
+        self.config = config or FakeS3Config()
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.uploads = {}
+        self.requests = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.errors_injected = 0
+
+    @property
+    def endpoint(self):
+        host, port = self.server_address[:2]
+        return f"{host}:{port}"
+
+    def count(self, received=0, sent=0, injected=False):
+        with self.lock:
+            self.requests += 1
+            self.bytes_received += received
+            self.bytes_sent += sent
+            self.errors_injected += int(injected)
+
+    def stats(self):
+        with self.lock:
+            return {"requisicoes": self.requests, "bytes_recebidos": self.bytes_received,
+                    "bytes_enviados": self.bytes_sent, "erros_injetados": self.errors_injected,
+                    "objetos": sum(len(b) for b in self.buckets.values())}
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+class FakeS3Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _parse(self):
+        url = urlparse(self.path)
+        parts = unquote(url.path).lstrip("/").split("/", 1)
+        bucket = parts[0]
+        key = parts[1] if len(parts) > 1 else ""
+        return bucket, key, parse_qs(url.query, keep_blank_values=True)
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            return b"".join(chunks)
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _send(self, status, body=b"", headers=None, received=0, injected=False, head=False):
+        self.send_response(status)
+        headers = dict(headers or {})
+        headers.setdefault("Content-Type", "application/xml")
+        headers.setdefault("Content-Length", str(len(body)))
+        headers.setdefault("x-amz-request-id", uuid.uuid4().hex[:16])
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+        self.server.count(received, 0 if head else len(body), injected)
+
+    def _error(self, status, code, message, resource="", received=0, injected=False, head=False):
+        body = (f"{XML_HEADER}<Error><Code>{code}</Code><Message>{message}</Message>"
+                f"<Resource>{resource}</Resource><RequestId>fake</RequestId>"
+                f"<HostId>fake</HostId></Error>").encode("utf-8")
+        self._send(status, body, received=received, injected=injected, head=head)
+
+    def _before(self, received=0, head=False):
+        """Aplica latência e injeção de erro; retorna True se respondeu com erro"""
+        config = self.server.config
+        delay = max(0.0, config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms))
+        time.sleep(delay / 1000)
+        if random.random() < config.error_rate:
+            self._error(503, "SlowDown", "Please reduce your request rate.", self.path,
+                        received=received, injected=True, head=head)
+            return True
+        return False
+
+    def _object_headers(self, obj):
+        headers = {"ETag": f'"{obj.etag}"', "Content-Type": obj.content_type,
+                   "Content-Length": str(len(obj.data)),
+                   "Last-Modified": formatdate(obj.modified, usegmt=True)}
+        headers.update(obj.metadata)
+        return headers
+
+    def do_HEAD(self):
+        bucket, key, _ = self._parse()
+        if self._before(head=True):
+            return
+        with self.server.lock:
+            objects = self.server.buckets.get(bucket)
+            obj = objects.get(key) if objects is not None and key else None
+        if objects is None or (key and obj is None):
+            self._error(404, "NoSuchKey" if objects is not None else "NoSuchBucket",
+                        "Not found", self.path, head=True)
+        elif obj is None:
+            self._send(200, head=True)
+        else:
+            self._send(200, obj.data, self._object_headers(obj), head=True)
+
+    def do_GET(self):
+        bucket, key, query = self._parse()
+        if self._before():
+            return
+        with self.server.lock:
+            objects = self.server.buckets.get(bucket)
+            obj = objects.get(key) if objects is not None and key else None
+        if "location" in query:
+            body = f'{XML_HEADER}<LocationConstraint xmlns="{S3_NS}"></LocationConstraint>'
+            self._send(200, body.encode("utf-8"))
+        elif objects is None:
+            self._error(404, "NoSuchBucket", "The specified bucket does not exist", bucket)
+        elif obj is None:
+            self._error(404, "NoSuchKey", "The specified key does not exist", self.path)
+        else:
+            self._send(200, obj.data, self._object_headers(obj))
+
+    def do_PUT(self):
+        bucket, key, query = self._parse()
+        body = self._read_body()
+        if self._before(received=len(body)):
+            return
+        with self.server.lock:
+            if not key:
+                self.server.buckets.setdefault(bucket, {})
+                result = "bucket"
+            elif bucket not in self.server.buckets:
+                result = None
+            elif "uploadId" in query:
+                upload = self.server.uploads.get(query["uploadId"][0])
+                if upload is not None:
+                    upload["parts"][int(query["partNumber"][0])] = body
+                result = hashlib.md5(body).hexdigest() if upload is not None else None
+            else:
+                metadata = {k: v for k, v in self.headers.items()
+                            if k.lower().startswith("x-amz-meta-")}
+                obj = StoredObject(body, self.headers.get("Content-Type",
+                                                          "application/octet-stream"), metadata)
+                self.server.buckets[bucket][key] = obj
+                result = obj.etag
+        if result is None:
+            self._error(404, "NoSuchBucket", "The specified bucket does not exist", bucket,
+                        received=len(body))
+        elif result == "bucket":
+            self._send(200, headers={"Location": f"/{bucket}"}, received=len(body))
+        else:
+            self._send(200, headers={"ETag": f'"{result}"'}, received=len(body))
+
+    def do_POST(self):
+        bucket, key, query = self._parse()
+        body = self._read_body()
+        if self._before(received=len(body)):
+            return
+        if "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            metadata = {k: v for k, v in self.headers.items()
+                        if k.lower().startswith("x-amz-meta-")}
+            with self.server.lock:
+                self.server.uploads[upload_id] = {
+                    "parts": {}, "metadata": metadata,
+                    "content_type": self.headers.get("Content-Type", "application/octet-stream")}
+            response = (f'{XML_HEADER}<InitiateMultipartUploadResult xmlns="{S3_NS}">'
+                        f"<Bucket>{bucket}</Bucket><Key>{key}</Key>"
+                        f"<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>")
+            self._send(200, response.encode("utf-8"), received=len(body))
+            return
+        if "uploadId" in query:
+            with self.server.lock:
+                upload = self.server.uploads.pop(query["uploadId"][0], None)
+                if upload is not None and bucket in self.server.buckets:
+                    parts = [upload["parts"][n] for n in sorted(upload["parts"])]
+                    digest = hashlib.md5(b"".join(hashlib.md5(p).digest() for p in parts))
+                    obj = StoredObject(b"".join(parts), upload["content_type"], upload["metadata"],
+                                       etag=f"{digest.hexdigest()}-{len(parts)}")
+                    self.server.buckets[bucket][key] = obj
+                else:
+                    obj = None
+            if obj is None:
+                self._error(404, "NoSuchUpload", "The specified upload does not exist", self.path,
+                            received=len(body))
+                return
+            response = (f'{XML_HEADER}<CompleteMultipartUploadResult xmlns="{S3_NS}">'
+                        f"<Bucket>{bucket}</Bucket><Key>{key}</Key>"
+                        f'<ETag>"{obj.etag}"</ETag></CompleteMultipartUploadResult>')
+            self._send(200, response.encode("utf-8"), received=len(body))
+            return
+        self._error(400, "InvalidRequest", "Unsupported operation", self.path, received=len(body))
+
+    def do_DELETE(self):
+        bucket, key, query = self._parse()
+        if self._before():
+            return
+        with self.server.lock:
+            if "uploadId" in query:
+                self.server.uploads.pop(query["uploadId"][0], None)
+            else:
+                self.server.buckets.get(bucket, {}).pop(key, None)
+        self._send(204)
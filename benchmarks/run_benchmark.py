@@ -0,0 +1,404 @@
+"""Benchmark offline do scraper
+
+Sobe um Instagram falso (API + CDN) e um S3 falso locais e executa os
+caminhos reais do código contra eles:
+
+  pipeline  save_instagram_data (via _process_profile) com W workers
+  upload    upload_to_minio em diretórios já preparados
+  api       endpoint /api/get_instagram_profile do backups/main.py
+
+Relata perfis/minuto, p50/p95/p99 por fase e bytes transferidos, e salva o
+resultado em benchmarks/results/<timestamp>.json.
+
+Uso:
+  python benchmarks/run_benchmark.py --profiles 200 --workers 8
+  python benchmarks/run_benchmark.py --latency-ms 150 --error-rate 0.05 --compare benchmarks/results/anterior.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+import contextlib
+import subprocess
+import importlib.util
+from pathlib import Path
+from datetime import datetime
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+RESULTS_DIR = BENCH_DIR / "results"
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+import requests
+
+from fake_instagram import FakeInstagramServer, FakeInstagramConfig
+from fake_s3 import FakeS3Server, FakeS3Config
+
+SCENARIOS = ("pipeline", "upload", "api")
+BUCKET = "benchmark"
+
+# Orçamentos altos para que o rate limiter não interfira na medição
+UNLIMITED_BUDGET = "1000000/1"
+
+def log_info(message):
+    print(f"[INFO] {message}", file=sys.__stdout__)
+
+def log_error(message):
+    print(f"[ERROR] {message}", file=sys.__stdout__)
+
+def percentile(values, pct):
+    """Percentil por interpolação linear (values já ordenados)"""
+    if not values:
+        return None
+    k = (len(values) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (k - lower)
+
+class PhaseRecorder:
+    """Guarda a duração de cada chamada por fase"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def add(self, phase, seconds):
+        with self._lock:
+            self._samples.setdefault(phase, []).append(seconds)
+
+    def on_span(self, record):
+        self.add(record["span"], record["duracao_ms"] / 1000)
+
+    def reset(self):
+        with self._lock:
+            self._samples = {}
+
+    def summary(self):
+        with self._lock:
+            samples = {phase: sorted(values) for phase, values in self._samples.items()}
+        return {phase: {
+            "n": len(values),
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "media_ms": sum(values) / len(values) * 1000,
+            "max_ms": values[-1] * 1000,
+        } for phase, values in samples.items()}
+
+class RedirectAdapter(requests.adapters.HTTPAdapter):
+    """Adapter que envia as requisições do Instaloader ao Instagram falso"""
+
+    def __init__(self, target, **kwargs):
+        super().__init__(**kwargs)
+        self.target = target.rstrip("/")
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        request.url = self.target + url.path + (f"?{url.query}" if url.query else "")
+        return super().send(request, **kwargs)
+
+    def close(self):
+        # A sessão do Instaloader é copiada e fechada a cada consulta;
+        # o pool de conexões deve sobreviver a isso
+        pass
+
+def configure_environment(s3, workdir):
+    """Aponta o código do repositório para os serviços falsos"""
+    os.environ.update({
+        "MINIO_ENDPOINT": s3.endpoint,
+        "MINIO_SECURE": "0",
+        "MINIO_REGION": "us-east-1",
+        "MINIO_ACCESS_KEY": "benchmark",
+        "MINIO_SECRET_KEY": "benchmark",
+        "BUCKET_NAME": BUCKET,
+        "PROFILE_CACHE_PATH": str(Path(workdir) / "profile_cache.db"),
+    })
+    for endpoint in ("GRAPHQL", "IPHONE", "OTHER", "CDN"):
+        os.environ.setdefault(f"RATE_LIMIT_{endpoint}", UNLIMITED_BUDGET)
+
+def create_loader(instagram, workers):
+    import instaloader
+    from session_pool import mount_adapter
+    from rate_limiter import TokenBucketRateController
+
+    loader = instaloader.Instaloader(sleep=False, quiet=True, max_connection_attempts=3,
+                                     rate_controller=TokenBucketRateController)
+    adapter = RedirectAdapter(instagram.base_url, pool_connections=2, pool_maxsize=workers * 2)
+    for prefix in ("https://i.instagram.com/", "https://www.instagram.com/"):
+        mount_adapter(loader.context, prefix, adapter)
+    return loader
+
+def instrument(recorder, trace_file=None):
+    """Coleta as fases a partir dos spans emitidos pelo próprio código (metrics.py)"""
+    from metrics import get_metrics
+
+    metrics = get_metrics()
+    metrics.add_listener(recorder.on_span)
+    if trace_file:
+        metrics.set_trace_file(trace_file)
+
+@contextlib.contextmanager
+def quiet(enabled):
+    """Silencia os prints e logs do scraper durante a medição"""
+    if not enabled:
+        yield
+        return
+    logging.disable(logging.CRITICAL)
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            yield
+    finally:
+        logging.disable(logging.NOTSET)
+
+def scenario_result(recorder, results, elapsed, bytes_info):
+    ok = sum(1 for r in results if r["ok"])
+    errors = {}
+    for r in results:
+        if not r["ok"]:
+            errors[r["erro"]] = errors.get(r["erro"], 0) + 1
+    return {
+        "perfis": len(results),
+        "sucesso": ok,
+        "falhas": len(results) - ok,
+        "erros": dict(sorted(errors.items(), key=lambda item: -item[1])[:5]),
+        "duracao_s": elapsed,
+        "perfis_por_minuto": ok / elapsed * 60 if elapsed else 0.0,
+        "fases": recorder.summary(),
+        "bytes": bytes_info,
+    }
+
+def traffic(instagram, s3, before=None):
+    """Bytes e requisições trafegados nos serviços falsos (desde `before`)"""
+    current = {"instagram": instagram.stats(), "s3": s3.stats()}
+    if before is None:
+        return current
+    return {service: {key: value - before[service].get(key, 0) for key, value in stats.items()}
+            for service, stats in current.items()}
+
+def run_pipeline(args, recorder, instagram, s3):
+    import get_profile
+    from session_pool import SessionPool
+    from minio_uploader import MinioUploader
+
+    loader = create_loader(instagram, args.workers)
+    pool = SessionPool(usernames=["benchmark"], loader_factory=lambda _: loader)
+    uploader = MinioUploader(workers=args.upload_workers)
+    usernames = [f"perfil_p{i:05d}" for i in range(args.profiles)]
+    before = traffic(instagram, s3)
+
+    start = time.perf_counter()
+    with quiet(not args.verbose), ThreadPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(
+            lambda u: get_profile._process_profile(u, pool, uploader, args.diskless), usernames))
+        uploader.flush()
+    elapsed = time.perf_counter() - start
+
+    for r in results:
+        errors = [f.exception() for f in r.pop("uploads") if f.exception() is not None]
+        if errors and r["ok"]:
+            r["ok"], r["erro"] = False, f"Falha no upload para Minio: {str(errors[0])}"
+    uploader.close()
+    return scenario_result(recorder, results, elapsed, traffic(instagram, s3, before))
+
+def run_upload(args, recorder, instagram, s3):
+    import get_profile
+    from minio_uploader import MinioUploader
+    from fake_instagram import picture_for
+
+    uploader = MinioUploader(workers=args.upload_workers, incremental=args.incremental)
+    user_dirs = []
+    for i in range(args.profiles):
+        user_dir = Path("dados") / f"perfil_u{i:05d}"
+        user_dir.mkdir(parents=True, exist_ok=True)
+        (user_dir / "profile_info.json").write_text(json.dumps({"username": user_dir.name}))
+        (user_dir / "profile_pic.jpg").write_bytes(picture_for(user_dir.name, args.pic_size))
+        user_dirs.append(user_dir)
+    before = traffic(instagram, s3)
+
+    def upload(user_dir):
+        start = time.perf_counter()
+        ok = get_profile.upload_to_minio(user_dir, uploader)
+        return {"username": user_dir.name, "ok": bool(ok), "erro": None if ok else "falha no upload",
+                "duracao": time.perf_counter() - start}
+
+    start = time.perf_counter()
+    with quiet(not args.verbose), ThreadPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(upload, user_dirs))
+    elapsed = time.perf_counter() - start
+    uploader.close()
+    return scenario_result(recorder, results, elapsed, traffic(instagram, s3, before))
+
+def run_api(args, recorder, instagram, s3):
+    try:
+        import httpx
+        spec = importlib.util.spec_from_file_location("benchmark_api", REPO_DIR / "backups" / "main.py")
+        api = importlib.util.module_from_spec(spec)
+        with quiet(not args.verbose):
+            spec.loader.exec_module(api)
+    except ImportError as e:
+        log_error(f"Cenário api ignorado: {str(e)}")
+        return None
+
+    loader = create_loader(instagram, args.workers)
+    api.loader = loader
+    usernames = [f"perfil_a{i:05d}" for i in range(args.profiles)]
+    before = traffic(instagram, s3)
+
+    async def request(client, semaphore, username, phase):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post("/api/get_instagram_profile", json={"username": username})
+                ok = response.status_code == 200
+                error = None if ok else f"HTTP {response.status_code}"
+            except Exception as e:
+                ok, error = False, str(e)
+            duration = time.perf_counter() - start
+            recorder.add(phase, duration)
+            return {"username": username, "ok": ok, "erro": error, "duracao": duration}
+
+    async def run():
+        semaphore = asyncio.Semaphore(args.workers)
+        transport = httpx.ASGITransport(app=api.app)
+        async with api.app.router.lifespan_context(api.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+                start = time.perf_counter()
+                results = await asyncio.gather(*(request(client, semaphore, u, "cliente_api")
+                                                 for u in usernames))
+                elapsed = time.perf_counter() - start
+                # Segunda passada: mesmas imagens, agora servidas do cache em memória
+                await asyncio.gather(*(request(client, semaphore, u, "cliente_api_cache")
+                                       for u in usernames))
+        return results, elapsed
+
+    with quiet(not args.verbose):
+        results, elapsed = asyncio.run(run())
+    return scenario_result(recorder, results, elapsed, traffic(instagram, s3, before))
+
+RUNNERS = {"pipeline": run_pipeline, "upload": run_upload, "api": run_api}
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_report(report):
+    for name, result in report["cenarios"].items():
+        print(f"\n== {name}: {result['sucesso']}/{result['perfis']} perfis em "
+              f"{result['duracao_s']:.2f}s ({result['perfis_por_minuto']:.0f} perfis/min)")
+        for phase, stats in result["fases"].items():
+            print(f"   {phase:<18} n={stats['n']:<6} p50={stats['p50_ms']:8.1f}ms "
+                  f"p95={stats['p95_ms']:8.1f}ms p99={stats['p99_ms']:8.1f}ms")
+        ig, s3 = result["bytes"]["instagram"], result["bytes"]["s3"]
+        print(f"   bytes: instagram->cliente {ig['bytes_enviados']}, "
+              f"cliente->s3 {s3['bytes_recebidos']} ({s3['requisicoes']} requisições S3)")
+        for error, count in result["erros"].items():
+            print(f"   erro ({count}x): {error}")
+
+def print_comparison(report, previous):
+    print(f"\nComparação com {previous.get('timestamp')} ({previous.get('revisao')}):")
+    for name, result in report["cenarios"].items():
+        old = previous.get("cenarios", {}).get(name)
+        if not old:
+            continue
+        rate, old_rate = result["perfis_por_minuto"], old["perfis_por_minuto"]
+        delta = (rate - old_rate) / old_rate * 100 if old_rate else 0.0
+        print(f"   {name}: {old_rate:.0f} -> {rate:.0f} perfis/min ({delta:+.1f}%)")
+        for phase, stats in result["fases"].items():
+            old_stats = old["fases"].get(phase)
+            if old_stats:
+                print(f"      {phase:<18} p95 {old_stats['p95_ms']:.1f} -> {stats['p95_ms']:.1f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline com Instagram e S3 falsos")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"Cenários separados por vírgula (padrão: {','.join(SCENARIOS)})")
+    parser.add_argument("--profiles", type=int, default=100, help="Perfis por cenário")
+    parser.add_argument("--workers", type=int, default=8, help="Perfis processados em paralelo")
+    parser.add_argument("--upload-workers", type=int, default=8, help="Threads do uploader")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Latência da API do Instagram")
+    parser.add_argument("--cdn-latency-ms", type=float, default=20, help="Latência do CDN")
+    parser.add_argument("--s3-latency-ms", type=float, default=10, help="Latência do S3")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fração de respostas 500 do Instagram/CDN")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0,
+                        help="Fração de respostas 429 do Instagram/CDN")
+    parser.add_argument("--s3-error-rate", type=float, default=0.0,
+                        help="Fração de respostas 503 SlowDown do S3")
+    parser.add_argument("--pic-size", type=int, default=100 * 1024, help="Tamanho das fotos (bytes)")
+    parser.add_argument("--diskless", action="store_true", help="Pipeline no modo sem disco")
+    parser.add_argument("--incremental", action="store_true", help="Upload com sync incremental")
+    parser.add_argument("--cache", action="store_true", help="Mantém o cache de perfis no pipeline")
+    parser.add_argument("--compare", type=str, help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--output", type=str, help="Arquivo de saída (padrão: benchmarks/results/)")
+    parser.add_argument("--trace-file", type=str, help="Grava os spans (JSON lines) neste arquivo")
+    parser.add_argument("--verbose", action="store_true", help="Mostra os logs do scraper")
+    args = parser.parse_args()
+
+    # Caminhos relativos ao diretório de onde o benchmark foi chamado
+    for name in ("compare", "output", "trace_file"):
+        if getattr(args, name):
+            setattr(args, name, str(Path(getattr(args, name)).resolve()))
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Cenários inválidos: {', '.join(sorted(unknown))}")
+
+    instagram = FakeInstagramServer(FakeInstagramConfig(
+        latency_ms=args.latency_ms, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, pic_size=args.pic_size,
+        cdn_latency_ms=args.cdn_latency_ms)).start()
+    s3 = FakeS3Server(FakeS3Config(latency_ms=args.s3_latency_ms,
+                                   error_rate=args.s3_error_rate)).start()
+
+    workdir = tempfile.mkdtemp(prefix="insta_benchmark_")
+    configure_environment(s3, workdir)
+    os.chdir(workdir)
+
+    import get_profile
+    get_profile.USE_PROFILE_CACHE = args.cache
+    recorder = PhaseRecorder()
+    instrument(recorder, args.trace_file)
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revisao": git_revision(),
+        "config": {key: value for key, value in vars(args).items()
+                   if key not in ("compare", "output", "verbose", "trace_file")},
+        "cenarios": {},
+    }
+    for name in scenarios:
+        log_info(f"Executando cenário {name} ({args.profiles} perfis, {args.workers} workers)")
+        recorder.reset()
+        result = RUNNERS[name](args, recorder, instagram, s3)
+        if result is not None:
+            report["cenarios"][name] = result
+
+    instagram.shutdown()
+    s3.shutdown()
+
+    print_report(report)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(report, json.load(f))
+
+    output = Path(args.output) if args.output else \
+        RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    log_info(f"Resultado salvo em {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import threading
+
+import requests
+
+from rate_limiter import get_rate_limiter, retry_after_seconds
+from proxy_pool import get_proxy_pool, ProxyAdapter
+
+# Timeout (conexão, leitura) para o download das fotos no CDN
+DOWNLOAD_TIMEOUT = (10, 60)
+
+# Conexões mantidas por host no pool da sessão HTTP
+DEFAULT_POOL_MAXSIZE = 8
+
+_default_session = None
+_default_session_lock = threading.Lock()
+
+def get_http_session():
+    """Retorna a sessão HTTP (com pool de conexões) usada para baixar do CDN
+
+    Com proxies em proxies.txt, os downloads saem pelo pool de proxies, como
+    as consultas ao Instagram.
+    """
+    global _default_session
+    with _default_session_lock:
+        if _default_session is None:
+            session = requests.Session()
+            proxies = get_proxy_pool()
+            if proxies:
+                adapter = ProxyAdapter(proxies, pool_maxsize=DEFAULT_POOL_MAXSIZE)
+            else:
+                adapter = requests.adapters.HTTPAdapter(pool_maxsize=DEFAULT_POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _default_session = session
+        return _default_session
+
+def open_picture(url):
+    """Abre o download da foto em stream
+
+    Respeita o rate limiter do CDN; um 429 bloqueia o bucket pelo Retry-After
+    e sobe como HTTPError (reconhecido por is_rate_limited).
+    """
+    limiter = get_rate_limiter()
+    limiter.acquire(None, "cdn")
+    response = get_http_session().get(url, stream=True, timeout=DOWNLOAD_TIMEOUT)
+    if response.status_code == 429:
+        limiter.throttle(None, "cdn", retry_after_seconds(response))
+    response.raise_for_status()
+    return response
@@ -0,0 +1,237 @@
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import argparse
+import threading
+import socketserver
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from dotenv import load_dotenv
+
+import get_profile
+from get_profile import save_instagram_data, DEFAULT_WORKERS
+from session_pool import SessionPool, STRATEGIES
+from session_health import start_health_checker
+from storage import get_storage
+from metrics import incr
+
+load_dotenv()
+
+DEFAULT_SOCKET = "daemon.sock"
+
+def log_info(message):
+    print(f"[INFO] {message}")
+
+def log_error(message):
+    print(f"[ERROR] {message}")
+
+def socket_path():
+    return os.getenv("DAEMON_SOCKET", DEFAULT_SOCKET)
+
+def parse_request(line):
+    """Aceita um username puro ou um objeto JSON {"username": ..., "diskless": ...}"""
+    line = line.strip()
+    if line.startswith("{"):
+        request = json.loads(line)
+        if not isinstance(request, dict) or not request.get("username"):
+            raise ValueError("Pedido sem username")
+    else:
+        request = {"username": line}
+    request["username"] = str(request["username"]).strip().lstrip("@")
+    return request
+
+class ScrapeDaemon:
+    """Processo de longa duração que atende pedidos de coleta
+
+    Sessões do Instagram, cliente Minio e imports são preparados uma única
+    vez; cada pedido paga apenas o tempo de rede do perfil. Os pedidos de
+    todas as conexões dividem o mesmo pool de `workers` threads.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, session_strategy="round_robin", diskless=False):
+        self.diskless = diskless
+        self.pool = SessionPool(strategy=session_strategy)
+        self.health = start_health_checker(self.pool)
+        self.uploader = get_storage() if get_profile.UPLOAD_TO_MINIO else None
+        if self.uploader:
+            self.uploader.ensure_bucket()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="daemon")
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        log_info(f"Daemon pronto com {workers} workers e {len(self.pool.sessions)} sessões")
+
+    def scrape(self, request):
+        """Coleta um perfil, aguarda os uploads e retorna o resultado como dicionário
+
+        Pedidos simultâneos para o mesmo perfil (e modo) compartilham uma
+        única coleta: duas coletas paralelas gravariam os mesmos arquivos em
+        dados/<username>/.
+        """
+        diskless = request.get("diskless", self.diskless)
+        key = (request["username"].lower(), bool(diskless))
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            incr("daemon_pedidos_agrupados")
+            return dict(future.result(), username=request["username"])
+        try:
+            result = self._scrape(request["username"], diskless)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+
+    def _scrape(self, username, diskless):
+        start = time.monotonic()
+        try:
+            with self.pool.session() as loader:
+                uploads = save_instagram_data(username, loader=loader, uploader=self.uploader,
+                                              wait_upload=False, diskless=diskless)
+            wait(uploads)
+            errors = [f.exception() for f in uploads if f.exception() is not None]
+            if errors:
+                raise Exception(f"Falha no upload para Minio: {str(errors[0])}")
+            return {"username": username, "ok": True, "erro": None,
+                    "duracao": round(time.monotonic() - start, 3)}
+        except Exception as e:
+            return {"username": username, "ok": False, "erro": str(e),
+                    "duracao": round(time.monotonic() - start, 3)}
+
+    def serve_lines(self, lines, write):
+        """Processa cada linha de `lines` e chama `write` com uma linha JSON por resultado
+
+        Os resultados saem na ordem em que terminam; o campo username
+        identifica cada um. Retorna após o último resultado.
+        """
+        lock = threading.Lock()
+
+        def _reply(result):
+            with lock:
+                write(json.dumps(result, ensure_ascii=False) + "\n")
+
+        def _run(request):
+            # A resposta é escrita dentro da tarefa: quando `wait` retorna, tudo já foi enviado
+            result = self.scrape(request)
+            try:
+                _reply(result)
+            except OSError:
+                log_error(f"Resultado de @{result['username']} não entregue ao cliente")
+
+        futures = []
+        for line in lines:
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            try:
+                request = parse_request(line)
+            except ValueError as e:
+                _reply({"username": None, "ok": False, "erro": f"Pedido inválido: {str(e)}"})
+                continue
+            futures.append(self._executor.submit(_run, request))
+        wait(futures)
+
+    def close(self):
+        if self.health:
+            self.health.stop()
+        self._executor.shutdown(wait=True)
+        if self.uploader:
+            self.uploader.close()
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        lines = (raw.decode("utf-8", errors="replace") for raw in self.rfile)
+
+        def _write(text):
+            self.wfile.write(text.encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            self.server.scraper.serve_lines(lines, _write)
+        except (BrokenPipeError, ConnectionResetError):
+            log_error("Cliente desconectou antes de receber todos os resultados")
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def _remove_stale_socket(path):
+    """Remove o socket de um daemon que não está mais rodando"""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"Já existe um daemon atendendo em {path}")
+
+def serve_socket(daemon, path):
+    _remove_stale_socket(path)
+    server = _Server(path, _Handler)
+    server.scraper = daemon
+    os.chmod(path, 0o600)
+
+    def _shutdown(signum, frame):
+        log_info("Encerrando o daemon...")
+        # shutdown() bloqueia até o loop parar; não pode rodar na thread do loop
+        threading.Thread(target=server.shutdown).start()
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    log_info(f"Aguardando pedidos em {path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(path)
+
+def serve_stdin(daemon, out):
+    """Lê usernames da entrada padrão e escreve os resultados em `out`"""
+    def _write(text):
+        out.write(text)
+        out.flush()
+
+    daemon.serve_lines(sys.stdin, _write)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Daemon que mantém sessões e cliente Minio carregados e coleta perfis sob demanda')
+    parser.add_argument('--socket', type=str,
+                      help=f'Socket Unix (padrão: DAEMON_SOCKET ou {DEFAULT_SOCKET})')
+    parser.add_argument('--stdin', action='store_true',
+                      help='Lê os usernames da entrada padrão em vez do socket')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                      help=f'Perfis processados em paralelo (padrão: {DEFAULT_WORKERS})')
+    parser.add_argument('--diskless', action='store_true',
+                      help='Envia JSON e foto direto ao Minio, sem gravar em dados/')
+    parser.add_argument('--session-strategy', choices=STRATEGIES, default='round_robin',
+                      help='Rotação entre as contas de INSTAGRAM_USERNAMES')
+    args = parser.parse_args()
+
+    out = sys.stdout
+    if args.stdin:
+        # Logs vão para stderr, deixando stdout só com as linhas JSON
+        sys.stdout = sys.stderr
+    daemon = ScrapeDaemon(workers=max(1, args.workers), session_strategy=args.session_strategy,
+                          diskless=args.diskless)
+    try:
+        if args.stdin:
+            serve_stdin(daemon, out)
+        else:
+            serve_socket(daemon, args.socket or socket_path())
+    finally:
+        daemon.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import os
+import sys
+import json
+import socket
+import argparse
+import threading
+
+# Cliente leve do daemon.py: só usa a biblioteca padrão, sem importar
+# instaloader/minio, para não pagar o custo de inicialização a cada chamada.
+DEFAULT_SOCKET = "daemon.sock"
+
+def log_error(message):
+    print(f"[ERROR] {message}", file=sys.stderr)
+
+def read_lines(source):
+    if source == '-':
+        return sys.stdin.read().splitlines()
+    with open(source, encoding='utf-8') as f:
+        return f.read().splitlines()
+
+def request_profiles(usernames, path, diskless=False, timeout=None):
+    """Envia os usernames ao daemon e produz os resultados à medida que chegam"""
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(timeout)
+    conn.connect(path)
+
+    def _send():
+        with conn.makefile("w", encoding="utf-8") as f:
+            for username in usernames:
+                if diskless:
+                    f.write(json.dumps({"username": username, "diskless": True}) + "\n")
+                else:
+                    f.write(username + "\n")
+        conn.shutdown(socket.SHUT_WR)
+
+    # Envio em paralelo com a leitura: listas longas não travam nos buffers do socket
+    sender = threading.Thread(target=_send, daemon=True)
+    sender.start()
+    try:
+        with conn.makefile("r", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Envia perfis para o daemon.py e exibe os resultados')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--username', type=str,
+                      help='Nome de usuário do Instagram (com ou sem @)')
+    group.add_argument('--usernames-file', type=str,
+                      help="Arquivo com um username por linha ('-' para ler da entrada padrão)")
+    parser.add_argument('--socket', type=str,
+                      help=f'Socket Unix do daemon (padrão: DAEMON_SOCKET ou {DEFAULT_SOCKET})')
+    parser.add_argument('--diskless', action='store_true',
+                      help='Pede ao daemon o envio direto ao Minio, sem gravar em dados/')
+    parser.add_argument('--timeout', type=float,
+                      help='Tempo máximo (segundos) de espera por cada resultado')
+    args = parser.parse_args()
+
+    if args.username:
+        usernames = [args.username.lstrip('@')]
+    else:
+        usernames = [line.strip().lstrip('@') for line in read_lines(args.usernames_file)]
+        usernames = [u for u in dict.fromkeys(usernames) if u and not u.startswith('#')]
+
+    path = args.socket or os.getenv("DAEMON_SOCKET", DEFAULT_SOCKET)
+    failed = 0
+    try:
+        for result in request_profiles(usernames, path, args.diskless, args.timeout):
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+            failed += not result["ok"]
+    except (FileNotFoundError, ConnectionRefusedError):
+        log_error(f"Daemon não encontrado em {path}; inicie com: python daemon.py")
+        sys.exit(2)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+import os
+import time
+import random
+import threading
+from collections import deque, namedtuple
+from datetime import datetime
+
+import requests
+from instaloader.exceptions import (
+    ConnectionException,
+    PrivateProfileNotFollowedException,
+    ProfileNotExistsException,
+)
+
+from rate_limiter import get_rate_limiter, is_rate_limited
+from session_pool import is_blocking_error
+from profile_cache import get_profile_cache
+from metrics import incr
+
+# Classes de falha
+NOT_FOUND = "nao_encontrado"
+PRIVATE = "privado"
+RATE_LIMITED = "limitado"
+AUTH_EXPIRED = "sessao_expirada"
+TRANSIENT = "transitorio"
+
+# max_attempts: tentativas no total; base_delay/max_delay: backoff exponencial
+# (segundos); negative_ttl: por quanto tempo o perfil fica no cache negativo
+RetryPolicy = namedtuple("RetryPolicy", ("max_attempts", "base_delay", "max_delay", "negative_ttl"))
+
+POLICIES = {
+    # Não adianta tentar de novo; o perfil é pulado nas próximas execuções
+    NOT_FOUND: RetryPolicy(1, 0, 0, 7 * 24 * 60 * 60),
+    PRIVATE: RetryPolicy(1, 0, 0, 24 * 60 * 60),
+    # A espera vem do rate limiter (Retry-After / penalidade da conta)
+    RATE_LIMITED: RetryPolicy(3, 0, 0, None),
+    # Com a sessão inválida, repetir só gasta requisições; o pool troca de conta
+    AUTH_EXPIRED: RetryPolicy(1, 0, 0, None),
+    TRANSIENT: RetryPolicy(3, 1, 30, None),
+}
+
+# Falhas que indicam que o Instagram está recusando as contas/IPs como um todo
+TRIPPING = (RATE_LIMITED, AUTH_EXPIRED)
+
+# Circuit breaker: abre com THRESHOLD falhas em WINDOW segundos e pausa tudo
+# por COOLDOWN segundos (dobrando a cada reabertura, até MAX_COOLDOWN)
+DEFAULT_THRESHOLD = 5
+DEFAULT_WINDOW = 60
+DEFAULT_COOLDOWN = 5 * 60
+MAX_COOLDOWN = 60 * 60
+
+CLOSED = "fechado"
+OPEN = "aberto"
+HALF_OPEN = "meio_aberto"
+
+def log_info(message):
+    print(f"[INFO] {message}")
+
+def log_error(message):
+    print(f"[ERROR] {message}")
+
+class SkippedProfile(Exception):
+    """Perfil pulado por estar no cache negativo"""
+
+    def __init__(self, username, failure, error, expires_at):
+        self.username = username
+        self.failure = failure
+        until = datetime.fromtimestamp(expires_at).isoformat(timespec="minutes")
+        super().__init__(f"@{username} ignorado ({failure}, até {until}): {error}")
+
+def classify(exc):
+    """Classifica a exceção numa das classes de falha"""
+    if isinstance(exc, SkippedProfile):
+        return exc.failure
+    if isinstance(exc, ProfileNotExistsException):
+        return NOT_FOUND
+    if isinstance(exc, PrivateProfileNotFollowedException):
+        return PRIVATE
+    if is_rate_limited(exc):
+        return RATE_LIMITED
+    # 401, checkpoint/desafio e sessão deslogada, inclusive quando o Instaloader
+    # aborta com AbortDownloadException
+    if is_blocking_error(exc):
+        return AUTH_EXPIRED
+    return TRANSIENT
+
+def is_permanent(exc):
+    """Indica se a falha não se resolve tentando de novo (ex.: na fila de jobs)"""
+    return classify(exc) in (NOT_FOUND, PRIVATE)
+
+def backoff_delay(policy, attempt):
+    delay = min(policy.max_delay, policy.base_delay * 2 ** (attempt - 1))
+    return delay + random.uniform(0, policy.base_delay)
+
+class CircuitBreaker:
+    """Pausa todas as consultas quando o Instagram começa a recusar as contas
+
+    Fechado: tudo passa. Com `threshold` falhas de rate limit/sessão em
+    `window` segundos, abre e quem chama `wait` fica parado até o fim do
+    cooldown. Depois, meio aberto: uma única consulta de teste passa; se der
+    certo, fecha; se falhar, reabre com o dobro do cooldown.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, window=DEFAULT_WINDOW, cooldown=DEFAULT_COOLDOWN):
+        self.threshold = threshold
+        self.window = window
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.open_until = 0.0
+        self.opened = 0
+        self._failures = deque()
+        self._probing = False
+        self._cond = threading.Condition()
+
+    def _open(self, now):
+        self.state = OPEN
+        self.open_until = now + self.cooldown
+        self.opened += 1
+        self._failures.clear()
+        # Quem espera sem prazo (teste em andamento) precisa recalcular a espera
+        self._cond.notify_all()
+        incr("circuit_breaker", estado=OPEN)
+        log_error(f"Circuit breaker aberto: consultas pausadas por {self.cooldown:.0f}s")
+
+    def wait(self):
+        """Bloqueia enquanto o circuito estiver aberto (ou com teste em andamento)"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self.state == CLOSED:
+                    return
+                if self.state == OPEN and now >= self.open_until:
+                    self.state = HALF_OPEN
+                    self._probing = True
+                    log_info("Circuit breaker meio aberto: enviando consulta de teste")
+                    return
+                if self.state == HALF_OPEN and not self._probing:
+                    # O teste anterior terminou sem resultado registrado
+                    self._probing = True
+                    return
+                timeout = self.open_until - now if self.state == OPEN else None
+                self._cond.wait(timeout)
+
+    def record_success(self):
+        with self._cond:
+            if self.state == HALF_OPEN:
+                self.state = CLOSED
+                self.cooldown = self.base_cooldown
+                self._probing = False
+                incr("circuit_breaker", estado=CLOSED)
+                log_info("Circuit breaker fechado: consultas retomadas")
+                self._cond.notify_all()
+
+    def record_failure(self, failure):
+        """Registra a falha; só as de rate limit/sessão contam para abrir o circuito"""
+        if failure not in TRIPPING:
+            # O Instagram respondeu normalmente (ex.: perfil inexistente)
+            self.record_success()
+            return
+        with self._cond:
+            now = time.monotonic()
+            if self.state == HALF_OPEN:
+                self._probing = False
+                self.cooldown = min(MAX_COOLDOWN, self.cooldown * 2)
+                self._open(now)
+                return
+            if self.state == OPEN:
+                return
+            self._failures.append(now)
+            while self._failures and self._failures[0] < now - self.window:
+                self._failures.popleft()
+            if len(self._failures) >= self.threshold:
+                self._open(now)
+
+    def release(self):
+        """Libera o teste do estado meio aberto sem resultado (ex.: erro local)"""
+        with self._cond:
+            if self.state == HALF_OPEN and self._probing:
+                self._probing = False
+                self._cond.notify_all()
+
+    def status(self):
+        with self._cond:
+            return {
+                "estado": self.state,
+                "reabre_em": max(0.0, self.open_until - time.monotonic()) if self.state == OPEN else 0.0,
+                "aberturas": self.opened,
+            }
+
+def check_negative(username):
+    """Levanta SkippedProfile se o perfil está no cache negativo"""
+    entry = get_profile_cache().get_negative(username)
+    if entry is not None:
+        incr("perfis_ignorados", motivo=entry[0])
+        raise SkippedProfile(username, *entry)
+
+def remember_failure(username, exc):
+    """Grava o perfil no cache negativo se a falha tiver TTL na política"""
+    failure = classify(exc)
+    ttl = negative_ttl(failure)
+    if ttl:
+        get_profile_cache().put_negative(username, failure, str(exc), ttl)
+        log_info(f"@{username} no cache negativo ({failure}) por {ttl / 3600:.0f}h")
+
+def negative_ttl(failure):
+    """TTL do cache negativo da classe (NEGATIVE_TTL_<CLASSE> no .env; 0 desliga)"""
+    value = os.getenv(f"NEGATIVE_TTL_{failure.upper()}")
+    return float(value) if value is not None else POLICIES[failure].negative_ttl
+
+def call_with_policy(fn, operation="perfil", account=None, endpoint="iphone", max_attempts=None):
+    """Executa `fn()` com a política de retry da classe de cada falha
+
+    Passa pelo circuit breaker antes de cada tentativa. `max_attempts`
+    limita as tentativas das classes que admitem retry.
+    """
+    breaker = get_circuit_breaker()
+    attempt = 0
+    while True:
+        breaker.wait()
+        attempt += 1
+        try:
+            result = fn()
+        except Exception as e:
+            failure = classify(e)
+            if failure == TRANSIENT and not isinstance(
+                    e, (ConnectionException, requests.exceptions.RequestException, OSError)):
+                # Erro local (parse, bug): não diz nada sobre o Instagram
+                breaker.release()
+            else:
+                breaker.record_failure(failure)
+            policy = POLICIES[failure]
+            limit = policy.max_attempts if max_attempts is None else min(max_attempts,
+                                                                          policy.max_attempts)
+            if attempt >= limit:
+                raise
+            incr("retries", operacao=operation, motivo=failure)
+            if failure == RATE_LIMITED:
+                log_info(f"Tentativa {attempt} limitada pelo Instagram (429)")
+                get_rate_limiter().wait_until_ready(account, endpoint)
+            else:
+                delay = backoff_delay(policy, attempt)
+                log_info(f"Tentativa {attempt} falhou ({failure}). Aguardando {delay:.1f}s...")
+                time.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+
+_default_breaker = None
+_default_breaker_lock = threading.Lock()
+
+def get_circuit_breaker():
+    """Retorna o circuit breaker do processo (CIRCUIT_THRESHOLD/WINDOW/COOLDOWN no .env)"""
+    global _default_breaker
+    with _default_breaker_lock:
+        if _default_breaker is None:
+            _default_breaker = CircuitBreaker(
+                threshold=int(os.getenv("CIRCUIT_THRESHOLD", DEFAULT_THRESHOLD)),
+                window=float(os.getenv("CIRCUIT_WINDOW", DEFAULT_WINDOW)),
+                cooldown=float(os.getenv("CIRCUIT_COOLDOWN", DEFAULT_COOLDOWN)))
+        return _default_breaker
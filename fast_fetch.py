@@ -0,0 +1,180 @@
+import threading
+import weakref
+
+import requests
+import instaloader
+from instaloader.exceptions import (
+    ConnectionException,
+    LoginRequiredException,
+    ProfileNotExistsException,
+    QueryReturnedNotFoundException,
+    TooManyRequestsException,
+)
+
+from rate_limiter import get_rate_limiter, retry_after_seconds
+from metrics import incr
+
+PROFILE_INFO_URL = "https://i.instagram.com/api/v1/users/web_profile_info/"
+
+# Timeout (conexão, leitura) das consultas de perfil
+REQUEST_TIMEOUT = (10, 30)
+
+# Headers da versão desktop que o Instaloader também remove nas consultas do iPhone
+DESKTOP_HEADERS = ("Host", "Origin", "X-Instagram-AJAX", "X-Requested-With", "Referer")
+
+# Headers da API do iPhone preenchidos a partir dos cookies da sessão
+HEADER_COOKIES = {"x-mid": "mid", "ig-u-ds-user-id": "ds_user_id", "x-ig-device-id": "ig_did",
+                  "x-ig-family-device-id": "ig_did", "family_device_id": "ig_did"}
+
+def log_info(message):
+    print(f"[INFO] {message}")
+
+def log_error(message):
+    print(f"[ERROR] {message}")
+
+class SchemaChanged(Exception):
+    """A resposta do Instagram não tem o formato esperado"""
+
+class EndpointRejected(Exception):
+    """web_profile_info recusou a consulta (400/401)
+
+    O endpoint recusa pedidos que o Instaloader faz por outro caminho; não
+    indica problema na sessão, então não herda das exceções do Instaloader
+    que tiram a conta de rotação.
+    """
+
+class ProfileRecord:
+    """Campos do perfil usados pela coleta, com os nomes de instaloader.Profile"""
+
+    __slots__ = ("userid", "username", "full_name", "biography", "mediacount", "followers",
+                 "followees", "is_private", "is_verified", "profile_pic_url")
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields[name])
+
+def parse_user(user):
+    """Extrai do nó `user` de web_profile_info apenas os campos guardados"""
+    try:
+        return ProfileRecord(
+            userid=int(user["id"]),
+            username=user["username"].lower(),
+            full_name=user["full_name"],
+            biography=user["biography"],
+            mediacount=int(user["edge_owner_to_timeline_media"]["count"]),
+            followers=int(user["edge_followed_by"]["count"]),
+            followees=int(user["edge_follow"]["count"]),
+            is_private=bool(user["is_private"]),
+            is_verified=bool(user["is_verified"]),
+            profile_pic_url=user.get("profile_pic_url_hd") or user["profile_pic_url"],
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        raise SchemaChanged(f"Campo ausente ou inválido em web_profile_info: {str(e)}") from e
+
+class FastProfileClient:
+    """Consulta direta ao endpoint web_profile_info, sem instaloader.Profile
+
+    Usa uma única requests.Session por sessão do Instaloader, com os mesmos
+    cookies e headers da API do iPhone e os adapters (proxies) do contexto,
+    de modo que as consultas reaproveitam as conexões keep-alive em vez de
+    copiar a sessão a cada perfil. Passa pelo mesmo rate limiter da conta.
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self.source = context._session
+        self.session = requests.Session()
+        # O cookie jar é compartilhado: cookies renovados valem para os dois lados
+        self.session.cookies = self.source.cookies
+        self.session.headers.update(self.source.headers)
+        for header in DESKTOP_HEADERS:
+            self.session.headers.pop(header, None)
+        self.session.headers.update(context.iphone_headers)
+        self.session.headers["ig-intended-user-id"] = str(context.user_id)
+        cookies = self.source.cookies.get_dict()
+        for header, cookie in HEADER_COOKIES.items():
+            if cookie in cookies:
+                self.session.headers.setdefault(header, cookies[cookie])
+        if "rur" in cookies:
+            self.session.headers.setdefault(
+                "ig-u-rur", cookies["rur"].strip('"').encode("utf-8").decode("unicode_escape"))
+        extra_adapters = getattr(context, "extra_adapters", {})
+        for prefix, adapter in extra_adapters.items():
+            self.session.mount(prefix, adapter)
+        if not extra_adapters:
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=16)
+            self.session.mount("https://", adapter)
+
+    def _raise_for_status(self, response, username):
+        status = response.status_code
+        if status == 429:
+            get_rate_limiter().throttle(self.context.username, "iphone",
+                                        retry_after_seconds(response))
+            raise TooManyRequestsException(f"429 Too Many Requests em web_profile_info ({username})")
+        if response.is_redirect and "/accounts/login" in response.headers.get("location", ""):
+            raise LoginRequiredException("Redirecionado para o login; a sessão expirou")
+        if status in (400, 401):
+            raise EndpointRejected(f"HTTP {status} em web_profile_info ({username}): "
+                                   f"{response.text[:200]}")
+        if status == 404:
+            raise QueryReturnedNotFoundException(f"404 Not Found em web_profile_info ({username})")
+        if status != 200:
+            raise ConnectionException(f"HTTP {status} em web_profile_info ({username})")
+
+    def fetch(self, username):
+        """Retorna o ProfileRecord do perfil (SchemaChanged se a resposta mudou de formato)"""
+        get_rate_limiter().acquire(self.context.username, "iphone")
+        try:
+            response = self.session.get(PROFILE_INFO_URL, params={"username": username},
+                                        timeout=REQUEST_TIMEOUT, allow_redirects=False)
+        except requests.exceptions.RequestException as e:
+            raise ConnectionException(f"Erro de conexão em web_profile_info: {str(e)}") from e
+        with response:
+            self._raise_for_status(response, username)
+            # Mesmo tratamento do Instaloader para os headers ig-set-* da API do iPhone
+            for key, value in response.headers.items():
+                key = key.lower()
+                if key.startswith("ig-set-"):
+                    key = key.replace("ig-set-", "")
+                elif key.startswith("x-ig-set-"):
+                    key = key.replace("x-ig-set-", "x-ig-")
+                else:
+                    continue
+                self.context.iphone_headers[key] = value
+                self.session.headers[key] = value
+            try:
+                data = response.json()
+            except ValueError as e:
+                raise SchemaChanged("Resposta de web_profile_info não é JSON") from e
+        if not isinstance(data, dict) or not isinstance(data.get("data"), dict):
+            raise SchemaChanged("Resposta de web_profile_info sem o campo data")
+        user = data["data"].get("user", ...)
+        if user is ...:
+            raise SchemaChanged("Resposta de web_profile_info sem o campo data.user")
+        if user is None:
+            raise ProfileNotExistsException(f"Profile {username} does not exist.")
+        return parse_user(user)
+
+_clients = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+def client_for(context):
+    """Retorna o cliente da sessão do contexto (recriado se a sessão foi recarregada)"""
+    with _clients_lock:
+        client = _clients.get(context)
+        if client is None or client.source is not context._session:
+            client = _clients[context] = FastProfileClient(context)
+        return client
+
+def fetch_profile_fast(context, username):
+    """Obtém o perfil pelo cliente direto, caindo para o Instaloader se o formato mudou
+
+    400/401 (endpoint recusou) e 404 também são repassados ao Instaloader,
+    que consulta por outro caminho e confirma se o perfil de fato não existe.
+    """
+    try:
+        return client_for(context).fetch(username.lower())
+    except (SchemaChanged, EndpointRejected, QueryReturnedNotFoundException) as e:
+        incr("fast_fetch_fallback", motivo=type(e).__name__)
+        log_error(f"Consulta direta de @{username} falhou ({str(e)}); usando o Instaloader")
+        return instaloader.Profile.from_username(context, username)
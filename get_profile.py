@@ -2,65 +2,88 @@ import os
 import sys
 import json
 import shutil
+import signal
 import argparse
 from pathlib import Path
 from datetime import datetime
 from urllib.parse import urlparse
 import time
-import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import instaloader
-from minio import Minio
-from minio.error import S3Error
 from dotenv import load_dotenv
 
+from session_pool import SessionPool, STRATEGIES, session_file_for
+from minio_uploader import get_uploader
+from storage import get_storage
+from profile_cache import get_profile_cache
+from rate_limiter import TokenBucketRateController, get_rate_limiter
+from failures import call_with_policy, check_negative, remember_failure
+from fast_fetch import fetch_profile_fast
+from metrics import get_metrics, run_context, span, incr
+from snapshots import get_snapshot_store
+from proxy_pool import attach_proxy_pool
+from cdn_client import open_picture
+from image_variants import upload_variants, save_variants
+from media_store import get_media_store
+from batch_output import open_batch_writer, COMPRESSIONS
+
 # Carrega variáveis de ambiente
 load_dotenv()
 
-# Controle de upload para Minio
+# Controle de upload para Minio (ou para o destino de STORAGE_SINK, ver storage.py)
 UPLOAD_TO_MINIO = True
 
+# Controle do cache local de perfis (TTL em PROFILE_CACHE_TTL)
+USE_PROFILE_CACHE = True
+
+# Consulta direta ao web_profile_info (fast_fetch.py) em vez de instaloader.Profile;
+# opcional (FAST_FETCH no .env ou --fast-fetch), pois o endpoint não é oficial
+USE_FAST_FETCH = os.getenv("FAST_FETCH", "").lower() in ("1", "true", "sim")
+
+# Histórico de snapshots (snapshots.py): mantém dados/<user>/ entre execuções
+# e só baixa/envia a foto de perfil quando ela muda
+SAVE_HISTORY = True
+
+PICTURE_FILE = "profile_pic.jpg"
+
+# Envio de um profile_info.json por perfil ao Minio; no modo --batch-output os
+# registros também vão para as partes NDJSON do lote (batch_output.py)
+UPLOAD_PROFILE_JSON = True
+
+# Store de mídias endereçado pelo conteúdo (media_store.py): as fotos em
+# dados/<user>/ são hardlinks para blobs compartilhados entre perfis e execuções
+USE_MEDIA_STORE = True
+
+# Miniaturas WebP/AVIF da foto (image_variants.py), geradas num pool de processos
+MAKE_VARIANTS = False
+
+# Número padrão de workers no modo em lote
+DEFAULT_WORKERS = 4
+
 def log_info(message):
     print(f"[INFO] {message}")
 
 def log_error(message):
     print(f"[ERROR] {message}")
 
-def setup_directory(username):
-    """Cria e retorna o diretório para o usuário"""
+def setup_directory(username, clean=True):
+    """Cria e retorna o diretório para o usuário
+
+    Com `clean=False` o conteúdo de uma execução anterior é mantido.
+    """
     base_dir = Path("dados")
     base_dir.mkdir(exist_ok=True)
     log_info("Diretório base 'dados' verificado")
     
     user_dir = base_dir / username
-    if user_dir.exists():
+    if clean and user_dir.exists():
         shutil.rmtree(user_dir)
-    user_dir.mkdir()
-    log_info(f"Diretório limpo criado em: {user_dir}")
+    user_dir.mkdir(exist_ok=True)
+    log_info(f"Diretório {'limpo ' if clean else ''}criado em: {user_dir}")
     
     return user_dir
 
-def get_minio_client():
-    """Configura e retorna o cliente Minio"""
-    try:
-        with open('auth/credentials.json') as f:
-            credentials = json.load(f)
-        
-        endpoint = "s3.supercaso.com.br"
-        log_info(f"Configurando Minio com endpoint: {endpoint}")
-        
-        client = Minio(
-            endpoint,
-            access_key=credentials["accessKey"],
-            secret_key=credentials["secretKey"],
-            secure=True
-        )
-        log_info("Cliente Minio configurado com sucesso")
-        return client
-    except Exception as e:
-        log_error(f"Erro ao configurar cliente Minio: {str(e)}")
-        raise
-
 def get_instagram_session():
     """Carrega e retorna uma sessão do Instagram"""
     try:
@@ -68,143 +91,474 @@ def get_instagram_session():
         if not username:
             raise ValueError("INSTAGRAM_USERNAME não configurado no .env")
             
-        L = instaloader.Instaloader()
-        L.load_session_from_file(username)
+        with span("sessao"):
+            L = instaloader.Instaloader(rate_controller=TokenBucketRateController)
+            L.load_session_from_file(username, session_file_for(username))
+            attach_proxy_pool(L)
         log_info("Sessão do Instagram carregada com sucesso")
         return L
     except Exception as e:
         log_error(f"Erro ao carregar sessão: {str(e)}")
         return None
 
-def get_profile_with_retry(context, username, max_retries=3):
-    """Obtém perfil do Instagram com sistema de retry"""
-    for attempt in range(max_retries):
+def get_profile_with_retry(context, username, max_retries=3, fast=False):
+    """Obtém perfil do Instagram com a política de retry de failures.py
+
+    Perfil inexistente ou privado falha na hora; em caso de 429, espera
+    apenas o necessário segundo o rate limiter da conta; nos erros de rede
+    usa backoff exponencial. Com `fast`, usa a consulta direta de
+    fast_fetch.py, que retorna só os campos salvos (sem posts).
+    """
+    def _fetch():
+        if fast:
+            profile = fetch_profile_fast(context, username)
+        else:
+            profile = instaloader.Profile.from_username(context, username)
+        get_rate_limiter().success(context.username, "iphone")
+        return profile
+
+    return call_with_policy(_fetch, operation="perfil", account=context.username,
+                            endpoint="iphone", max_attempts=max_retries)
+
+def fetch_profile(context, username):
+    """Obtém o perfil do cache local ou, se ausente/expirado, do Instagram
+
+    Com o cache ativo, perfis do cache negativo (inexistentes/privados) são
+    pulados sem consultar o Instagram.
+    """
+    with span("perfil"):
+        if not USE_PROFILE_CACHE:
+            return get_profile_with_retry(context, username, fast=USE_FAST_FETCH)
+        check_negative(username)
         try:
-            return instaloader.Profile.from_username(context, username)
+            return get_profile_cache().get_or_fetch(
+                username, lambda: get_profile_with_retry(context, username, fast=USE_FAST_FETCH))
         except Exception as e:
-            if attempt == max_retries - 1:
-                raise
-            delay = (2 ** attempt) + random.uniform(1, 3)
-            log_info(f"Tentativa {attempt + 1} falhou. Aguardando {delay:.1f}s...")
-            time.sleep(delay)
-
-def upload_to_minio(user_dir: Path):
-    """Realiza upload dos arquivos para o Minio"""
+            remember_failure(username, e)
+            raise
+
+def download_picture(url, path: Path):
+    """Baixa a foto de perfil direto para o caminho informado
+
+    Com USE_MEDIA_STORE, `path` vira um hardlink para o blob do conteúdo no
+    store de mídias; uma foto já conhecida não é gravada de novo.
+    """
+    tmp_path = path.with_suffix(".temp")
+    with span("foto"):
+        with open_picture(url) as response:
+            response.raw.decode_content = True
+            if USE_MEDIA_STORE:
+                get_media_store().save_stream(response.raw, path)
+            else:
+                with open(tmp_path, 'wb') as f:
+                    shutil.copyfileobj(response.raw, f)
+        if not USE_MEDIA_STORE:
+            os.replace(tmp_path, path)
+    incr("bytes", path.stat().st_size, direcao="download")
+
+def upload_to_minio(user_dir: Path, uploader=None, names=None):
+    """Realiza upload dos arquivos para o Minio (apenas `names`, se informado)"""
     try:
-        client = get_minio_client()
-        bucket_name = os.getenv("BUCKET_NAME")
-        
-        if not bucket_name:
-            raise ValueError("BUCKET_NAME não encontrado no .env")
-        
-        if not client.bucket_exists(bucket_name):
-            client.make_bucket(bucket_name)
-            log_info(f"Bucket '{bucket_name}' criado")
-        
-        for file_path in user_dir.glob('*'):
-            file_name = file_path.name
-            object_name = f"{user_dir.name}/{file_name}"
-            content_type = 'image/jpeg' if file_name.endswith('.jpg') else 'application/json'
-            
-            try:
-                client.remove_object(bucket_name, object_name)
-                log_info(f"Objeto existente removido: {object_name}")
-            except:
-                pass
-            
-            log_info(f"Iniciando upload de {file_name}")
-            client.fput_object(bucket_name, object_name, str(file_path), content_type=content_type)
-            log_info(f"Upload concluído: {object_name}")
-        
-        return True
+        if uploader is None:
+            uploader = get_storage()
+        with span("upload_diretorio", diretorio=user_dir.name):
+            return uploader.upload_directory(user_dir, names)
         
     except Exception as e:
         log_error(f"Erro no upload para Minio: {str(e)}")
         return False
 
-def save_instagram_data(username):
-    """Coleta e salva dados do Instagram"""
+def upload_picture_with_variants(username, pic_url, uploader):
+    """Baixa a foto para a memória e envia a original e as variantes (modo sem disco)"""
+    with span("foto"), open_picture(pic_url) as response:
+        data = response.content
+    incr("bytes", len(data), direcao="download")
+    uploader.upload_bytes(f"{username}/{PICTURE_FILE}", data, 'image/jpeg')
+    upload_variants(username, data, uploader)
+    return True
+
+def build_profile_info(username, profile):
+    """Monta o dicionário salvo em profile_info.json"""
+    return {
+        "username": username,
+        "full_name": profile.full_name,
+        "biography": profile.biography,
+        "mediacount": profile.mediacount,
+        "followers": profile.followers,
+        "following": profile.followees,
+        "is_private": profile.is_private,
+        "is_verified": profile.is_verified,
+        "profile_pic_url": profile.profile_pic_url,
+        "data_criacao": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+def record_snapshot(username, profile_info, from_cache=False):
+    """Anexa o snapshot ao histórico e indica se a foto de perfil mudou
+
+    Perfis vindos do cache já foram registrados quando foram consultados;
+    nesse caso só é verificado se a foto ainda precisa ser enviada.
+    """
+    if not SAVE_HISTORY:
+        return True
     try:
-        user_dir = setup_directory(username)
+        with span("historico"):
+            store = get_snapshot_store()
+            if from_cache:
+                return store.picture_changed(username, profile_info["profile_pic_url"])
+            return store.record(username, profile_info)
+    except Exception as e:
+        log_error(f"Erro ao gravar histórico de @{username}: {str(e)}")
+        return True
+
+def mark_picture(username, pic_url, future=None):
+    """Registra a foto no histórico após o download/upload (ou quando `future` concluir)"""
+    if not SAVE_HISTORY:
+        return
+    if future is not None:
+        def _done(f):
+            if not f.cancelled() and f.exception() is None:
+                mark_picture(username, pic_url)
+        future.add_done_callback(_done)
+        return
+    try:
+        get_snapshot_store().mark_picture(username, pic_url)
+    except Exception as e:
+        log_error(f"Erro ao gravar histórico de @{username}: {str(e)}")
+
+def print_profile_info(profile_info):
+    print("\nInformações do perfil:")
+    for key, value in profile_info.items():
+        print(f"{key}: {value}")
+
+def save_instagram_data_diskless(username, loader, uploader=None, wait_upload=True, batch=None):
+    """Coleta os dados e envia direto ao Minio, sem gravar em disco
+
+    O JSON é enviado da memória e a foto é repassada do CDN para o
+    `put_object` em stream.
+    """
+    profile = fetch_profile(loader.context, username)
+    log_info("Dados do perfil obtidos com sucesso")
+    profile_info = build_profile_info(username, profile)
+    print_profile_info(profile_info)
+    if batch:
+        batch.add(profile_info)
+    
+    uploader = uploader or get_storage()
+    pic_url = profile_info["profile_pic_url"]
+    upload_futures = []
+    if UPLOAD_PROFILE_JSON:
+        json_data = json.dumps(profile_info, indent=4, ensure_ascii=False).encode('utf-8')
+        upload_futures.append(uploader.submit_bytes(
+            f"{username}/profile_info.json", json_data, 'application/json'))
+    if record_snapshot(username, profile_info, getattr(profile, "from_cache", False)):
+        if MAKE_VARIANTS:
+            # As variantes precisam da foto inteira; sem elas, a foto segue em stream
+            upload_futures.append(uploader.submit_task(
+                upload_picture_with_variants, username, pic_url, uploader))
+        else:
+            upload_futures.append(uploader.submit_stream(
+                f"{username}/{PICTURE_FILE}", lambda: open_picture(pic_url), 'image/jpeg'))
+        mark_picture(username, pic_url, upload_futures[-1])
+    else:
+        log_info("Foto de perfil sem alterações; envio ignorado")
+    if not wait_upload:
+        log_info(f"Upload para Minio agendado ({len(upload_futures)} arquivos)")
+        return upload_futures
+    
+    errors = [f.exception() for f in upload_futures if f.exception() is not None]
+    if errors:
+        raise Exception(f"Falha no upload para Minio: {str(errors[0])}")
+    log_info(f"Processo concluído. Dados enviados para {username}/ no Minio")
+    return []
+
+def save_instagram_data(username, loader=None, uploader=None, wait_upload=True, diskless=False,
+                        batch=None):
+    """Coleta e salva dados do Instagram
+
+    Se `loader` for informado, reutiliza a sessão já carregada (modo em lote).
+    Com `wait_upload=False` o upload fica em segundo plano no `uploader` e a
+    função retorna os Futures dos arquivos enviados. Com `diskless=True` nada
+    é gravado em dados/ (ver save_instagram_data_diskless). Com `batch` (um
+    BatchWriter), o registro do perfil também é adicionado ao lote.
+
+    Cada fase é medida por um span (ver metrics.py) marcado com o run_id do perfil.
+    """
+    with run_context(username), span("total", diskless=diskless):
+        return _save_instagram_data(username, loader, uploader, wait_upload, diskless, batch)
+
+def _save_instagram_data(username, loader, uploader, wait_upload, diskless, batch):
+    try:
+        if diskless and not UPLOAD_TO_MINIO:
+            raise ValueError("O modo sem disco exige UPLOAD_TO_MINIO habilitado")
         
         # Carrega sessão do Instagram
-        loader = get_instagram_session()
-        if not loader:
-            raise Exception("Não foi possível carregar a sessão do Instagram")
+        if loader is None:
+            loader = get_instagram_session()
+            if not loader:
+                raise Exception("Não foi possível carregar a sessão do Instagram")
+        
+        if diskless:
+            return save_instagram_data_diskless(username, loader, uploader, wait_upload, batch)
         
-        # Configura o Instaloader para usar o diretório correto
-        loader.dirname_pattern = str(user_dir)
-        loader.download_pictures = True
-        loader.download_videos = False
-        loader.download_video_thumbnails = False
-        loader.download_geotags = False
-        loader.download_comments = False
-        loader.save_metadata = False
+        user_dir = setup_directory(username, clean=not (SAVE_HISTORY or USE_MEDIA_STORE))
         
-        # Obtém o perfil com retry
-        profile = get_profile_with_retry(loader.context, username)
+        # Obtém o perfil (cache local ou Instagram, com retry)
+        profile = fetch_profile(loader.context, username)
         log_info("Dados do perfil obtidos com sucesso")
         
         # Prepara informações
-        profile_info = {
-            "username": username,
-            "full_name": profile.full_name,
-            "biography": profile.biography,
-            "mediacount": profile.mediacount,
-            "followers": profile.followers,
-            "following": profile.followees,
-            "is_private": profile.is_private,
-            "is_verified": profile.is_verified,
-            "profile_pic_url": profile.profile_pic_url,
-            "data_criacao": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
+        profile_info = build_profile_info(username, profile)
         
         # Salva JSON
         json_path = user_dir / "profile_info.json"
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(profile_info, f, indent=4, ensure_ascii=False)
+        tmp_path = json_path.with_suffix(".temp")
+        with span("json"):
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(profile_info, f, indent=4, ensure_ascii=False)
+            os.replace(tmp_path, json_path)
         log_info(f"Arquivo JSON criado: {json_path}")
+        if batch:
+            batch.add(profile_info)
         
-        # Download da foto
-        log_info("Baixando foto de perfil...")
-        loader.download_profilepic(profile)
-        
-        # Renomeia a foto
-        for file in os.listdir(user_dir):
-            if file.endswith('_profile_pic.jpg'):
-                old_path = user_dir / file
-                new_path = user_dir / "profile_pic.jpg"
-                os.rename(old_path, new_path)
-                log_info("Foto de perfil renomeada para profile_pic.jpg")
-                break
+        # Download da foto (só se mudou desde a última coleta)
+        pic_url = profile_info["profile_pic_url"]
+        pic_path = user_dir / PICTURE_FILE
+        files = ["profile_info.json"] if UPLOAD_PROFILE_JSON else []
+        from_cache = getattr(profile, "from_cache", False)
+        if record_snapshot(username, profile_info, from_cache) or not pic_path.exists():
+            log_info("Baixando foto de perfil...")
+            download_picture(pic_url, pic_path)
+            log_info(f"Foto de perfil salva em {PICTURE_FILE}")
+            files.append(PICTURE_FILE)
+        else:
+            log_info("Foto de perfil sem alterações; download ignorado")
         
         # Exibe informações
-        print("\nInformações do perfil:")
-        for key, value in profile_info.items():
-            print(f"{key}: {value}")
+        print_profile_info(profile_info)
         
         # Upload para Minio
-        if UPLOAD_TO_MINIO:
+        upload_futures = []
+        variants = MAKE_VARIANTS and PICTURE_FILE in files
+        if UPLOAD_TO_MINIO and not wait_upload:
+            uploader = uploader or get_storage()
+            upload_futures = uploader.submit_directory(user_dir, files)
+            if PICTURE_FILE in files:
+                mark_picture(username, pic_url, upload_futures[files.index(PICTURE_FILE)])
+            if variants:
+                upload_futures.append(uploader.submit_task(
+                    upload_variants, username, pic_path.read_bytes(), uploader))
+            log_info(f"Upload para Minio agendado ({len(upload_futures)} arquivos)")
+        elif UPLOAD_TO_MINIO:
             log_info("Iniciando upload para Minio...")
-            if upload_to_minio(user_dir):
+            if upload_to_minio(user_dir, uploader, files):
                 log_info("Upload para Minio concluído com sucesso")
+                if PICTURE_FILE in files:
+                    mark_picture(username, pic_url)
+                if variants:
+                    upload_variants(username, pic_path.read_bytes(), uploader or get_storage())
             else:
                 log_error("Falha no upload para Minio")
+        else:
+            if variants:
+                save_variants(user_dir, pic_path.read_bytes(),
+                              store=get_media_store() if USE_MEDIA_STORE else None)
+            if PICTURE_FILE in files:
+                mark_picture(username, pic_url)
         
         log_info(f"Processo concluído. Dados salvos em dados/{username}/")
+        return upload_futures
         
     except Exception as e:
         log_error(f"Erro ao processar perfil de @{username}: {str(e)}")
         raise
 
+def read_usernames(source):
+    """Lê usernames (um por linha) de um arquivo ou da entrada padrão ('-')"""
+    if source == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    
+    usernames = []
+    seen = set()
+    for line in lines:
+        username = line.strip().lstrip('@')
+        if not username or username.startswith('#') or username in seen:
+            continue
+        seen.add(username)
+        usernames.append(username)
+    return usernames
+
+def _process_profile(username, pool, uploader, diskless=False, batch=None):
+    """Processa um perfil no modo em lote e retorna o resultado
+
+    O upload continua em segundo plano; os Futures ficam no resultado para
+    serem conferidos ao final do lote.
+    """
+    start = time.monotonic()
+    try:
+        with pool.session() as loader:
+            uploads = save_instagram_data(username, loader=loader, uploader=uploader,
+                                          wait_upload=False, diskless=diskless, batch=batch)
+        return {"username": username, "ok": True, "erro": None,
+                "duracao": time.monotonic() - start, "uploads": uploads}
+    except Exception as e:
+        return {"username": username, "ok": False, "erro": str(e),
+                "duracao": time.monotonic() - start, "uploads": []}
+
+def log_profile_cache_stats():
+    stats = get_profile_cache().stats()
+    log_info(f"Cache de perfis: {stats['hits']} hits, {stats['misses']} misses "
+             f"({stats['taxa_acerto']:.0%}), {stats['entradas']} entradas, "
+             f"{stats['negativos']} no cache negativo")
+
+def print_batch_summary(results):
+    """Exibe o resumo de sucesso/falha por perfil"""
+    ok = [r for r in results if r["ok"]]
+    failed = [r for r in results if not r["ok"]]
+    
+    print("\nResumo do lote:")
+    for r in results:
+        status = "OK" if r["ok"] else f"FALHA ({r['erro']})"
+        print(f"@{r['username']}: {status} [{r['duracao']:.1f}s]")
+    print(f"\nTotal: {len(results)} | Sucesso: {len(ok)} | Falha: {len(failed)}")
+
+def run_batch(usernames, workers=DEFAULT_WORKERS, session_strategy="round_robin", diskless=False,
+              batch_output=False, batch_compression=None):
+    """Processa vários perfis com um pool limitado de workers
+
+    As sessões do Instagram (uma por conta em INSTAGRAM_USERNAMES) e o
+    uploader do Minio são criados uma única vez e compartilhados por todos os
+    perfis do lote. Os uploads acontecem em paralelo com a coleta. Com
+    `batch_output`, os registros de todos os perfis vão para partes NDJSON
+    comprimidas com um manifesto (ver batch_output.py).
+    """
+    pool = SessionPool(strategy=session_strategy)
+    uploader = get_storage() if UPLOAD_TO_MINIO else None
+    batch = open_batch_writer(uploader, batch_compression) if batch_output else None
+    
+    log_info(f"Processando {len(usernames)} perfis com {workers} workers "
+             f"e {len(pool.sessions)} sessões")
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_process_profile, username, pool, uploader, diskless, batch)
+                   for username in usernames]
+        try:
+            for future in as_completed(futures):
+                results.append(future.result())
+        except BaseException:
+            # Interrompido (SIGTERM/Ctrl+C): só termina os perfis em andamento
+            for future in futures:
+                future.cancel()
+            raise
+    
+    if batch:
+        batch.close()
+    if uploader:
+        log_info("Aguardando uploads pendentes...")
+        uploader.flush()
+        uploader.report()
+    if USE_PROFILE_CACHE:
+        log_profile_cache_stats()
+    log_info(f"Tempo total em espera por rate limit: {get_rate_limiter().total_wait():.1f}s")
+    for r in results:
+        errors = [f.exception() for f in r.pop("uploads") if f.exception() is not None]
+        if errors and r["ok"]:
+            r["ok"] = False
+            r["erro"] = f"Falha no upload para Minio: {str(errors[0])}"
+    
+    order = {username: i for i, username in enumerate(usernames)}
+    results.sort(key=lambda r: order[r["username"]])
+    print_batch_summary(results)
+    return results
+
 def main():
     parser = argparse.ArgumentParser(description='Obtém informações de um perfil do Instagram')
-    parser.add_argument('--username', type=str, required=True, 
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--username', type=str,
                       help='Nome de usuário do Instagram (com ou sem @)')
+    group.add_argument('--usernames-file', type=str,
+                      help="Arquivo com um username por linha ('-' para ler da entrada padrão)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                      help=f'Número de perfis processados em paralelo no modo em lote (padrão: {DEFAULT_WORKERS})')
+    parser.add_argument('--incremental', action='store_true',
+                      help='Envia ao Minio apenas os arquivos cujo conteúdo mudou')
+    parser.add_argument('--diskless', action='store_true',
+                      help='Envia JSON e foto direto ao Minio, sem gravar em dados/')
+    parser.add_argument('--variants', action='store_true',
+                      help='Gera e envia miniaturas WebP/AVIF da foto de perfil (requer Pillow)')
+    parser.add_argument('--batch-output', action='store_true',
+                      help='No modo em lote, grava todos os perfis em partes NDJSON comprimidas com manifesto')
+    parser.add_argument('--batch-compression', choices=COMPRESSIONS,
+                      help='Compressão das partes do lote (padrão: BATCH_COMPRESSION ou gzip)')
+    parser.add_argument('--no-profile-json', action='store_true',
+                      help='Não envia um profile_info.json por perfil ao Minio')
+    parser.add_argument('--fast-fetch', action='store_true',
+                      help='Obtém os perfis pela consulta direta ao web_profile_info (fast_fetch.py)')
+    parser.add_argument('--no-cache', action='store_true',
+                      help='Ignora o cache local de perfis e consulta sempre o Instagram')
+    parser.add_argument('--session-strategy', choices=STRATEGIES, default='round_robin',
+                      help='Rotação entre as contas de INSTAGRAM_USERNAMES no modo em lote')
+    parser.add_argument('--metrics-file', type=str, default=os.getenv("METRICS_PROM_FILE"),
+                      help='Grava as métricas (formato Prometheus) neste arquivo ao final')
+    parser.add_argument('--trace-file', type=str,
+                      help='Grava a duração de cada fase por perfil (JSON lines) neste arquivo')
     
     args = parser.parse_args()
-    username = args.username.lstrip('@')
-    save_instagram_data(username)
+    if args.username and args.batch_output:
+        parser.error("--batch-output só vale no modo em lote (--usernames-file)")
+    if args.batch_compression and not args.batch_output:
+        parser.error("--batch-compression exige --batch-output")
+    if args.no_profile_json and args.diskless and not args.batch_output:
+        parser.error("--no-profile-json com --diskless exige --batch-output; "
+                     "sem ele os dados do perfil não seriam gravados em lugar nenhum")
+    if args.trace_file:
+        get_metrics().set_trace_file(args.trace_file)
+    signal.signal(signal.SIGTERM, _terminate)
+    try:
+        _run(args)
+    finally:
+        if args.metrics_file:
+            get_metrics().write_prometheus(args.metrics_file)
+            log_info(f"Métricas gravadas em {args.metrics_file}")
+
+def _terminate(signum, frame):
+    """SIGTERM vira SystemExit para que o atexit do storage salve o spill"""
+    log_error("Sinal de término recebido; encerrando após os perfis em andamento...")
+    sys.exit(128 + signum)
+
+def _run(args):
+    global USE_PROFILE_CACHE, MAKE_VARIANTS, UPLOAD_PROFILE_JSON, USE_FAST_FETCH
+    if args.no_cache:
+        USE_PROFILE_CACHE = False
+    if args.fast_fetch:
+        USE_FAST_FETCH = True
+    if args.variants:
+        MAKE_VARIANTS = True
+    if args.no_profile_json:
+        UPLOAD_PROFILE_JSON = False
+    if args.incremental and UPLOAD_TO_MINIO and os.getenv("STORAGE_SINK", "minio") == "minio":
+        # O sync incremental compara com o bucket; só se aplica ao destino Minio
+        get_uploader().incremental = True
+    
+    if args.username:
+        username = args.username.lstrip('@')
+        save_instagram_data(username, diskless=args.diskless)
+        if UPLOAD_TO_MINIO:
+            get_storage().report()
+        return
+    
+    usernames = read_usernames(args.usernames_file)
+    if not usernames:
+        log_error("Nenhum username encontrado na entrada")
+        sys.exit(1)
+    
+    results = run_batch(usernames, workers=max(1, args.workers),
+                        session_strategy=args.session_strategy, diskless=args.diskless,
+                        batch_output=args.batch_output, batch_compression=args.batch_compression)
+    if not all(r["ok"] for r in results):
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
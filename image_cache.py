@@ -0,0 +1,100 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Configurações padrão (podem ser sobrescritas no .env)
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 60 * 60
+
+class CachedImage:
+    """Imagem guardada no cache, com o ETag informado ou calculado do conteúdo"""
+
+    __slots__ = ("content", "content_type", "etag", "expires_at")
+
+    def __init__(self, content, content_type, ttl, etag=None):
+        self.content = content
+        self.content_type = content_type
+        self.etag = etag or '"' + hashlib.sha1(content).hexdigest() + '"'
+        self.expires_at = time.monotonic() + ttl
+
+    def ttl_remaining(self):
+        return max(0, int(self.expires_at - time.monotonic()))
+
+def etag_matches(if_none_match, etag):
+    """Verifica se o cabeçalho If-None-Match contém o ETag informado"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+class ImageCache:
+    """Cache LRU de imagens limitado pelo total de bytes em memória
+
+    Entradas expiram após `ttl` segundos. Imagens maiores que
+    `max_item_bytes` não são guardadas, para que uma única imagem grande não
+    esvazie o cache.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL, max_item_bytes=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_item_bytes = max_item_bytes or max_bytes // 8
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Retorna a imagem do cache (ou None se ausente/expirada)"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item.expires_at <= time.monotonic():
+                if item is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item
+
+    def put(self, key, content, content_type="image/jpeg", etag=None):
+        """Guarda a imagem e remove as menos usadas até caber no limite
+
+        Com `etag`, a entrada usa o mesmo ETag já enviado ao cliente.
+        """
+        item = CachedImage(content, content_type, self.ttl, etag)
+        if len(content) > self.max_item_bytes:
+            return item
+        with self._lock:
+            if key in self._items:
+                self._remove(key)
+            self._items[key] = item
+            self.size += len(content)
+            while self.size > self.max_bytes:
+                oldest = next(iter(self._items))
+                self._remove(oldest)
+                self.evictions += 1
+        return item
+
+    def _remove(self, key):
+        item = self._items.pop(key)
+        self.size -= len(item.content)
+
+    def stats(self):
+        """Retorna taxa de acerto e uso de memória do cache"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "taxa_acerto": self.hits / total if total else 0.0,
+                "entradas": len(self._items),
+                "bytes": self.size,
+                "limite_bytes": self.max_bytes,
+                "remocoes": self.evictions,
+            }
@@ -0,0 +1,156 @@
+import io
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from metrics import span, incr
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = None
+
+# Lados (em pixels) das miniaturas geradas a partir da foto de perfil
+DEFAULT_SIZES = (320, 150)
+DEFAULT_FORMATS = ("webp",)
+
+# Qualidade de codificação por formato
+QUALITY = {"webp": 80, "avif": 60}
+
+CONTENT_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+
+def log_info(message):
+    print(f"[INFO] {message}")
+
+def log_error(message):
+    print(f"[ERROR] {message}")
+
+def supported_formats():
+    """Formatos que o Pillow instalado consegue codificar"""
+    if Image is None:
+        return []
+    formats = ["webp"] if features.check("webp") else []
+    try:
+        if features.check("avif"):
+            formats.append("avif")
+    except ValueError:
+        # Pillow < 11.2 não conhece AVIF sem o plugin pillow-avif-plugin
+        try:
+            import pillow_avif  # noqa: F401
+            formats.append("avif")
+        except ImportError:
+            pass
+    return formats
+
+def variant_name(size, fmt):
+    return f"profile_pic_{size}.{fmt}"
+
+def variant_object_name(username, size, fmt):
+    """Nome do objeto da variante no Minio (ex.: fulano/variants/profile_pic_150.webp)"""
+    return f"{username}/variants/{variant_name(size, fmt)}"
+
+def make_variants(data, sizes=DEFAULT_SIZES, formats=DEFAULT_FORMATS):
+    """Gera as miniaturas da imagem (executa nos processos do pool)
+
+    Retorna uma lista de (tamanho, formato, bytes). As reduções são feitas
+    em cascata, da maior para a menor, e o JPEG é decodificado já reduzido
+    (draft) quando possível.
+    """
+    image = Image.open(io.BytesIO(data))
+    image.draft("RGB", (max(sizes), max(sizes)))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+    variants = []
+    for size in sorted(sizes, reverse=True):
+        image = image.copy()
+        image.thumbnail((size, size), Image.LANCZOS)
+        for fmt in formats:
+            output = io.BytesIO()
+            image.save(output, format=fmt.upper(), quality=QUALITY.get(fmt, 80))
+            variants.append((size, fmt, output.getvalue()))
+    return variants
+
+class VariantProcessor:
+    """Pool de processos que gera as variantes fora das threads de I/O
+
+    A codificação (CPU) roda em processos separados, sem disputar o GIL com
+    os downloads e uploads.
+    """
+
+    def __init__(self, workers=None, sizes=DEFAULT_SIZES, formats=DEFAULT_FORMATS):
+        if Image is None:
+            raise RuntimeError("Pillow não instalado; execute pip install Pillow")
+        unsupported = set(formats) - set(supported_formats())
+        if unsupported:
+            raise ValueError(f"Formatos não suportados pelo Pillow: {', '.join(sorted(unsupported))}")
+        self.sizes = tuple(sizes)
+        self.formats = tuple(formats)
+        # spawn: o processo principal tem várias threads, e fork com threads não é seguro
+        self._executor = ProcessPoolExecutor(max_workers=workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+
+    def submit(self, data):
+        """Agenda a geração das variantes e retorna o Future"""
+        return self._executor.submit(make_variants, data, self.sizes, self.formats)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+def _generate(data, processor):
+    processor = processor or get_variant_processor()
+    with span("variantes", bytes=len(data)):
+        variants = processor.submit(data).result()
+    incr("variantes", len(variants))
+    return variants
+
+def upload_variants(username, data, uploader, processor=None):
+    """Gera as variantes no pool de processos e as envia ao Minio
+
+    Roda numa thread do uploader: a thread só aguarda o processo que
+    codifica as imagens e depois envia os resultados.
+    """
+    variants = _generate(data, processor)
+    for size, fmt, content in variants:
+        uploader.upload_bytes(variant_object_name(username, size, fmt), content, CONTENT_TYPES[fmt])
+    log_info(f"{len(variants)} variantes da foto de @{username} enviadas")
+    return len(variants)
+
+def save_variants(user_dir, data, processor=None, store=None):
+    """Gera as variantes e as grava em dados/<username>/variants/
+
+    Com `store` (um MediaStore), cada variante vira um hardlink para o blob
+    do seu conteúdo.
+    """
+    variants = _generate(data, processor)
+    variants_dir = user_dir / "variants"
+    variants_dir.mkdir(exist_ok=True)
+    for size, fmt, content in variants:
+        if store:
+            store.save_bytes(content, variants_dir / variant_name(size, fmt))
+        else:
+            (variants_dir / variant_name(size, fmt)).write_bytes(content)
+    log_info(f"{len(variants)} variantes da foto salvas em {variants_dir}")
+    return len(variants)
+
+def _parse_list(value, cast=str):
+    return [cast(item.strip()) for item in value.split(",") if item.strip()]
+
+_default_processor = None
+_default_processor_lock = threading.Lock()
+
+def get_variant_processor():
+    """Retorna o pool compartilhado (IMAGE_VARIANT_SIZES/FORMATS/WORKERS no .env)"""
+    global _default_processor
+    with _default_processor_lock:
+        if _default_processor is None:
+            sizes = os.getenv("IMAGE_VARIANT_SIZES")
+            formats = os.getenv("IMAGE_VARIANT_FORMATS")
+            workers = os.getenv("IMAGE_VARIANT_WORKERS")
+            _default_processor = VariantProcessor(
+                workers=int(workers) if workers else None,
+                sizes=_parse_list(sizes, int) if sizes else DEFAULT_SIZES,
+                formats=_parse_list(formats) if formats else DEFAULT_FORMATS)
+        return _default_processor
@@ -0,0 +1,274 @@
+import os
+import time
+import sqlite3
+import importlib
+import argparse
+import threading
+from collections import namedtuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_PATH = "jobs.db"
+
+# Tempo (segundos) que um job fica reservado para o worker sem renovação
+DEFAULT_LEASE = 5 * 60
+DEFAULT_MAX_ATTEMPTS = 5
+
+# Espera antes de uma nova tentativa: BASE_RETRY_DELAY * 2^(tentativa-1), até MAX_RETRY_DELAY
+BASE_RETRY_DELAY = 60
+MAX_RETRY_DELAY = 60 * 60
+
+STATUSES = ("pending", "leased", "done", "failed")
+
+Job = namedtuple("Job", ("id", "username", "kind", "attempts", "max_attempts", "lease_owner"))
+
+def log_info(message):
+    print(f"[INFO] {message}")
+
+def log_error(message):
+    print(f"[ERROR] {message}")
+
+def retry_delay(attempts):
+    return min(MAX_RETRY_DELAY, BASE_RETRY_DELAY * 2 ** max(0, attempts - 1))
+
+class SQLiteJobQueue:
+    """Fila de jobs persistente em SQLite, com lease, ack e contagem de tentativas
+
+    Um job reservado (`lease`) fica com o worker até `ack`, `fail` ou
+    `release`; se o worker morrer, o lease expira e o job volta para a fila
+    (contando como tentativa). Cada (kind, username) existe uma única vez, de
+    modo que dois workers nunca processam o mesmo perfil ao mesmo tempo.
+
+    O arquivo pode ser compartilhado por vários processos na mesma máquina,
+    em disco local: o modo WAL não funciona em sistemas de arquivos de rede.
+    Para workers em várias máquinas, implemente esta mesma interface sobre
+    um banco servidor (ver open_queue).
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                username TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                available_at REAL NOT NULL,
+                lease_owner TEXT,
+                lease_expires REAL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                UNIQUE (kind, username)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_available "
+                           "ON jobs (status, available_at)")
+
+    def _transaction(self, fn):
+        """Executa `fn(conn)` numa transação com lock de escrita (BEGIN IMMEDIATE)"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def enqueue(self, usernames, kind="profile", requeue_done=True):
+        """Adiciona perfis à fila e retorna quantos foram (re)enfileirados
+
+        Perfis já pendentes ou em processamento são ignorados; os concluídos
+        ou com falha voltam para a fila se `requeue_done`.
+        """
+        now = time.time()
+
+        def _enqueue(conn):
+            added = 0
+            for username in usernames:
+                cursor = conn.execute(
+                    "INSERT INTO jobs (kind, username, max_attempts, available_at, created_at, "
+                    "updated_at) VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (kind, username) DO NOTHING",
+                    (kind, username, self.max_attempts, now, now, now))
+                if cursor.rowcount == 0 and requeue_done:
+                    cursor = conn.execute(
+                        "UPDATE jobs SET status = 'pending', attempts = 0, available_at = ?, "
+                        "last_error = NULL, updated_at = ? "
+                        "WHERE kind = ? AND username = ? AND status IN ('done', 'failed')",
+                        (now, now, kind, username))
+                added += cursor.rowcount
+            return added
+        return self._transaction(_enqueue)
+
+    def lease(self, owner, lease_seconds=DEFAULT_LEASE, limit=1, kind="profile"):
+        """Reserva até `limit` jobs disponíveis para `owner`
+
+        Jobs com lease expirado são recuperados; os que já esgotaram as
+        tentativas passam para 'failed'.
+        """
+        now = time.time()
+
+        def _lease(conn):
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', lease_owner = NULL, updated_at = ?, "
+                "last_error = COALESCE(last_error, 'lease expirado') "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= max_attempts",
+                (now, now))
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE kind = ? AND ((status = 'pending' AND available_at <= ?) "
+                "OR (status = 'leased' AND lease_expires < ?)) ORDER BY available_at, id LIMIT ?",
+                (kind, now, now, limit)).fetchall()
+            jobs = []
+            for (job_id,) in rows:
+                conn.execute(
+                    "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (owner, now + lease_seconds, now, job_id))
+                jobs.append(Job(*conn.execute(
+                    "SELECT id, username, kind, attempts, max_attempts, lease_owner "
+                    "FROM jobs WHERE id = ?", (job_id,)).fetchone()))
+            return jobs
+        return self._transaction(_lease)
+
+    def _update_leased(self, job, sql, params):
+        """Atualiza o job só se o lease ainda pertence ao worker"""
+        def _update(conn):
+            cursor = conn.execute(sql + " WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                                  (*params, job.id, job.lease_owner))
+            return cursor.rowcount == 1
+        return self._transaction(_update)
+
+    def extend(self, job, lease_seconds=DEFAULT_LEASE):
+        """Renova o lease; retorna False se o job foi perdido para outro worker"""
+        now = time.time()
+        return self._update_leased(job, "UPDATE jobs SET lease_expires = ?, updated_at = ?",
+                                   (now + lease_seconds, now))
+
+    def ack(self, job):
+        """Marca o job como concluído"""
+        return self._update_leased(
+            job, "UPDATE jobs SET status = 'done', lease_owner = NULL, lease_expires = NULL, "
+                 "last_error = NULL, updated_at = ?", (time.time(),))
+
+    def fail(self, job, error, permanent=False):
+        """Registra a falha: volta para a fila com backoff ou, se esgotou, vai para 'failed'"""
+        now = time.time()
+        if permanent or job.attempts >= job.max_attempts:
+            return self._update_leased(
+                job, "UPDATE jobs SET status = 'failed', lease_owner = NULL, lease_expires = NULL, "
+                     "last_error = ?, updated_at = ?", (str(error), now))
+        return self._update_leased(
+            job, "UPDATE jobs SET status = 'pending', lease_owner = NULL, lease_expires = NULL, "
+                 "available_at = ?, last_error = ?, updated_at = ?",
+            (now + retry_delay(job.attempts), str(error), now))
+
+    def release(self, job):
+        """Devolve o job à fila sem contar a tentativa (ex.: worker encerrando)"""
+        now = time.time()
+        return self._update_leased(
+            job, "UPDATE jobs SET status = 'pending', lease_owner = NULL, lease_expires = NULL, "
+                 "attempts = MAX(0, attempts - 1), available_at = ?, updated_at = ?", (now, now))
+
+    def requeue_failed(self, kind="profile"):
+        now = time.time()
+        return self._transaction(lambda conn: conn.execute(
+            "UPDATE jobs SET status = 'pending', attempts = 0, available_at = ?, updated_at = ? "
+            "WHERE kind = ? AND status = 'failed'", (now, now, kind)).rowcount)
+
+    def stats(self, kind="profile"):
+        """Retorna o número de jobs por status"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs WHERE kind = ? "
+                                      "GROUP BY status", (kind,)).fetchall()
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update(rows)
+        return counts
+
+    def failures(self, kind="profile", limit=20):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT username, attempts, last_error FROM jobs WHERE kind = ? AND status = 'failed' "
+                "ORDER BY updated_at DESC LIMIT ?", (kind, limit)).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# Backends de fila por esquema da URL: esquema -> função que recebe a URL
+# completa e retorna a fila. Um backend precisa oferecer os mesmos métodos
+# de SQLiteJobQueue (enqueue, lease, extend, ack, fail, release,
+# requeue_failed, stats, failures e close).
+BACKENDS = {
+    "sqlite": lambda url: SQLiteJobQueue(url[len("sqlite:///"):]),
+}
+
+def register_backend(scheme, factory):
+    """Registra um backend de fila para URLs `scheme://...`
+
+    Módulos listados em JOB_QUEUE_BACKENDS (separados por vírgula) são
+    importados por open_queue e podem chamar esta função ao serem
+    carregados; assim worker.py e scheduler.py usam o backend sem mudanças.
+    """
+    BACKENDS[scheme] = factory
+
+def _load_backend_modules():
+    for name in filter(None, (m.strip() for m in os.getenv("JOB_QUEUE_BACKENDS", "").split(","))):
+        importlib.import_module(name)
+
+def open_queue(url=None):
+    """Abre a fila indicada por `url` (ou JOB_QUEUE_URL no .env)
+
+    Aceita um caminho de arquivo, sqlite:///caminho ou uma URL de um backend
+    registrado com register_backend.
+    """
+    url = url or os.getenv("JOB_QUEUE_URL", DEFAULT_PATH)
+    if "://" not in url:
+        return SQLiteJobQueue(url)
+    _load_backend_modules()
+    scheme = url.split("://", 1)[0]
+    if scheme not in BACKENDS:
+        raise ValueError(f"Backend de fila não suportado: {url} "
+                         f"(disponíveis: {', '.join(sorted(BACKENDS))})")
+    return BACKENDS[scheme](url)
+
+def main():
+    from get_profile import read_usernames
+
+    parser = argparse.ArgumentParser(description='Gerencia a fila de perfis processados pelo worker.py')
+    parser.add_argument('--queue', type=str, help=f'Fila (padrão: JOB_QUEUE_URL ou {DEFAULT_PATH})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    enqueue = commands.add_parser('enqueue', help='Adiciona perfis à fila')
+    enqueue.add_argument('--usernames-file', type=str, required=True,
+                         help="Arquivo com um username por linha ('-' para ler da entrada padrão)")
+    enqueue.add_argument('--skip-done', action='store_true',
+                         help='Não reenfileira perfis já concluídos')
+    commands.add_parser('stats', help='Mostra o número de jobs por status e as últimas falhas')
+    commands.add_parser('requeue-failed', help='Devolve à fila os jobs que falharam')
+    args = parser.parse_args()
+
+    queue = open_queue(args.queue)
+    if args.command == 'enqueue':
+        usernames = read_usernames(args.usernames_file)
+        added = queue.enqueue(usernames, requeue_done=not args.skip_done)
+        log_info(f"{added} de {len(usernames)} perfis adicionados à fila")
+    elif args.command == 'requeue-failed':
+        log_info(f"{queue.requeue_failed()} jobs devolvidos à fila")
+    else:
+        print(", ".join(f"{status}: {count}" for status, count in queue.stats().items()))
+        for username, attempts, error in queue.failures():
+            print(f"@{username} ({attempts} tentativas): {error}")
+
+if __name__ == "__main__":
+    main()
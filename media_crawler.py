@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from dotenv import load_dotenv
+from instaloader import FrozenNodeIterator
+from instaloader.exceptions import PrivateProfileNotFollowedException
+
+import get_profile
+from get_profile import get_profile_with_retry, download_picture, read_usernames
+from cdn_client import open_picture
+from session_pool import SessionPool, STRATEGIES
+from storage import get_storage
+from failures import check_negative, remember_failure
+from metrics import run_context, span, incr
+
+load_dotenv()
+
+# Checkpoints do cursor de paginação (um arquivo por perfil)
+CHECKPOINT_DIR = Path("dados") / ".checkpoints"
+
+# A cada quantos posts o checkpoint é gravado (uma página do Instagram)
+CHECKPOINT_EVERY = 12
+
+# Máximo de mídias aguardando download/upload ao mesmo tempo
+MAX_PENDING_MEDIA = 32
+
+# Threads para salvar mídias em disco quando o upload para o Minio está desligado
+MEDIA_WORKERS = 8
+
+def log_info(message):
+    print(f"[INFO] {message}")
+
+def log_error(message):
+    print(f"[ERROR] {message}")
+
+def post_to_record(post):
+    """Extrai os metadados do post gravados no NDJSON
+
+    Comentários e visualizações são lidos do node da listagem: as
+    propriedades do Post buscariam os metadados completos (uma consulta
+    GraphQL a mais por post) quando o campo não está no node.
+    """
+    node = post._node
+    if post.typename == "GraphSidecar":
+        media = [{"is_video": n.is_video, "url": n.video_url if n.is_video else n.display_url}
+                 for n in post.get_sidecar_nodes()]
+    else:
+        media = [{"is_video": post.is_video, "url": post.video_url if post.is_video else post.url}]
+    return {
+        "shortcode": post.shortcode,
+        "mediaid": post.mediaid,
+        "data": post.date_utc.isoformat(),
+        "tipo": post.typename,
+        "legenda": post.caption,
+        "hashtags": post.caption_hashtags,
+        "mencoes": post.caption_mentions,
+        "curtidas": post.likes,
+        "comentarios": node.get("comments"),
+        "visualizacoes": node.get("video_view_count"),
+        "midias": media,
+    }
+
+def media_object_name(username, shortcode, index, media):
+    extension = "mp4" if media["is_video"] else "jpg"
+    return f"{username}/posts/{shortcode}_{index}.{extension}"
+
+class Checkpoint:
+    """Cursor de paginação salvo em disco para retomar o crawl
+
+    Guarda o estado congelado do NodeIterator e o tamanho do NDJSON naquele
+    ponto; ao retomar, o NDJSON é truncado para esse tamanho e a iteração
+    continua do mesmo post, sem duplicar linhas.
+    """
+
+    def __init__(self, username, base_dir=CHECKPOINT_DIR):
+        self.path = Path(base_dir) / f"{username}.json"
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            return FrozenNodeIterator(**data["iterador"]), data["offset"], data["posts"]
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError) as e:
+            log_error(f"Checkpoint inválido em {self.path}, ignorando: {str(e)}")
+            return None
+
+    def save(self, frozen, offset, posts):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"iterador": frozen._asdict(), "offset": offset, "posts": posts,
+                       "salvo_em": datetime.now().isoformat(timespec="seconds")}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
+
+class MediaWindow:
+    """Limita o número de mídias pendentes e guarda as falhas"""
+
+    def __init__(self, limit=MAX_PENDING_MEDIA):
+        self.limit = limit
+        self.pending = set()
+        self.errors = []
+
+    def _collect(self, done):
+        for future in done:
+            self.pending.discard(future)
+            if future.exception() is not None:
+                self.errors.append(future.exception())
+
+    def add(self, future):
+        self.pending.add(future)
+        while len(self.pending) >= self.limit:
+            done, _ = wait(self.pending, return_when=FIRST_COMPLETED)
+            self._collect(done)
+
+    def drain(self):
+        """Aguarda todas as mídias pendentes; falha se alguma não foi salva"""
+        done, _ = wait(self.pending)
+        self._collect(done)
+        if self.errors:
+            error, self.errors = self.errors[0], []
+            raise Exception(f"Falha ao salvar mídia: {str(error)}")
+
+def crawl_posts(username, loader, uploader=None, max_posts=None, media=True, restart=False):
+    """Percorre os posts do perfil gravando NDJSON e mídias, com checkpoint
+
+    Os metadados vão para dados/<username>/posts.ndjson e as mídias para
+    <username>/posts/ no Minio (ou para o disco, com UPLOAD_TO_MINIO
+    desligado). Um crawl interrompido (429, queda, Ctrl+C) retoma do último
+    checkpoint na próxima execução; `restart=True` descarta o checkpoint.
+    """
+    with run_context(username), span("crawl"):
+        return _crawl_posts(username, loader, uploader, max_posts, media, restart)
+
+def get_crawlable_profile(loader, username):
+    """Obtém o perfil, pulando/registrando no cache negativo os inexistentes e privados"""
+    negative_cache = get_profile.USE_PROFILE_CACHE
+    if negative_cache:
+        check_negative(username)
+    try:
+        profile = get_profile_with_retry(loader.context, username)
+        if profile.is_private and not profile.followed_by_viewer:
+            # Sem os posts não há o que coletar; não vale gastar requisições da conta
+            raise PrivateProfileNotFollowedException(f"@{username} é privado e não seguido")
+    except Exception as e:
+        if negative_cache:
+            remember_failure(username, e)
+        raise
+    return profile
+
+def _crawl_posts(username, loader, uploader, max_posts, media, restart):
+    user_dir = Path("dados") / username
+    user_dir.mkdir(parents=True, exist_ok=True)
+    ndjson_path = user_dir / "posts.ndjson"
+    checkpoint = Checkpoint(username)
+    if restart:
+        checkpoint.clear()
+
+    profile = get_crawlable_profile(loader, username)
+    posts = profile.get_posts()
+    offset, count = 0, 0
+    saved = checkpoint.load()
+    if saved:
+        frozen, offset, count = saved
+        if frozen.best_before and frozen.best_before < time.time():
+            log_info("Checkpoint expirado; reiniciando o crawl do primeiro post")
+            offset, count = 0, 0
+        else:
+            # O cursor não depende da conta; a sessão do pool pode ser outra
+            posts.thaw(frozen._replace(context_username=loader.context.username))
+            log_info(f"Retomando crawl de @{username} a partir do post {count + 1}")
+
+    uploader = uploader or (get_storage() if get_profile.UPLOAD_TO_MINIO else None)
+    local_executor = None if uploader else ThreadPoolExecutor(max_workers=MEDIA_WORKERS)
+    window = MediaWindow()
+
+    def submit_media(object_name, url):
+        if uploader:
+            return uploader.submit_stream(object_name, lambda: open_picture(url))
+        path = Path("dados") / object_name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return local_executor.submit(download_picture, url, path)
+
+    with open(ndjson_path, "a+b") as ndjson:
+        ndjson.truncate(offset)
+        try:
+            for post in posts:
+                if max_posts is not None and count >= max_posts:
+                    break
+                if count % CHECKPOINT_EVERY == 0 and count:
+                    # Ponto seguro: posts anteriores gravados e mídias salvas.
+                    # freeze() retoma a partir deste post, ainda não processado.
+                    window.drain()
+                    ndjson.flush()
+                    checkpoint.save(posts.freeze(), ndjson.tell(), count)
+
+                with span("post", shortcode=post.shortcode):
+                    record = post_to_record(post)
+                ndjson.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+                count += 1
+                incr("posts")
+                if media:
+                    for index, item in enumerate(record["midias"]):
+                        if item["url"]:
+                            window.add(submit_media(
+                                media_object_name(username, post.shortcode, index, item),
+                                item["url"]))
+                            incr("midias")
+                if count % 50 == 0:
+                    log_info(f"@{username}: {count} posts processados")
+
+            window.drain()
+        except BaseException:
+            log_error(f"Crawl de @{username} interrompido após {count} posts; "
+                      f"será retomado do último checkpoint")
+            raise
+        finally:
+            if local_executor:
+                local_executor.shutdown(wait=False, cancel_futures=True)
+
+    checkpoint.clear()
+    if uploader:
+        if not uploader.upload_file(ndjson_path, f"{username}/posts.ndjson"):
+            log_info("posts.ndjson sem alterações")
+    log_info(f"Crawl de @{username} concluído: {count} posts")
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description='Coleta os posts e mídias de perfis do Instagram')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--username', type=str,
+                      help='Nome de usuário do Instagram (com ou sem @)')
+    group.add_argument('--usernames-file', type=str,
+                      help="Arquivo com um username por linha ('-' para ler da entrada padrão)")
+    parser.add_argument('--max-posts', type=int,
+                      help='Número máximo de posts por perfil')
+    parser.add_argument('--no-media', action='store_true',
+                      help='Grava apenas os metadados (NDJSON), sem baixar as mídias')
+    parser.add_argument('--restart', action='store_true',
+                      help='Ignora o checkpoint e recomeça do primeiro post')
+    parser.add_argument('--session-strategy', choices=STRATEGIES, default='round_robin',
+                      help='Rotação entre as contas de INSTAGRAM_USERNAMES')
+    args = parser.parse_args()
+
+    if args.username:
+        usernames = [args.username.lstrip('@')]
+    else:
+        usernames = read_usernames(args.usernames_file)
+
+    pool = SessionPool(strategy=args.session_strategy)
+    failed = []
+    for username in usernames:
+        try:
+            with pool.session() as loader:
+                crawl_posts(username, loader, max_posts=args.max_posts,
+                            media=not args.no_media, restart=args.restart)
+        except Exception as e:
+            log_error(f"Erro no crawl de @{username}: {str(e)}")
+            failed.append(username)
+
+    if get_profile.UPLOAD_TO_MINIO:
+        get_storage().flush()
+        get_storage().report()
+    if failed:
+        log_error(f"Perfis com falha: {', '.join(failed)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
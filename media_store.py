@@ -0,0 +1,212 @@
+import os
+import io
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from metrics import incr
+
+load_dotenv()
+
+# Blobs ficam no mesmo volume de dados/: hardlinks não atravessam sistemas de arquivos
+DEFAULT_DIR = Path("dados") / ".blobs"
+
+# Conteúdos até este tamanho são conferidos em memória antes de gravar; acima
+# disso vão para um temporário no próprio store
+MEMORY_LIMIT = 8 * 1024 * 1024
+
+CHUNK_SIZE = 64 * 1024
+
+# Blobs sem referência só são removidos depois deste tempo (segundos): evita
+# apagar um blob gravado por outro processo que ainda vai criar o link
+DEFAULT_GC_GRACE = 60 * 60
+
+def log_info(message):
+    print(f"[INFO] {message}")
+
+def log_error(message):
+    print(f"[ERROR] {message}")
+
+class MediaStore:
+    """Armazenamento local de mídias endereçado pelo conteúdo
+
+    Cada conteúdo é gravado uma única vez em <dir>/<aa>/<sha256>, somente
+    leitura, e compartilhado por todos os perfis e execuções. Os arquivos em
+    dados/<username>/ são hardlinks para os blobs, trocados de forma atômica
+    (link temporário + rename); se o link já aponta para o mesmo blob, nada é
+    gravado. O número de links do blob é a contagem de referências: `gc`
+    remove os que só existem no store.
+    """
+
+    def __init__(self, base_dir=DEFAULT_DIR):
+        self.base_dir = Path(base_dir)
+        self.tmp_dir = self.base_dir / "tmp"
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self._hardlinks = True
+        self._lock = threading.Lock()
+
+    def blob_path(self, digest):
+        return self.base_dir / digest[:2] / digest
+
+    def _store(self, digest, write):
+        """Grava o blob com `write(tmp_path)` se ele ainda não existir"""
+        blob = self.blob_path(digest)
+        if blob.exists():
+            # Renova o prazo do gc: o blob vai ganhar um link em seguida
+            os.utime(blob)
+            incr("blobs", resultado="reaproveitado")
+            return digest
+        blob.parent.mkdir(exist_ok=True)
+        tmp_path = write()
+        os.chmod(tmp_path, 0o444)
+        os.replace(tmp_path, blob)
+        incr("blobs", resultado="novo")
+        return digest
+
+    def _tmp_file(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir, suffix=".tmp")
+        return os.fdopen(fd, "wb"), tmp_path
+
+    def put_bytes(self, data: bytes):
+        """Guarda o conteúdo e retorna o sha256"""
+        def _write():
+            f, tmp_path = self._tmp_file()
+            with f:
+                f.write(data)
+            return tmp_path
+        return self._store(hashlib.sha256(data).hexdigest(), _write)
+
+    def put_stream(self, stream):
+        """Guarda o conteúdo lido de `stream` e retorna o sha256
+
+        Conteúdos pequenos ficam em memória até o digest ser conhecido e só
+        são gravados se ainda não estiverem no store.
+        """
+        sha256 = hashlib.sha256()
+        buffer = io.BytesIO()
+        f, tmp_path = None, None
+        try:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                sha256.update(chunk)
+                if f is None and buffer.tell() + len(chunk) > MEMORY_LIMIT:
+                    f, tmp_path = self._tmp_file()
+                    f.write(buffer.getvalue())
+                    buffer = None
+                (f or buffer).write(chunk)
+            if f is None:
+                return self.put_bytes(buffer.getvalue())
+            f.close()
+            digest = self._store(sha256.hexdigest(), lambda: tmp_path)
+        finally:
+            if f is not None:
+                f.close()
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+        return digest
+
+    def link(self, digest, target):
+        """Faz `target` apontar para o blob; retorna False se já apontava"""
+        target = Path(target)
+        blob = self.blob_path(digest)
+        try:
+            if os.path.samefile(blob, target):
+                return False
+        except FileNotFoundError:
+            pass
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(f".{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        if self._hardlinks:
+            try:
+                os.link(blob, tmp_path)
+            except OSError as e:
+                # Outro volume ou sistema de arquivos sem hardlinks: cópias comuns
+                with self._lock:
+                    if self._hardlinks:
+                        log_error(f"Hardlinks indisponíveis em {target.parent} ({str(e)}); "
+                                  f"usando cópias")
+                    self._hardlinks = False
+        if not self._hardlinks:
+            shutil.copyfile(blob, tmp_path)
+        os.replace(tmp_path, target)
+        return True
+
+    def save_bytes(self, data: bytes, target):
+        """Guarda o conteúdo e faz `target` apontar para ele"""
+        return self.link(self.put_bytes(data), target)
+
+    def save_stream(self, stream, target):
+        return self.link(self.put_stream(stream), target)
+
+    def _blobs(self):
+        for shard in self.base_dir.iterdir():
+            if shard.is_dir() and shard != self.tmp_dir:
+                yield from shard.iterdir()
+
+    def stats(self):
+        """Retorna número de blobs, bytes ocupados, links e bytes economizados pelo compartilhamento"""
+        blobs = size = links = saved = 0
+        for blob in self._blobs():
+            st = blob.stat()
+            blobs += 1
+            size += st.st_size
+            links += st.st_nlink - 1
+            saved += st.st_size * max(0, st.st_nlink - 2)
+        return {"blobs": blobs, "bytes": size, "links": links, "bytes_economizados": saved}
+
+    def gc(self, grace=DEFAULT_GC_GRACE, dry_run=False):
+        """Remove blobs sem nenhum link fora do store (e temporários abandonados)
+
+        Retorna (blobs removidos, bytes liberados).
+        """
+        cutoff = time.time() - grace
+        removed = freed = 0
+        for path in list(self._blobs()) + list(self.tmp_dir.iterdir()):
+            st = path.stat()
+            if st.st_nlink > 1 or st.st_mtime > cutoff:
+                continue
+            if not dry_run:
+                path.unlink()
+            removed += 1
+            freed += st.st_size
+        incr("blobs_removidos", removed)
+        return removed, freed
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+def get_media_store():
+    """Retorna o store do diretório MEDIA_STORE_DIR (padrão dados/.blobs)"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = MediaStore(os.getenv("MEDIA_STORE_DIR", DEFAULT_DIR))
+        return _default_store
+
+def main():
+    parser = argparse.ArgumentParser(description='Estatísticas e limpeza do store de mídias (dados/.blobs)')
+    parser.add_argument('--gc', action='store_true',
+                      help='Remove blobs que não são mais usados por nenhum perfil')
+    parser.add_argument('--grace', type=float, default=DEFAULT_GC_GRACE,
+                      help=f'Idade mínima (segundos) do blob removido (padrão: {DEFAULT_GC_GRACE})')
+    parser.add_argument('--dry-run', action='store_true',
+                      help='Com --gc, só mostra o que seria removido')
+    args = parser.parse_args()
+
+    store = get_media_store()
+    if args.gc:
+        removed, freed = store.gc(args.grace, args.dry_run)
+        action = "seriam removidos" if args.dry_run else "removidos"
+        log_info(f"{removed} blobs {action} ({freed / 1024 / 1024:.1f} MB)")
+    stats = store.stats()
+    print(f"Blobs: {stats['blobs']} ({stats['bytes'] / 1024 / 1024:.1f} MB)")
+    print(f"Links: {stats['links']}")
+    print(f"Economizado pelo compartilhamento: {stats['bytes_economizados'] / 1024 / 1024:.1f} MB")
+
+if __name__ == "__main__":
+    main()
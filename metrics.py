@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import uuid
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Limites (em segundos) dos buckets do histograma de duração das fases
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+PREFIX = "insta"
+
+# Execução (um perfil) e span em andamento no contexto atual
+_current_run = contextvars.ContextVar("metrics_run", default=None)
+_current_span = contextvars.ContextVar("metrics_span", default=None)
+_span_ids = itertools.count(1)
+
+def log_info(message):
+    print(f"[INFO] {message}")
+
+def log_error(message):
+    print(f"[ERROR] {message}")
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(key):
+    if not key:
+        return ""
+    escape = lambda v: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in key) + "}"
+
+class Histogram:
+    """Histograma cumulativo no formato do Prometheus"""
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(DURATION_BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+
+class MetricsRegistry:
+    """Contadores e durações por fase do scraper
+
+    As fases são medidas com `span()`; cada span alimenta o histograma
+    `insta_phase_duration_seconds` e, se houver arquivo de trace, vira uma
+    linha JSON com o run_id do perfil em processamento. Ouvintes registrados
+    com `add_listener` recebem cada span finalizado.
+    """
+
+    def __init__(self, trace_path=None):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._listeners = []
+        self._trace_file = None
+        if trace_path:
+            self.set_trace_file(trace_path)
+
+    def set_trace_file(self, path):
+        """Passa a gravar os spans (JSON lines) no arquivo informado"""
+        with self._lock:
+            if self._trace_file:
+                self._trace_file.close()
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._trace_file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def incr(self, name, value=1, **labels):
+        """Soma `value` ao contador `insta_<name>_total`"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, phase, seconds, status="ok"):
+        key = _label_key({"phase": phase, "status": status})
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, phase, **attrs):
+        """Mede a duração de uma fase; `attrs` vão apenas para o trace"""
+        span_id = next(_span_ids)
+        parent = _current_span.get()
+        token = _current_span.set(span_id)
+        started_at = time.time()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield attrs
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            _current_span.reset(token)
+            status = "ok" if error is None else "erro"
+            self.observe(phase, duration, status)
+            record = {
+                "ts": datetime.fromtimestamp(started_at).isoformat(timespec="milliseconds"),
+                "span": phase,
+                "span_id": span_id,
+                "pai": parent,
+                "duracao_ms": round(duration * 1000, 3),
+                "status": status,
+            }
+            run = _current_run.get()
+            if run:
+                record.update(run)
+            if error is not None:
+                record["erro"] = str(error)
+            record.update(attrs)
+            self._emit(record)
+
+    def _emit(self, record):
+        for listener in self._listeners:
+            listener(record)
+        if self._trace_file is not None:
+            line = json.dumps(record, ensure_ascii=False, default=str)
+            with self._lock:
+                if self._trace_file is not None:
+                    self._trace_file.write(line + "\n")
+
+    def render_prometheus(self):
+        """Retorna as métricas no formato texto do Prometheus"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, (list(h.counts), h.total, h.count))
+                                for k, h in self._histograms.items())
+
+        lines = []
+        declared = set()
+        for (name, key), value in counters:
+            metric = f"{PREFIX}_{name}_total"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_format_labels(key)} {value}")
+
+        metric = f"{PREFIX}_phase_duration_seconds"
+        if histograms:
+            lines.append(f"# TYPE {metric} histogram")
+        for key, (counts, total, count) in histograms:
+            for bound, bucket_count in zip(DURATION_BUCKETS, counts):
+                lines.append(f"{metric}_bucket{_format_labels(key + (('le', str(bound)),))} "
+                             f"{bucket_count}")
+            lines.append(f"{metric}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+            lines.append(f"{metric}_sum{_format_labels(key)} {total}")
+            lines.append(f"{metric}_count{_format_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Grava as métricas no arquivo (ex.: para o textfile collector do node_exporter)"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        tmp_path.write_text(self.render_prometheus(), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def serve(self, port, host="0.0.0.0"):
+        """Expõe /metrics numa thread em segundo plano"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        log_info(f"Métricas disponíveis em http://{host}:{port}/metrics")
+        return server
+
+    def close(self):
+        with self._lock:
+            if self._trace_file:
+                self._trace_file.close()
+                self._trace_file = None
+
+@contextmanager
+def run_context(username):
+    """Marca os spans seguintes como parte do processamento de um perfil"""
+    token = _current_run.set({"run_id": uuid.uuid4().hex[:12], "username": username})
+    try:
+        yield
+    finally:
+        _current_run.reset(token)
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+def get_metrics():
+    """Retorna o registro de métricas do processo (configurado pelo .env)
+
+    METRICS_TRACE_PATH ativa o trace em JSON lines e METRICS_PORT expõe o
+    endpoint /metrics.
+    """
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = MetricsRegistry(trace_path=os.getenv("METRICS_TRACE_PATH"))
+            if os.getenv("METRICS_PORT"):
+                try:
+                    _default_registry.serve(int(os.getenv("METRICS_PORT")))
+                except OSError as e:
+                    log_error(f"Erro ao expor métricas: {str(e)}")
+        return _default_registry
+
+def span(phase, **attrs):
+    return get_metrics().span(phase, **attrs)
+
+def incr(name, value=1, **labels):
+    get_metrics().incr(name, value, **labels)
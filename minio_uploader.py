@@ -0,0 +1,460 @@
+import os
+import json
+import time
+import io
+import hashlib
+import random
+import threading
+import contextvars
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import certifi
+import urllib3
+import requests
+from minio import Minio
+from minio.error import S3Error
+
+from metrics import span, incr
+
+MINIO_ENDPOINT = "s3.supercaso.com.br"
+
+# Número de uploads simultâneos (e de conexões mantidas no pool HTTP)
+DEFAULT_UPLOAD_WORKERS = 8
+MAX_RETRIES = 3
+BASE_DELAY = 1
+
+# Códigos S3 que indicam falha temporária do servidor
+RETRYABLE_S3_CODES = {"SlowDown", "InternalError", "RequestTimeout",
+                      "ServiceUnavailable", "RequestTimeTooSkewed"}
+
+# Tamanho das partes no upload de streams (mínimo do S3: 5 MiB); limita a
+# memória usada por upload quando o tamanho do conteúdo é desconhecido
+STREAM_PART_SIZE = 5 * 1024 * 1024
+
+# Sync incremental: só envia objetos cujo conteúdo mudou
+SYNC_INDEX_PATH = Path("dados") / ".minio_sync.json"
+
+# Campos do profile_info.json que mudam a cada execução e não contam como alteração
+VOLATILE_JSON_KEYS = ("data_criacao", "data_coleta")
+
+CONTENT_TYPES = {
+    ".jpg": "image/jpeg",
+    ".json": "application/json",
+    ".webp": "image/webp",
+    ".avif": "image/avif",
+    ".gz": "application/gzip",
+    ".zst": "application/zstd",
+}
+
+def log_info(message):
+    print(f"[INFO] {message}")
+
+def log_error(message):
+    print(f"[ERROR] {message}")
+
+def load_credentials():
+    """Retorna (access_key, secret_key) do .env ou de auth/credentials.json"""
+    if os.getenv("MINIO_ACCESS_KEY"):
+        return os.getenv("MINIO_ACCESS_KEY"), os.getenv("MINIO_SECRET_KEY")
+    with open('auth/credentials.json') as f:
+        credentials = json.load(f)
+    return credentials["accessKey"], credentials["secretKey"]
+
+def get_minio_client(max_connections=DEFAULT_UPLOAD_WORKERS):
+    """Configura e retorna o cliente Minio com pool de conexões
+
+    Endpoint, TLS e região podem ser sobrescritos no .env (MINIO_ENDPOINT,
+    MINIO_SECURE, MINIO_REGION). Informar a região evita a consulta de
+    localização do bucket.
+    """
+    try:
+        access_key, secret_key = load_credentials()
+
+        endpoint = os.getenv("MINIO_ENDPOINT", MINIO_ENDPOINT)
+        secure = os.getenv("MINIO_SECURE", "1").lower() not in ("0", "false", "nao", "não")
+        log_info(f"Configurando Minio com endpoint: {endpoint}")
+
+        timeout = urllib3.Timeout(connect=30, read=300)
+        http_client = urllib3.PoolManager(
+            timeout=timeout,
+            maxsize=max_connections,
+            cert_reqs='CERT_REQUIRED',
+            ca_certs=os.environ.get('SSL_CERT_FILE') or certifi.where(),
+            retries=urllib3.Retry(total=5, backoff_factor=0.2,
+                                  status_forcelist=[500, 502, 503, 504])
+        )
+        client = Minio(
+            endpoint,
+            access_key=access_key,
+            secret_key=secret_key,
+            secure=secure,
+            region=os.getenv("MINIO_REGION") or None,
+            http_client=http_client
+        )
+        log_info("Cliente Minio configurado com sucesso")
+        return client
+    except Exception as e:
+        log_error(f"Erro ao configurar cliente Minio: {str(e)}")
+        raise
+
+def content_type_for(file_name):
+    """Retorna o content type a partir da extensão do arquivo"""
+    return CONTENT_TYPES.get(Path(file_name).suffix.lower(), "application/octet-stream")
+
+def is_retryable(exc):
+    """Indica se o erro de upload é temporário"""
+    if isinstance(exc, S3Error):
+        return exc.code in RETRYABLE_S3_CODES
+    return isinstance(exc, (urllib3.exceptions.HTTPError, ConnectionError, TimeoutError,
+                            requests.ConnectionError, requests.Timeout,
+                            requests.exceptions.ChunkedEncodingError))
+
+def content_digests(data, file_name):
+    """Retorna (sha256, md5) do conteúdo relevante
+
+    Para JSON, o sha256 ignora os campos de data da coleta, de modo que um
+    perfil sem alterações gera sempre o mesmo digest. O md5 é do conteúdo
+    bruto e serve para comparar com o ETag remoto (None para JSON).
+    """
+    if Path(file_name).suffix.lower() == ".json":
+        try:
+            content = json.loads(data)
+        except ValueError:
+            content = None
+        if isinstance(content, dict):
+            for key in VOLATILE_JSON_KEYS:
+                content.pop(key, None)
+            normalized = json.dumps(content, sort_keys=True, ensure_ascii=False).encode("utf-8")
+            return hashlib.sha256(normalized).hexdigest(), None
+    return hashlib.sha256(data).hexdigest(), hashlib.md5(data).hexdigest()
+
+def file_digests(file_path):
+    """Retorna (sha256, md5) do conteúdo relevante do arquivo"""
+    return content_digests(Path(file_path).read_bytes(), file_path)
+
+class CountingReader:
+    """Envolve um stream contando os bytes lidos"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = self._stream.read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+class SyncIndex:
+    """Índice local com o digest do último upload de cada objeto"""
+
+    def __init__(self, path=SYNC_INDEX_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._dirty = False
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self._digests = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self._digests = {}
+
+    def get(self, key):
+        with self._lock:
+            return self._digests.get(key)
+
+    def set(self, key, digest):
+        with self._lock:
+            if self._digests.get(key) != digest:
+                self._digests[key] = digest
+                self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._digests, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+class SyncStats:
+    """Contadores de economia do sync incremental"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.puts = 0
+        self.skipped = 0
+        self.head_requests = 0
+        self.bytes_uploaded = 0
+        self.bytes_saved = 0
+
+    def add(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "uploads": self.puts,
+                "ignorados": self.skipped,
+                "bytes_enviados": self.bytes_uploaded,
+                "bytes_economizados": self.bytes_saved,
+                # Cada objeto ignorado evita um PUT; as consultas HEAD ao remoto são descontadas
+                "requisicoes_economizadas": self.skipped - self.head_requests,
+            }
+
+class MinioUploader:
+    """Uploader de longa duração para o Minio
+
+    Mantém um único cliente (com pool de conexões), verifica o bucket uma
+    única vez e envia os arquivos em paralelo num pool de threads. Os uploads
+    são assíncronos: `submit_directory` retorna imediatamente e `flush`
+    aguarda tudo o que estiver pendente.
+
+    No modo incremental, cada arquivo é comparado com o digest do último
+    upload (índice local) ou com o objeto remoto (metadado sha256/ETag), e só
+    é enviado se o conteúdo mudou.
+    """
+
+    def __init__(self, client=None, bucket_name=None, workers=DEFAULT_UPLOAD_WORKERS,
+                 max_retries=MAX_RETRIES, incremental=None, sync_index=None):
+        self.bucket_name = bucket_name or os.getenv("BUCKET_NAME")
+        if not self.bucket_name:
+            raise ValueError("BUCKET_NAME não encontrado no .env")
+
+        self.client = client or get_minio_client(max_connections=workers)
+        self.max_retries = max_retries
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="minio-upload")
+        self._lock = threading.Lock()
+        self._bucket_checked = False
+        self._pending = set()
+        if incremental is None:
+            incremental = os.getenv("MINIO_INCREMENTAL_SYNC", "").lower() in ("1", "true", "sim")
+        self.incremental = incremental
+        self.sync_index = sync_index or SyncIndex()
+        self.stats = SyncStats()
+
+    def ensure_bucket(self):
+        """Garante que o bucket existe (verificado uma única vez)"""
+        if self._bucket_checked:
+            return
+        with self._lock:
+            if self._bucket_checked:
+                return
+            if not self.client.bucket_exists(self.bucket_name):
+                self.client.make_bucket(self.bucket_name)
+                log_info(f"Bucket '{self.bucket_name}' criado")
+            self._bucket_checked = True
+
+    def _with_retry(self, object_name, operation):
+        for attempt in range(self.max_retries):
+            try:
+                return operation()
+            except Exception as e:
+                if attempt == self.max_retries - 1 or not is_retryable(e):
+                    raise
+                incr("retries", operacao="upload",
+                     motivo=e.code if isinstance(e, S3Error) else type(e).__name__)
+                delay = BASE_DELAY * (2 ** attempt) + random.uniform(0, 1)
+                log_info(f"Upload de {object_name} falhou ({str(e)}). "
+                         f"Nova tentativa em {delay:.1f}s...")
+                time.sleep(delay)
+
+    def _remote_matches(self, object_name, sha256, md5):
+        """Consulta o objeto remoto e compara com o digest local"""
+        self.stats.add(head_requests=1)
+        try:
+            stat = self._with_retry(object_name, lambda: self.client.stat_object(
+                self.bucket_name, object_name))
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchObject", "ResourceNotFound"):
+                return False
+            raise
+        metadata = {k.lower(): v for k, v in (stat.metadata or {}).items()}
+        if metadata.get("x-amz-meta-sha256") == sha256:
+            return True
+        return md5 is not None and (stat.etag or "").strip('"') == md5
+
+    def _unchanged(self, object_name, sha256, md5, size):
+        """Verifica (índice local, depois remoto) se o objeto já está atualizado"""
+        index_key = f"{self.bucket_name}/{object_name}"
+        if (self.sync_index.get(index_key) == sha256
+                or self._remote_matches(object_name, sha256, md5)):
+            self.sync_index.set(index_key, sha256)
+            self.stats.add(skipped=1, bytes_saved=size)
+            incr("uploads_ignorados")
+            log_info(f"Sem alterações, upload ignorado: {object_name}")
+            return True
+        return False
+
+    def _uploaded(self, object_name, size, metadata=None):
+        if metadata:
+            self.sync_index.set(f"{self.bucket_name}/{object_name}", metadata["sha256"])
+        self.stats.add(puts=1, bytes_uploaded=size)
+        incr("bytes", size, direcao="upload")
+        log_info(f"Upload concluído: {object_name}")
+
+    def upload_file(self, file_path, object_name, content_type=None):
+        """Envia um arquivo de forma síncrona, com retry
+
+        Retorna False se o upload foi dispensado pelo sync incremental.
+        """
+        self.ensure_bucket()
+        file_path = Path(file_path)
+        content_type = content_type or content_type_for(file_path.name)
+        size = file_path.stat().st_size
+
+        metadata = None
+        if self.incremental:
+            sha256, md5 = file_digests(file_path)
+            metadata = {"sha256": sha256}
+            if self._unchanged(object_name, sha256, md5, size):
+                return False
+
+        log_info(f"Iniciando upload de {file_path.name}")
+        with span("upload", objeto=object_name, bytes=size):
+            self._with_retry(object_name, lambda: self.client.fput_object(
+                self.bucket_name, object_name, str(file_path),
+                content_type=content_type, metadata=metadata))
+        self._uploaded(object_name, size, metadata)
+        return True
+
+    def upload_bytes(self, object_name, data: bytes, content_type=None):
+        """Envia um conteúdo em memória, sem passar pelo disco"""
+        self.ensure_bucket()
+        content_type = content_type or content_type_for(object_name)
+
+        metadata = None
+        if self.incremental:
+            sha256, md5 = content_digests(data, object_name)
+            metadata = {"sha256": sha256}
+            if self._unchanged(object_name, sha256, md5, len(data)):
+                return False
+
+        log_info(f"Iniciando upload de {object_name}")
+        with span("upload", objeto=object_name, bytes=len(data)):
+            self._with_retry(object_name, lambda: self.client.put_object(
+                self.bucket_name, object_name, io.BytesIO(data), len(data),
+                content_type=content_type, metadata=metadata))
+        self._uploaded(object_name, len(data), metadata)
+        return True
+
+    def upload_stream(self, object_name, open_response, content_type=None):
+        """Envia o corpo de uma resposta HTTP direto para o Minio
+
+        `open_response` deve retornar um `requests.Response` aberto com
+        `stream=True`; é chamado de novo a cada tentativa. O corpo é enviado
+        em partes de até STREAM_PART_SIZE, sem ser carregado inteiro em
+        memória nem gravado em disco.
+        """
+        self.ensure_bucket()
+
+        def _put():
+            with open_response() as response:
+                response.raw.decode_content = True
+                length = int(response.headers.get("Content-Length") or -1)
+                if response.headers.get("Content-Encoding"):
+                    # O tamanho informado é o do corpo comprimido
+                    length = -1
+                reader = CountingReader(response.raw)
+                self.client.put_object(
+                    self.bucket_name, object_name, reader, length,
+                    content_type=content_type or response.headers.get("Content-Type")
+                    or content_type_for(object_name),
+                    part_size=STREAM_PART_SIZE)
+                return reader.bytes_read
+
+        log_info(f"Iniciando upload (stream) de {object_name}")
+        with span("upload_stream", objeto=object_name):
+            size = self._with_retry(object_name, _put)
+        incr("bytes", size, direcao="download")
+        self._uploaded(object_name, size)
+        return True
+
+    def _submit(self, fn, *args):
+        # Os uploads herdam o contexto de quem agendou (run_id das métricas)
+        return self._track(self._executor.submit(contextvars.copy_context().run, fn, *args))
+
+    def _track(self, future):
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._untrack)
+        return future
+
+    def _untrack(self, future):
+        with self._lock:
+            self._pending.discard(future)
+
+    def submit_file(self, file_path, object_name, content_type=None):
+        """Agenda o upload de um arquivo e retorna o Future"""
+        return self._submit(self.upload_file, file_path, object_name, content_type)
+
+    def submit_bytes(self, object_name, data: bytes, content_type=None):
+        """Agenda o upload de um conteúdo em memória"""
+        return self._submit(self.upload_bytes, object_name, data, content_type)
+
+    def submit_stream(self, object_name, open_response, content_type=None):
+        """Agenda o upload de uma resposta HTTP em stream"""
+        return self._submit(self.upload_stream, object_name, open_response, content_type)
+
+    def submit_task(self, fn, *args):
+        """Agenda uma tarefa que faz uploads (ex.: variantes da foto); `flush` também a aguarda"""
+        return self._submit(fn, *args)
+
+    def submit_directory(self, user_dir: Path, names=None):
+        """Agenda o upload dos arquivos do diretório do perfil
+
+        Sem `names`, envia todos os arquivos; com `names`, apenas esses, e os
+        Futures seguem a mesma ordem.
+        """
+        if names is None:
+            paths = [p for p in sorted(user_dir.glob('*')) if p.is_file()]
+        else:
+            paths = [user_dir / name for name in names]
+        return [self.submit_file(file_path, f"{user_dir.name}/{file_path.name}")
+                for file_path in paths]
+
+    def upload_directory(self, user_dir: Path, names=None):
+        """Envia o diretório do perfil (ou apenas `names`) e aguarda a conclusão"""
+        futures = self.submit_directory(user_dir, names)
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        for error in errors:
+            log_error(f"Erro no upload para Minio: {str(error)}")
+        self.sync_index.save()
+        return not errors
+
+    def flush(self, timeout=None):
+        """Aguarda todos os uploads pendentes e retorna os erros ocorridos"""
+        with self._lock:
+            pending = list(self._pending)
+        done, not_done = wait(pending, timeout=timeout)
+        errors = [f.exception() for f in done if f.exception() is not None]
+        if not_done:
+            log_error(f"{len(not_done)} uploads ainda pendentes após o timeout")
+        self.sync_index.save()
+        return errors
+
+    def report(self):
+        """Exibe e retorna o resumo de uploads da execução"""
+        stats = self.stats.as_dict()
+        log_info("Resumo do upload: " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+        return stats
+
+    def close(self):
+        """Aguarda os uploads pendentes e encerra o pool de threads"""
+        self.flush()
+        self._executor.shutdown(wait=True)
+
+_default_uploader = None
+_default_uploader_lock = threading.Lock()
+
+def get_uploader():
+    """Retorna o uploader compartilhado pelo processo"""
+    global _default_uploader
+    with _default_uploader_lock:
+        if _default_uploader is None:
+            _default_uploader = MinioUploader()
+        return _default_uploader
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# Configurações padrão (podem ser sobrescritas no .env)
+DEFAULT_PATH = "profile_cache.db"
+DEFAULT_TTL = 6 * 60 * 60
+DEFAULT_MAX_ENTRIES = 50000
+
+# Campos do perfil guardados no cache
+PROFILE_FIELDS = ("userid", "username", "full_name", "biography", "mediacount", "followers",
+                  "followees", "is_private", "is_verified", "profile_pic_url")
+
+def log_info(message):
+    print(f"[INFO] {message}")
+
+def log_error(message):
+    print(f"[ERROR] {message}")
+
+def profile_to_node(profile):
+    """Extrai do instaloader.Profile os campos guardados no cache"""
+    return {field: getattr(profile, field) for field in PROFILE_FIELDS}
+
+class CachedProfile:
+    """Perfil lido do cache, com os mesmos atributos usados de instaloader.Profile
+
+    `from_cache` indica se o perfil veio do cache (True) ou de uma consulta
+    feita agora pelo get_or_fetch (False).
+    """
+
+    def __init__(self, node, from_cache=True):
+        self._node = node
+        self.from_cache = from_cache
+
+    def __getattr__(self, name):
+        try:
+            return self._node[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def to_node(self):
+        return dict(self._node)
+
+class ProfileCache:
+    """Cache persistente (SQLite) de metadados de perfis
+
+    As entradas expiram após `ttl` segundos; quando o cache passa de
+    `max_entries`, os perfis acessados há mais tempo são removidos (LRU).
+    Perfis que falharam de forma definitiva (inexistentes, privados) ficam
+    numa tabela à parte, com TTL próprio, para não serem consultados de novo.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS profiles (
+                username TEXT PRIMARY KEY,
+                node TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_profiles_last_access "
+                           "ON profiles (last_access)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS negative (
+                username TEXT PRIMARY KEY,
+                failure TEXT NOT NULL,
+                error TEXT,
+                expires_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, username):
+        """Retorna o node do perfil se estiver no cache e dentro do TTL"""
+        username = username.lower()
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT node, fetched_at FROM profiles WHERE username = ?",
+                                     (username,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE profiles SET last_access = ? WHERE username = ?",
+                               (now, username))
+            self._conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, username, node):
+        """Grava o node do perfil e aplica o limite de entradas"""
+        username = username.lower()
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO profiles (username, node, fetched_at, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (username, json.dumps(node, ensure_ascii=False), now, now))
+            excess = self._conn.execute("SELECT COUNT(*) FROM profiles").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM profiles WHERE username IN "
+                    "(SELECT username FROM profiles ORDER BY last_access LIMIT ?)", (excess,))
+            self._conn.commit()
+
+    def invalidate(self, username):
+        with self._lock:
+            self._conn.execute("DELETE FROM profiles WHERE username = ?", (username.lower(),))
+            self._conn.commit()
+
+    def get_negative(self, username):
+        """Retorna (classe da falha, erro, expira_em) se o perfil está no cache negativo"""
+        with self._lock:
+            row = self._conn.execute("SELECT failure, error, expires_at FROM negative "
+                                     "WHERE username = ?", (username.lower(),)).fetchone()
+        if row is None or row[2] <= time.time():
+            return None
+        return row
+
+    def put_negative(self, username, failure, error, ttl):
+        """Marca o perfil como falha conhecida por `ttl` segundos"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO negative (username, failure, error, expires_at) "
+                "VALUES (?, ?, ?, ?)", (username.lower(), failure, error, time.time() + ttl))
+            self._conn.execute("DELETE FROM negative WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+
+    def remove_negative(self, username):
+        with self._lock:
+            self._conn.execute("DELETE FROM negative WHERE username = ?", (username.lower(),))
+            self._conn.commit()
+
+    def get_or_fetch(self, username, fetch):
+        """Retorna o perfil do cache ou chama `fetch()` (que retorna um Profile)
+
+        O CachedProfile retornado informa a origem em `from_cache`.
+        """
+        node = self.get(username)
+        if node is not None:
+            log_info(f"Perfil @{username} obtido do cache")
+            return CachedProfile(node)
+        node = profile_to_node(fetch())
+        self.put(username, node)
+        return CachedProfile(node, from_cache=False)
+
+    def stats(self):
+        """Retorna hits, misses, taxa de acerto e número de entradas"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+            negative = self._conn.execute("SELECT COUNT(*) FROM negative WHERE expires_at > ?",
+                                          (time.time(),)).fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "taxa_acerto": self.hits / total if total else 0.0,
+                "entradas": entries,
+                "negativos": negative,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_profile_cache():
+    """Retorna o cache compartilhado pelo processo (configurado pelo .env)"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ProfileCache(
+                path=os.getenv("PROFILE_CACHE_PATH", DEFAULT_PATH),
+                ttl=float(os.getenv("PROFILE_CACHE_TTL", DEFAULT_TTL)),
+                max_entries=int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)))
+        return _default_cache
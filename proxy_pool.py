@@ -0,0 +1,274 @@
+import os
+import sys
+import time
+import argparse
+import threading
+from urllib.parse import urlparse
+
+import requests
+from dotenv import load_dotenv
+
+from metrics import incr
+
+load_dotenv()
+
+# Arquivo com um proxy por linha (http://, https://, socks5://, socks5h://)
+DEFAULT_PROXY_FILE = "proxies.txt"
+
+SCHEMES = ("http", "https", "socks4", "socks4a", "socks5", "socks5h")
+
+# Falhas seguidas que tiram o proxy da rotação
+EJECT_AFTER = 3
+
+# Tempo fora da rotação; dobra a cada nova ejeção, até MAX_EJECT_SECONDS
+EJECT_SECONDS = 60
+MAX_EJECT_SECONDS = 60 * 60
+
+# Peso da última medição na média móvel de latência
+LATENCY_ALPHA = 0.3
+
+# Respostas que indicam problema no proxy (ou no IP de saída), não no pedido
+PROXY_FAILURE_STATUS = (403, 407, 429, 502, 503, 504)
+
+ACTIVE = "ativo"
+EJECTED = "ejetado"
+PROBATION = "observacao"
+
+def log_info(message):
+    print(f"[INFO] {message}")
+
+def log_error(message):
+    print(f"[ERROR] {message}")
+
+def proxy_label(url):
+    """host:porta do proxy, sem credenciais (usado em logs e métricas)"""
+    parsed = urlparse(url)
+    return f"{parsed.hostname}:{parsed.port}" if parsed.port else parsed.hostname
+
+def read_proxy_file(path):
+    """Lê os proxies do arquivo, ignorando linhas vazias e comentários"""
+    proxies = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            url = line.strip()
+            if not url or url.startswith("#"):
+                continue
+            if urlparse(url).scheme not in SCHEMES:
+                raise ValueError(f"Proxy inválido em {path}: {proxy_label(url)}")
+            proxies.append(url)
+    return proxies
+
+class Proxy:
+    """Estatísticas de um proxy do pool"""
+
+    def __init__(self, url):
+        self.url = url
+        self.label = proxy_label(url)
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency = None
+        self.in_flight = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.state = ACTIVE
+
+    def success_rate(self):
+        # Suavizado para proxies com poucas medições
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+    def score(self):
+        """Menor é melhor: latência ponderada pela carga e pela taxa de sucesso"""
+        if self.latency is None:
+            # Sem medições: recebe tráfego primeiro para ser avaliado
+            return self.in_flight
+        return self.latency * (1 + self.in_flight) / self.success_rate()
+
+class ProxyPool:
+    """Pool de proxies com escolha pela latência e ejeção automática
+
+    Cada requisição vai para o proxy ativo de menor score. Após
+    `eject_after` falhas seguidas, o proxy sai da rotação por um tempo que
+    dobra a cada ejeção; depois volta em observação, recebendo uma
+    requisição por vez até acertar de novo.
+    """
+
+    def __init__(self, urls, eject_after=EJECT_AFTER, eject_seconds=EJECT_SECONDS):
+        if not urls:
+            raise ValueError("Nenhum proxy configurado")
+        self.proxies = [Proxy(url) for url in urls]
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self._lock = threading.Lock()
+
+    def _usable(self, proxy, now):
+        if proxy.state == EJECTED and proxy.ejected_until <= now:
+            proxy.state = PROBATION
+            log_info(f"Proxy {proxy.label} em observação")
+        if proxy.state == PROBATION:
+            return proxy.in_flight == 0
+        return proxy.state == ACTIVE
+
+    def acquire(self, preferred=None):
+        """Escolhe o proxy (ou `preferred`, se ainda utilizável) e o marca em uso
+
+        Se todos estiverem ejetados, usa o que volta primeiro em vez de sair
+        sem proxy.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if preferred is not None and preferred.state == ACTIVE:
+                proxy = preferred
+            else:
+                usable = [p for p in self.proxies if self._usable(p, now)]
+                if usable:
+                    proxy = min(usable, key=Proxy.score)
+                else:
+                    proxy = min(self.proxies, key=lambda p: p.ejected_until)
+            proxy.in_flight += 1
+            return proxy
+
+    def report(self, proxy, ok, latency=None):
+        """Registra o resultado de uma requisição feita pelo proxy"""
+        with self._lock:
+            proxy.in_flight -= 1
+            if ok:
+                proxy.successes += 1
+                proxy.consecutive_failures = 0
+                if latency is not None:
+                    proxy.latency = (latency if proxy.latency is None else
+                                     LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * proxy.latency)
+                if proxy.state != ACTIVE:
+                    log_info(f"Proxy {proxy.label} de volta à rotação")
+                    proxy.state = ACTIVE
+                    proxy.ejections = 0
+            else:
+                proxy.failures += 1
+                proxy.consecutive_failures += 1
+                if proxy.state == PROBATION or (proxy.state == ACTIVE and
+                                                proxy.consecutive_failures >= self.eject_after):
+                    proxy.ejections += 1
+                    duration = min(MAX_EJECT_SECONDS,
+                                   self.eject_seconds * 2 ** (proxy.ejections - 1))
+                    proxy.ejected_until = time.monotonic() + duration
+                    proxy.state = EJECTED
+                    log_error(f"Proxy {proxy.label} fora de rotação por {duration:.0f}s")
+        incr("proxy_requests", proxy=proxy.label, resultado="ok" if ok else "falha")
+
+    def release(self, proxy):
+        """Libera o proxy sem registrar resultado (erro não relacionado ao proxy)"""
+        with self._lock:
+            proxy.in_flight -= 1
+
+    def status(self):
+        """Retorna o estado de cada proxy, do melhor para o pior"""
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                "proxy": p.label,
+                "estado": p.state,
+                "latencia_ms": round(p.latency * 1000, 1) if p.latency is not None else None,
+                "taxa_sucesso": round(p.successes / max(1, p.successes + p.failures), 3),
+                "requisicoes": p.successes + p.failures,
+                "em_uso": p.in_flight,
+                "ejetado_por": max(0.0, round(p.ejected_until - now)) if p.state == EJECTED else 0,
+            } for p in sorted(self.proxies, key=lambda p: (p.state != ACTIVE, p.score()))]
+
+class ProxyAdapter(requests.adapters.HTTPAdapter):
+    """Adapter do requests que envia cada requisição pelo proxy escolhido no pool
+
+    Com `sticky`, continua no mesmo proxy enquanto ele estiver ativo: uma
+    sessão logada trocando de IP a cada requisição chama a atenção do
+    Instagram. Como o Instaloader fecha a cópia da sessão após cada
+    consulta, close() não libera as conexões (ver session_pool.mount_adapter).
+    """
+
+    def __init__(self, pool, sticky=False, **kwargs):
+        super().__init__(**kwargs)
+        self.pool = pool
+        self.sticky = sticky
+        self._last = None
+
+    def send(self, request, **kwargs):
+        proxy = self.pool.acquire(self._last if self.sticky else None)
+        kwargs["proxies"] = {"http": proxy.url, "https": proxy.url}
+        start = time.monotonic()
+        try:
+            response = super().send(request, **kwargs)
+        except (requests.exceptions.ProxyError, requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout):
+            self.pool.report(proxy, False)
+            raise
+        except BaseException:
+            self.pool.release(proxy)
+            raise
+        ok = response.status_code not in PROXY_FAILURE_STATUS
+        self.pool.report(proxy, ok, time.monotonic() - start if ok else None)
+        self._last = proxy
+        return response
+
+    def close(self):
+        pass
+
+    def shutdown(self):
+        super().close()
+
+def attach_proxy_pool(loader, pool=None):
+    """Faz o contexto do Instaloader sair pelos proxies do pool (se configurado)"""
+    from session_pool import mount_adapter
+
+    pool = pool or get_proxy_pool()
+    if pool is None:
+        return None
+    sticky = os.getenv("PROXY_STICKY_SESSIONS", "1").lower() in ("1", "true", "sim")
+    adapter = ProxyAdapter(pool, sticky=sticky)
+    for prefix in ("https://", "http://"):
+        mount_adapter(loader.context, prefix, adapter)
+    return adapter
+
+_default_pool = None
+_default_pool_loaded = False
+_default_pool_lock = threading.Lock()
+
+def get_proxy_pool():
+    """Retorna o pool do arquivo PROXY_FILE (padrão proxies.txt), ou None se não houver"""
+    global _default_pool, _default_pool_loaded
+    with _default_pool_lock:
+        if not _default_pool_loaded:
+            _default_pool_loaded = True
+            path = os.getenv("PROXY_FILE", DEFAULT_PROXY_FILE)
+            if os.path.exists(path):
+                urls = read_proxy_file(path)
+                if urls:
+                    _default_pool = ProxyPool(urls)
+                    log_info(f"{len(urls)} proxies carregados de {path}")
+            elif os.getenv("PROXY_FILE"):
+                raise FileNotFoundError(f"Arquivo de proxies não encontrado: {path}")
+        return _default_pool
+
+def main():
+    parser = argparse.ArgumentParser(description='Testa os proxies configurados e mostra latência e estado')
+    parser.add_argument('--url', type=str, default='https://www.instagram.com/robots.txt',
+                      help='URL usada no teste de cada proxy')
+    parser.add_argument('--rounds', type=int, default=3, help='Requisições por proxy (padrão: 3)')
+    args = parser.parse_args()
+
+    pool = get_proxy_pool()
+    if pool is None:
+        log_error("Nenhum proxy configurado (PROXY_FILE ou proxies.txt)")
+        sys.exit(1)
+    session = requests.Session()
+    session.mount("https://", ProxyAdapter(pool))
+    session.mount("http://", ProxyAdapter(pool))
+    for _ in range(args.rounds * len(pool.proxies)):
+        try:
+            session.get(args.url, timeout=15).close()
+        except requests.exceptions.RequestException:
+            pass
+    for s in pool.status():
+        latency = f"{s['latencia_ms']:.0f} ms" if s["latencia_ms"] is not None else "-"
+        print(f"{s['proxy']:<30} {s['estado']:<11} {latency:>9}  "
+              f"sucesso={s['taxa_sucesso']:.0%} ({s['requisicoes']} req)")
+
+if __name__ == "__main__":
+    main()
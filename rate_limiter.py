@@ -0,0 +1,228 @@
+import os
+import time
+import threading
+from email.utils import parsedate_to_datetime
+
+import instaloader
+from instaloader.exceptions import TooManyRequestsException
+
+from metrics import incr
+
+# Orçamento padrão por conta e classe de endpoint: (requisições, janela em segundos).
+# Os valores seguem os limites usados internamente pelo Instaloader.
+DEFAULT_BUDGETS = {
+    "graphql": (200, 660),
+    "iphone": (199, 1800),
+    "other": (75, 660),
+    "cdn": (1000, 60),
+}
+
+# Espera aplicada após um 429 sem Retry-After; dobra a cada 429 seguido
+BASE_PENALTY = 60
+MAX_PENALTY = 30 * 60
+
+ANONYMOUS = "anonimo"
+
+def log_info(message):
+    print(f"[INFO] {message}")
+
+def log_error(message):
+    print(f"[ERROR] {message}")
+
+def load_budgets():
+    """Lê os orçamentos do .env (ex.: RATE_LIMIT_IPHONE=199/1800)"""
+    budgets = dict(DEFAULT_BUDGETS)
+    for endpoint in budgets:
+        value = os.getenv(f"RATE_LIMIT_{endpoint.upper()}")
+        if value:
+            count, _, window = value.partition("/")
+            budgets[endpoint] = (int(count), float(window or 60))
+    return budgets
+
+def endpoint_class(query_type):
+    """Mapeia o query_type do Instaloader para a classe de endpoint"""
+    if query_type in ("iphone", "other", "cdn"):
+        return query_type
+    # Demais tipos são query_hash/doc_id de consultas GraphQL
+    return "graphql"
+
+def is_rate_limited(exc):
+    """Indica se o erro (ou sua causa) é um 429 do Instagram ou do CDN"""
+    while exc is not None:
+        if isinstance(exc, TooManyRequestsException) or "429 too many requests" in str(exc).lower():
+            return True
+        # HTTPError do requests (ex.: open_picture) carrega a resposta
+        if getattr(getattr(exc, "response", None), "status_code", None) == 429:
+            return True
+        exc = exc.__cause__
+    return False
+
+def retry_after_seconds(source):
+    """Extrai o Retry-After (em segundos) de uma resposta HTTP ou exceção"""
+    while source is not None:
+        response = source if hasattr(source, "headers") else getattr(source, "response", None)
+        value = response.headers.get("Retry-After") if response is not None else None
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                try:
+                    return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    return None
+        source = getattr(source, "__cause__", None)
+    return None
+
+class TokenBucket:
+    """Token bucket com reserva: quem pede um token recebe o tempo a esperar"""
+
+    def __init__(self, capacity, window):
+        self.capacity = capacity
+        self.rate = capacity / window
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.penalty = 0.0
+        self.last_throttle = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now):
+        """Consome um token e retorna quantos segundos aguardar antes de usá-lo"""
+        self._refill(now)
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def time_until_ready(self, now):
+        """Segundos até haver um token disponível, sem consumi-lo"""
+        self._refill(now)
+        wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+        return max(wait, self.blocked_until - now)
+
+class RateLimiter:
+    """Limitador compartilhado por conta e classe de endpoint
+
+    Cada par (conta, endpoint) tem seu token bucket. Um 429 bloqueia o bucket
+    pelo tempo do Retry-After (ou por uma penalidade crescente, quando o
+    Instagram não informa) e o tempo gasto esperando fica registrado.
+    """
+
+    def __init__(self, budgets=None):
+        self.budgets = budgets or load_budgets()
+        self._buckets = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(*self.budgets[key[1]])
+            self._stats[key] = {"espera_total": 0.0, "esperas": 0, "bloqueios": 0}
+        return bucket
+
+    def _record_wait(self, key, wait):
+        if wait > 0:
+            stats = self._stats[key]
+            stats["espera_total"] += wait
+            stats["esperas"] += 1
+            incr("rate_limit_wait_seconds", wait, endpoint=key[1])
+
+    def acquire(self, account, endpoint):
+        """Aguarda o token para uma requisição e retorna o tempo esperado"""
+        key = (account or ANONYMOUS, endpoint)
+        with self._lock:
+            wait = self._bucket(key).reserve(time.monotonic())
+            self._record_wait(key, wait)
+        if wait > 0:
+            if wait > 15:
+                log_info(f"Rate limit de {key[0]}/{endpoint}: aguardando {wait:.0f}s")
+            time.sleep(wait)
+        return wait
+
+    def wait_until_ready(self, account, endpoint):
+        """Aguarda até o bucket aceitar requisições, sem consumir token"""
+        key = (account or ANONYMOUS, endpoint)
+        with self._lock:
+            wait = self._bucket(key).time_until_ready(time.monotonic())
+            self._record_wait(key, wait)
+        if wait > 0:
+            log_info(f"Rate limit de {key[0]}/{endpoint}: aguardando {wait:.0f}s")
+            time.sleep(wait)
+        return wait
+
+    def throttle(self, account, endpoint, retry_after=None):
+        """Registra um 429 e bloqueia o bucket pelo tempo necessário"""
+        key = (account or ANONYMOUS, endpoint)
+        with self._lock:
+            bucket = self._bucket(key)
+            now = time.monotonic()
+            if now - bucket.last_throttle > 2 * (bucket.penalty + BASE_PENALTY):
+                # Último 429 foi há bastante tempo: recomeça a penalidade
+                bucket.penalty = 0.0
+            bucket.last_throttle = now
+            if retry_after is None:
+                bucket.penalty = min(MAX_PENALTY, bucket.penalty * 2 or BASE_PENALTY)
+                retry_after = bucket.penalty
+            bucket.tokens = min(bucket.tokens, 0.0)
+            bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+            self._stats[key]["bloqueios"] += 1
+            incr("rate_limit_throttles", endpoint=endpoint)
+        log_error(f"429 recebido em {key[0]}/{endpoint}; pausando por {retry_after:.0f}s")
+
+    def success(self, account, endpoint):
+        """Zera a penalidade progressiva após uma requisição bem-sucedida"""
+        key = (account or ANONYMOUS, endpoint)
+        with self._lock:
+            if key in self._buckets:
+                self._buckets[key].penalty = 0.0
+
+    def stats(self):
+        """Retorna o tempo de espera e os bloqueios por conta/endpoint"""
+        with self._lock:
+            return {f"{account}/{endpoint}": dict(stats)
+                    for (account, endpoint), stats in self._stats.items()}
+
+    def total_wait(self):
+        with self._lock:
+            return sum(stats["espera_total"] for stats in self._stats.values())
+
+class TokenBucketRateController(instaloader.RateController):
+    """RateController do Instaloader que usa o RateLimiter compartilhado
+
+    O Instaloader não passa a resposta para handle_429; o Retry-After é lido
+    pelo hook que o AdapterContext (session_pool.py) instala nas sessões do
+    contexto. Sem o cabeçalho, vale a penalidade progressiva.
+
+    Uso: instaloader.Instaloader(rate_controller=TokenBucketRateController)
+    """
+
+    def __init__(self, context, limiter=None):
+        from session_pool import use_adapter_context
+
+        super().__init__(use_adapter_context(context))
+        self._limiter = limiter or get_rate_limiter()
+
+    def _account(self):
+        return self._context.username or ANONYMOUS
+
+    def wait_before_query(self, query_type):
+        self._limiter.acquire(self._account(), endpoint_class(query_type))
+
+    def handle_429(self, query_type):
+        # A próxima tentativa passa por wait_before_query, que respeita o bloqueio
+        self._limiter.throttle(self._account(), endpoint_class(query_type),
+                               self._context.pop_retry_after())
+
+_default_limiter = None
+_default_limiter_lock = threading.Lock()
+
+def get_rate_limiter():
+    """Retorna o limitador compartilhado pelo processo"""
+    global _default_limiter
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            _default_limiter = RateLimiter()
+        return _default_limiter
@@ -0,0 +1,341 @@
+import os
+import sys
+import time
+import signal
+import argparse
+import threading
+from datetime import datetime
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+import get_profile
+from get_profile import save_instagram_data, DEFAULT_WORKERS
+from session_pool import SessionPool, STRATEGIES
+from storage import get_storage
+from snapshots import get_snapshot_store, METRIC_FIELDS
+from profile_cache import get_profile_cache
+from rate_limiter import TokenBucket
+from failures import remember_failure
+from metrics import incr
+
+load_dotenv()
+
+# Limites do intervalo entre atualizações de um perfil (segundos). O máximo é
+# o SLA padrão: nenhum perfil fica mais tempo que isso sem ser atualizado
+DEFAULT_MIN_INTERVAL = 60 * 60
+DEFAULT_SLA = 7 * 24 * 60 * 60
+
+# Orçamento global de consultas de perfil por hora
+DEFAULT_BUDGET = 200
+
+# Período do histórico usado na estimativa da frequência de mudança (segundos)
+DEFAULT_LOOKBACK = 30 * 24 * 60 * 60
+
+# Estimativa inicial (uma mudança por dia), com o peso de uma observação: evita
+# que poucos snapshots levem a intervalos extremos
+PRIOR_CHANGES = 1.0
+PRIOR_SECONDS = 24 * 60 * 60
+
+# A fila de prioridades é recalculada pelo menos a cada REPLAN_INTERVAL segundos
+REPLAN_INTERVAL = 60
+
+Target = namedtuple("Target", ("username", "sla"))
+
+Entry = namedtuple("Entry", ("username", "rate", "interval", "last_refresh", "next_refresh",
+                             "sla", "priority", "status"))
+
+# Situação de cada perfil no plano, da mais para a menos urgente
+NEW = "novo"
+SLA_BREACHED = "sla_estourado"
+DUE = "vencido"
+FRESH = "em_dia"
+STATUS_ORDER = {NEW: 0, SLA_BREACHED: 1, DUE: 2, FRESH: 3}
+
+def log_info(message):
+    print(f"[INFO] {message}")
+
+def log_error(message):
+    print(f"[ERROR] {message}")
+
+def read_targets(source):
+    """Lê os perfis do arquivo: 'username [sla_em_horas]' por linha ('-' para a entrada padrão)"""
+    if source == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+
+    targets = {}
+    for number, line in enumerate(lines, 1):
+        fields = line.split()
+        if not fields or fields[0].startswith('#'):
+            continue
+        username = fields[0].lstrip('@')
+        try:
+            sla = float(fields[1]) * 3600 if len(fields) > 1 else None
+        except ValueError:
+            raise ValueError(f"SLA inválido na linha {number} de {source}: {fields[1]}")
+        targets.setdefault(username, Target(username, sla))
+    return list(targets.values())
+
+def count_changes(snapshots):
+    """Conta as mudanças (métricas, flags ou foto) entre snapshots consecutivos"""
+    changes = 0
+    for previous, current in zip(snapshots, snapshots[1:]):
+        if (current.picture_changed
+                or current.is_private != previous.is_private
+                or current.is_verified != previous.is_verified
+                or any(getattr(current, f) != getattr(previous, f) for f in METRIC_FIELDS)):
+            changes += 1
+    return changes
+
+class RefreshScheduler:
+    """Define quando cada perfil deve ser atualizado, pelo histórico de snapshots
+
+    A frequência de mudança do perfil (mudanças por segundo) é estimada
+    pelas diferenças entre os snapshots do período `lookback`, e o intervalo
+    até a próxima atualização é o tempo esperado até a próxima mudança,
+    limitado a [min_interval, sla]. Perfis que quase não mudam são
+    atualizados só pelo SLA; os que mudam sempre, a cada min_interval.
+
+    Entre os perfis vencidos, a prioridade é o número esperado de mudanças
+    ainda não coletadas (frequência x idade). Perfis sem histórico e os que
+    passaram do SLA vêm antes de todos os outros.
+    """
+
+    def __init__(self, store=None, min_interval=DEFAULT_MIN_INTERVAL, sla=DEFAULT_SLA,
+                 lookback=DEFAULT_LOOKBACK):
+        self.store = store or get_snapshot_store()
+        # Atualizações mais próximas que o intervalo mínimo do histórico não
+        # seriam gravadas e o perfil pareceria nunca ter sido atualizado
+        self.min_interval = max(min_interval, self.store.min_interval)
+        self.sla = sla
+        self.lookback = lookback
+        self._dispatched = {}
+        self._lock = threading.Lock()
+
+    def mark_dispatched(self, username, now=None):
+        """Registra o envio do perfil, para não reenviá-lo antes do próximo intervalo
+
+        Se a atualização falhar (nada é gravado no histórico), o perfil volta
+        ao plano depois do intervalo normal, sem ser reenviado a cada rodada.
+        """
+        with self._lock:
+            self._dispatched[username.lower()] = now or time.time()
+
+    def estimate(self, username, now=None):
+        """Retorna (mudanças por segundo, timestamp do último snapshot ou None)"""
+        now = now or time.time()
+        snapshots = self.store.history(username, start=now - self.lookback)
+        latest = snapshots[-1] if snapshots else self.store.latest(username)
+        if latest is None:
+            return None, None
+        changes = count_changes(snapshots)
+        observed = snapshots[-1].timestamp - snapshots[0].timestamp if snapshots else 0.0
+        return (changes + PRIOR_CHANGES) / (observed + PRIOR_SECONDS), latest.timestamp
+
+    def entry(self, target, now=None):
+        now = now or time.time()
+        sla = target.sla or self.sla
+        rate, last_refresh = self.estimate(target.username, now)
+        with self._lock:
+            dispatched = self._dispatched.get(target.username.lower())
+        if rate is None:
+            if dispatched is not None:
+                # Primeira coleta já enviada (ou falhou): tenta de novo após o intervalo mínimo
+                return Entry(target.username, None, self.min_interval, None,
+                             dispatched + self.min_interval, sla, 0.0,
+                             NEW if now >= dispatched + self.min_interval else FRESH)
+            return Entry(target.username, None, None, None, now, sla, float("inf"), NEW)
+
+        interval = min(sla, max(self.min_interval, 1 / rate))
+        reference = max(last_refresh, dispatched or 0.0)
+        next_refresh = reference + interval
+        age = now - last_refresh
+        if age >= sla and now >= reference + self.min_interval:
+            status, priority = SLA_BREACHED, age / sla
+        elif now >= next_refresh:
+            status, priority = DUE, rate * age
+        else:
+            status, priority = FRESH, rate * age
+        return Entry(target.username, rate, interval, last_refresh, next_refresh, sla,
+                     priority, status)
+
+    def plan(self, targets, now=None):
+        """Retorna as entradas de todos os perfis, da mais para a menos urgente"""
+        now = now or time.time()
+        entries = [self.entry(target, now) for target in targets]
+        entries.sort(key=lambda e: (STATUS_ORDER[e.status], -e.priority, e.next_refresh))
+        return entries
+
+def skip_negative(username):
+    """Indica se o perfil está no cache negativo (não gasta orçamento com ele)"""
+    entry = get_profile_cache().get_negative(username)
+    if entry is None:
+        return False
+    incr("perfis_ignorados", motivo=entry[0])
+    return True
+
+def run_scheduler(scheduler, targets, dispatch, budget=DEFAULT_BUDGET, stop=None, once=False):
+    """Envia os perfis vencidos para `dispatch(username)` em ordem de prioridade
+
+    Cada envio consome uma consulta do orçamento global (`budget` por hora,
+    com rajada de até um décimo disso). Enquanto espera pelo orçamento, o
+    plano é refeito a cada REPLAN_INTERVAL segundos, de modo que um perfil
+    que vence nesse meio tempo passa à frente dos menos urgentes. Com `once`,
+    encerra quando não houver mais perfis vencidos. Retorna quantos perfis
+    foram enviados.
+    """
+    stop = stop or threading.Event()
+    bucket = TokenBucket(max(1, budget / 10), 3600 / 10)
+    sent = 0
+    while not stop.is_set():
+        now = time.time()
+        entries = scheduler.plan(targets, now)
+        due = [e for e in entries if e.status != FRESH]
+        if not due:
+            if once:
+                break
+            upcoming = min((e.next_refresh for e in entries), default=now + REPLAN_INTERVAL)
+            stop.wait(min(REPLAN_INTERVAL, max(1.0, upcoming - now)))
+            continue
+
+        replan_at = time.monotonic() + REPLAN_INTERVAL
+        for entry in due:
+            if stop.is_set():
+                break
+            if skip_negative(entry.username):
+                scheduler.mark_dispatched(entry.username)
+                continue
+            wait = bucket.time_until_ready(time.monotonic())
+            if wait > 0:
+                if time.monotonic() + wait > replan_at:
+                    stop.wait(max(0.0, replan_at - time.monotonic()))
+                    break
+                stop.wait(wait)
+                if stop.is_set():
+                    break
+            bucket.reserve(time.monotonic())
+            scheduler.mark_dispatched(entry.username)
+            incr("agendador", situacao=entry.status)
+            dispatch(entry.username)
+            sent += 1
+    return sent
+
+def refresh_profile(username, pool, uploader, diskless=False):
+    """Atualiza o perfil no Instagram (sem passar pelo cache local de perfis)"""
+    try:
+        with pool.session() as loader:
+            save_instagram_data(username, loader=loader, uploader=uploader,
+                                wait_upload=False, diskless=diskless)
+    except Exception as e:
+        remember_failure(username, e)
+        log_error(f"Falha ao atualizar @{username}: {str(e)}")
+
+def _format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M") if timestamp else "-"
+
+def print_plan(entries):
+    print(f"{'perfil':<30} {'situação':<14} {'mud./dia':>8} {'intervalo':>10} "
+          f"{'última':>16} {'próxima':>16}")
+    for e in entries:
+        rate = f"{e.rate * 86400:.2f}" if e.rate is not None else "-"
+        interval = f"{e.interval / 3600:.1f}h" if e.interval is not None else "-"
+        print(f"@{e.username:<29} {e.status:<14} {rate:>8} {interval:>10} "
+              f"{_format_time(e.last_refresh):>16} {_format_time(e.next_refresh):>16}")
+    counts = {status: sum(1 for e in entries if e.status == status) for status in STATUS_ORDER}
+    print("\n" + " | ".join(f"{status}: {count}" for status, count in counts.items()))
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Atualiza os perfis conforme a frequência com que mudam, dentro de um orçamento de consultas')
+    parser.add_argument('--usernames-file', type=str,
+                      help="Arquivo com 'username [sla_em_horas]' por linha "
+                           "(padrão: todos os perfis com histórico)")
+    parser.add_argument('--budget', type=float,
+                      default=float(os.getenv("SCHEDULER_BUDGET", DEFAULT_BUDGET)),
+                      help=f'Consultas de perfil por hora, somando todas as contas (padrão: {DEFAULT_BUDGET})')
+    parser.add_argument('--sla', type=float,
+                      default=float(os.getenv("SCHEDULER_SLA", DEFAULT_SLA)) / 3600,
+                      help=f'Idade máxima (horas) dos dados de um perfil (padrão: {DEFAULT_SLA // 3600})')
+    parser.add_argument('--min-interval', type=float,
+                      default=float(os.getenv("SCHEDULER_MIN_INTERVAL", DEFAULT_MIN_INTERVAL)) / 3600,
+                      help=f'Intervalo mínimo (horas) entre atualizações (padrão: {DEFAULT_MIN_INTERVAL // 3600})')
+    parser.add_argument('--plan', action='store_true',
+                      help='Só mostra o plano de atualização, sem consultar o Instagram')
+    parser.add_argument('--once', action='store_true',
+                      help='Encerra quando não houver mais perfis vencidos')
+    parser.add_argument('--queue', type=str,
+                      help='Envia os perfis vencidos para a fila de jobs (worker.py) em vez de coletá-los aqui')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                      help=f'Perfis coletados em paralelo (padrão: {DEFAULT_WORKERS})')
+    parser.add_argument('--diskless', action='store_true',
+                      help='Envia JSON e foto direto ao Minio, sem gravar em dados/')
+    parser.add_argument('--session-strategy', choices=STRATEGIES, default='round_robin',
+                      help='Rotação entre as contas de INSTAGRAM_USERNAMES')
+    args = parser.parse_args()
+
+    if not get_profile.SAVE_HISTORY:
+        log_error("O agendador depende do histórico de snapshots (SAVE_HISTORY)")
+        sys.exit(1)
+    scheduler = RefreshScheduler(min_interval=args.min_interval * 3600, sla=args.sla * 3600)
+    if args.usernames_file:
+        targets = read_targets(args.usernames_file)
+    else:
+        targets = [Target(username, None) for username in scheduler.store.usernames()]
+    if not targets:
+        log_error("Nenhum perfil para agendar")
+        sys.exit(1)
+
+    if args.plan:
+        print_plan(scheduler.plan(targets))
+        return
+
+    stop = threading.Event()
+
+    def _shutdown(signum, frame):
+        log_info("Encerrando após os perfis em andamento...")
+        stop.set()
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    log_info(f"Agendando {len(targets)} perfis com orçamento de {args.budget:.0f} consultas/hora")
+    if args.queue:
+        from job_queue import open_queue
+
+        queue = open_queue(args.queue)
+        cache = get_profile_cache()
+
+        def _enqueue(username):
+            # Os workers leem pelo cache de perfis (mesmo PROFILE_CACHE_PATH, já
+            # que a fila é local): sem a entrada, o job consulta o Instagram em
+            # vez de gravar no histórico os dados de até PROFILE_CACHE_TTL atrás
+            cache.invalidate(username)
+            queue.enqueue([username])
+        sent = run_scheduler(scheduler, targets, _enqueue, args.budget, stop, args.once)
+        log_info(f"{sent} perfis enviados para a fila")
+        return
+
+    # O agendador decide quando consultar: o cache de perfis só atrasaria a atualização
+    get_profile.USE_PROFILE_CACHE = False
+    pool = SessionPool(strategy=args.session_strategy)
+    uploader = get_storage() if get_profile.UPLOAD_TO_MINIO else None
+    # Não envia mais perfis do que há workers livres
+    slots = threading.Semaphore(max(1, args.workers))
+
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        def _dispatch(username):
+            slots.acquire()
+            future = executor.submit(refresh_profile, username, pool, uploader, args.diskless)
+            future.add_done_callback(lambda f: slots.release())
+        sent = run_scheduler(scheduler, targets, _dispatch, args.budget, stop, args.once)
+
+    if uploader:
+        uploader.flush()
+        uploader.report()
+    log_info(f"{sent} perfis atualizados")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import os
+import re
+import sys
+import time
+import argparse
+import threading
+from datetime import datetime
+from collections import namedtuple
+
+from dotenv import load_dotenv
+from instaloader.exceptions import (
+    AbortDownloadException,
+    ConnectionException,
+    LoginRequiredException,
+    TooManyRequestsException,
+)
+
+from session_pool import SessionPool, session_file_for
+from proxy_pool import attach_proxy_pool
+from metrics import span, incr
+
+load_dotenv()
+
+# Intervalo (segundos) entre verificações de todas as sessões
+DEFAULT_INTERVAL = 10 * 60
+
+# Tempo fora da rotação para uma sessão que recebeu 429 na verificação
+RATE_LIMIT_COOLDOWN = 5 * 60
+
+# Consulta GraphQL usada pelo próprio Instaloader em test_login: retorna o
+# usuário logado, ou null se a sessão não vale mais
+LOGIN_QUERY_HASH = "d6f4427fbe92d846298cf93df0b937d3"
+
+CHALLENGE_MARKERS = ("checkpoint", "challenge", "feedback_required")
+
+# Redirect ao login numa sessão logada: o Instagram deslogou a conta
+EXPIRED_MARKERS = ("redirected to login", "logged out", "login_required")
+
+OK = "ok"
+EXPIRED = "expirada"
+CHALLENGED = "desafio"
+RATE_LIMITED = "limitada"
+ERROR = "erro"
+
+# Estados que tiram a sessão da rotação; erros de rede não dizem nada sobre a sessão
+UNUSABLE = (EXPIRED, CHALLENGED)
+
+HealthResult = namedtuple("HealthResult", ("username", "status", "latencia_ms", "verificada_em",
+                                           "erro"))
+
+def log_info(message):
+    print(f"[INFO] {message}")
+
+def log_error(message):
+    print(f"[ERROR] {message}")
+
+def probe_session(loader):
+    """Retorna o usuário logado na sessão do loader (None se a sessão expirou)"""
+    data = loader.context.graphql_query(LOGIN_QUERY_HASH, {})
+    user = data["data"]["user"]
+    return user["username"] if user else None
+
+def classify_error(exc):
+    if isinstance(exc, TooManyRequestsException):
+        return RATE_LIMITED
+    if any(marker in str(exc).lower() for marker in CHALLENGE_MARKERS):
+        return CHALLENGED
+    if isinstance(exc, LoginRequiredException):
+        return EXPIRED
+    if (isinstance(exc, AbortDownloadException)
+            and any(marker in str(exc).lower() for marker in EXPIRED_MARKERS)):
+        return EXPIRED
+    return ERROR
+
+def check_session(pooled, probe=probe_session):
+    """Valida a sessão com uma chamada autenticada barata e mede a latência"""
+    start = time.monotonic()
+    error = None
+    try:
+        with span("verificacao_sessao", conta=pooled.username):
+            logged_user = probe(pooled.loader)
+        if logged_user is None:
+            status = EXPIRED
+        elif logged_user.lower() != pooled.username.lower():
+            status, error = EXPIRED, f"sessão pertence a {logged_user}"
+        else:
+            status = OK
+    except (ConnectionException, AbortDownloadException, KeyError, TypeError) as e:
+        status, error = classify_error(e), str(e)
+    latency = (time.monotonic() - start) * 1000
+    incr("verificacoes_sessao", conta=pooled.username, status=status)
+    return HealthResult(pooled.username, status, round(latency, 1),
+                        datetime.now().isoformat(timespec="seconds"), error)
+
+def password_for(username):
+    """Senha da conta no .env: INSTAGRAM_PASSWORD_<CONTA> ou INSTAGRAM_PASSWORD (conta principal)"""
+    key = "INSTAGRAM_PASSWORD_" + re.sub(r"\W", "_", username).upper()
+    if os.getenv(key):
+        return os.getenv(key)
+    if username == os.getenv("INSTAGRAM_USERNAME"):
+        return os.getenv("INSTAGRAM_PASSWORD")
+    return None
+
+class SessionHealthChecker:
+    """Verifica periodicamente todas as sessões do pool em segundo plano
+
+    Sessões expiradas ou em desafio são marcadas como inválidas no pool antes
+    de receberem trabalho; com 429, a sessão só fica em cooldown. Com
+    `refresh`, tenta renovar as inválidas: recarrega o arquivo de sessão se
+    ele foi atualizado (ex.: save_cookies.py rodou de novo) e, para sessões
+    expiradas com senha no .env, faz login e salva a nova sessão.
+    """
+
+    def __init__(self, pool, interval=DEFAULT_INTERVAL, refresh=False, probe=probe_session):
+        self.pool = pool
+        self.interval = interval
+        self.refresh = refresh
+        self.probe = probe
+        self._loaded_at = {s.username: self._file_mtime(s.username) for s in pool.sessions}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="session-health")
+
+    def _file_mtime(self, username):
+        session_file = session_file_for(username)
+        return os.path.getmtime(session_file) if session_file else None
+
+    def _refresh(self, pooled, result):
+        """Tenta renovar a sessão; retorna True se algo foi recarregado
+
+        Deve ser chamado com a sessão retirada do pool (SessionPool.checkout).
+        """
+        session_file = session_file_for(pooled.username)
+        mtime = self._file_mtime(pooled.username)
+        if session_file and mtime != self._loaded_at.get(pooled.username):
+            pooled.loader.load_session_from_file(pooled.username, session_file)
+            # Carregar a sessão cria um novo requests.Session, sem os proxies
+            attach_proxy_pool(pooled.loader)
+            self._loaded_at[pooled.username] = mtime
+            log_info(f"Sessão de {pooled.username} recarregada de {session_file}")
+            return True
+        password = password_for(pooled.username)
+        if result.status == EXPIRED and password:
+            # Sessões em desafio não fazem login de novo: outra tentativa agrava o bloqueio
+            session_file = f"{pooled.username}_session"
+            pooled.loader.login(pooled.username, password)
+            pooled.loader.save_session_to_file(session_file)
+            attach_proxy_pool(pooled.loader)
+            self._loaded_at[pooled.username] = self._file_mtime(pooled.username)
+            log_info(f"Novo login de {pooled.username}; sessão salva em {session_file}")
+            return True
+        return False
+
+    def check(self, pooled):
+        result = check_session(pooled, self.probe)
+        if result.status in UNUSABLE and self.refresh:
+            try:
+                with self.pool.checkout(pooled):
+                    refreshed = self._refresh(pooled, result)
+                if refreshed:
+                    result = check_session(pooled, self.probe)
+            except Exception as e:
+                log_error(f"Erro ao renovar sessão de {pooled.username}: {str(e)}")
+        if result.status != ERROR:
+            self.pool.set_health(pooled, result, usable=result.status not in UNUSABLE,
+                                 cooldown=RATE_LIMIT_COOLDOWN if result.status == RATE_LIMITED
+                                 else None)
+        else:
+            log_error(f"Não foi possível verificar a sessão de {pooled.username}: {result.erro}")
+        return result
+
+    def check_all(self):
+        """Verifica todas as sessões agora e retorna os resultados
+
+        Um erro inesperado numa conta não interrompe a verificação das demais.
+        """
+        results = []
+        for pooled in self.pool.sessions:
+            try:
+                results.append(self.check(pooled))
+            except Exception as e:
+                log_error(f"Erro ao verificar a sessão de {pooled.username}: {str(e)}")
+                results.append(HealthResult(pooled.username, ERROR, 0.0,
+                                            datetime.now().isoformat(timespec="seconds"), str(e)))
+        return results
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check_all()
+            except Exception as e:
+                log_error(f"Erro na verificação das sessões: {str(e)}")
+
+    def start(self, check_now=True):
+        """Inicia as verificações periódicas (a primeira imediatamente, se `check_now`)"""
+        if check_now:
+            self.check_all()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+def start_health_checker(pool):
+    """Inicia o verificador com SESSION_HEALTH_INTERVAL (0 desliga) e SESSION_HEALTH_REFRESH"""
+    interval = float(os.getenv("SESSION_HEALTH_INTERVAL", DEFAULT_INTERVAL))
+    if interval <= 0:
+        return None
+    refresh = os.getenv("SESSION_HEALTH_REFRESH", "").lower() in ("1", "true", "sim")
+    return SessionHealthChecker(pool, interval, refresh).start()
+
+def print_results(results):
+    for r in sorted(results, key=lambda r: (r.status != OK, r.latencia_ms)):
+        detail = f" ({r.erro})" if r.erro else ""
+        print(f"{r.username:<30} {r.status:<10} {r.latencia_ms:>8.0f} ms{detail}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Verifica a validade e a latência das sessões salvas')
+    parser.add_argument('--watch', type=float, metavar='SEGUNDOS',
+                      help='Repete a verificação a cada SEGUNDOS')
+    parser.add_argument('--refresh', action='store_true',
+                      help='Tenta renovar sessões expiradas (arquivo atualizado ou login com senha do .env)')
+    args = parser.parse_args()
+
+    pool = SessionPool()
+    checker = SessionHealthChecker(pool, refresh=args.refresh)
+    while True:
+        results = checker.check_all()
+        print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S}")
+        print_results(results)
+        if not args.watch:
+            break
+        time.sleep(args.watch)
+
+    if not any(r.status == OK for r in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+import instaloader
+from instaloader.exceptions import (
+    AbortDownloadException,
+    ConnectionException,
+    LoginRequiredException,
+    QueryReturnedBadRequestException,
+    TooManyRequestsException,
+)
+
+from rate_limiter import TokenBucketRateController, retry_after_seconds
+from proxy_pool import attach_proxy_pool
+
+# Tempo (em segundos) que uma sessão fica fora da rotação após ser bloqueada
+DEFAULT_COOLDOWN = 15 * 60
+
+STRATEGIES = ("round_robin", "lru")
+
+# Trechos de mensagens do Instaloader que indicam bloqueio da conta
+BLOCKING_MARKERS = ("401", "429", "too many requests", "checkpoint", "challenge",
+                    "login_required", "redirected to login")
+
+def log_info(message):
+    print(f"[INFO] {message}")
+
+def log_error(message):
+    print(f"[ERROR] {message}")
+
+class NoSessionAvailable(Exception):
+    """Nenhuma sessão do pool está disponível no momento"""
+
+def configured_usernames():
+    """Retorna as contas configuradas no .env
+
+    INSTAGRAM_USERNAMES aceita várias contas separadas por vírgula; sem ela,
+    usa apenas INSTAGRAM_USERNAME.
+    """
+    raw = os.getenv("INSTAGRAM_USERNAMES") or os.getenv("INSTAGRAM_USERNAME") or ""
+    return [u.strip().lstrip('@') for u in raw.split(",") if u.strip()]
+
+def session_file_for(username):
+    """Retorna o arquivo de sessão salvo pelo save_cookies.py, se existir"""
+    session_file = f"{username}_session"
+    return session_file if os.path.exists(session_file) else None
+
+def load_loader(username):
+    """Cria um Instaloader com a sessão da conta informada"""
+    L = instaloader.Instaloader(rate_controller=TokenBucketRateController)
+    L.load_session_from_file(username, session_file_for(username))
+    attach_proxy_pool(L)
+    return L
+
+class AdapterContext(instaloader.InstaloaderContext):
+    """InstaloaderContext que usa os adapters do projeto em todas as consultas
+
+    O Instaloader faz cada consulta à API numa cópia nova da sessão
+    (copy_session), que não herda adapters nem hooks. Aqui os adapters do
+    contexto e o hook que guarda o Retry-After dos 429 são montados na
+    sessão recebida por get_json antes de cada consulta. Só os contextos
+    do projeto (ver use_adapter_context) usam esta classe.
+    """
+
+    def _prepare_session(self, session):
+        for prefix, adapter in self.extra_adapters.items():
+            if session.adapters.get(prefix) is not adapter:
+                session.mount(prefix, adapter)
+        if self._record_429 not in session.hooks["response"]:
+            session.hooks["response"].append(self._record_429)
+
+    def _record_429(self, response, *args, **kwargs):
+        if response.status_code == 429:
+            self._last_429.retry_after = retry_after_seconds(response)
+
+    def pop_retry_after(self):
+        """Retry-After (segundos) do último 429 recebido nesta thread, ou None"""
+        retry_after = getattr(self._last_429, "retry_after", None)
+        self._last_429.retry_after = None
+        return retry_after
+
+    def get_json(self, *args, **kwargs):
+        session = kwargs.get("session") or (args[3] if len(args) > 3 else None)
+        self._prepare_session(session or self._session)
+        return super().get_json(*args, **kwargs)
+
+def use_adapter_context(context):
+    """Converte o contexto do Instaloader em AdapterContext (uma única vez)"""
+    if not isinstance(context, AdapterContext):
+        context.__class__ = AdapterContext
+        context.extra_adapters = {}
+        context._last_429 = threading.local()
+    return context
+
+def mount_adapter(context, prefix, adapter):
+    """Monta um adapter do requests nas consultas do contexto do Instaloader
+
+    O adapter vale para a sessão atual, para as cópias que o Instaloader faz
+    a cada consulta e para sessões carregadas depois (ver AdapterContext).
+    Como as cópias são fechadas após cada consulta, o adapter não deve
+    liberar o pool de conexões em close().
+    """
+    use_adapter_context(context)
+    context.extra_adapters[prefix] = adapter
+    context._session.mount(prefix, adapter)
+
+def is_blocking_error(exc):
+    """Indica se o erro sinaliza 401/429/checkpoint para a conta em uso"""
+    while exc is not None:
+        if isinstance(exc, (TooManyRequestsException, LoginRequiredException,
+                            QueryReturnedBadRequestException)):
+            return True
+        # AbortDownloadException: checkpoint/desafio ou sessão deslogada (redirect ao login)
+        if isinstance(exc, (ConnectionException, AbortDownloadException)):
+            message = str(exc).lower()
+            if any(marker in message for marker in BLOCKING_MARKERS):
+                return True
+        exc = exc.__cause__
+    return False
+
+class PooledSession:
+    """Sessão do Instagram gerenciada pelo pool"""
+
+    def __init__(self, username, loader):
+        self.username = username
+        self.loader = loader
+        self.last_used = 0.0
+        self.uses = 0
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self.reason = None
+        # Resultado da última verificação (session_health.py); sessões
+        # expiradas ou em desafio ficam fora da rotação até passarem de novo
+        self.healthy = True
+        self.health = None
+        # Usos em andamento (SessionPool.session) e renovação em curso (checkout)
+        self.in_use = 0
+        self.refreshing = False
+
+    def available(self, now):
+        return self.healthy and not self.refreshing and self.cooldown_until <= now
+
+class SessionPool:
+    """Pool de sessões do Instagram com rotação entre contas
+
+    Entrega os contextos em round-robin ou pela sessão usada há mais tempo
+    (lru). Sessões que recebem 401/429/checkpoint saem da rotação e voltam
+    automaticamente após o cooldown.
+    """
+
+    def __init__(self, usernames=None, strategy="round_robin", cooldown=DEFAULT_COOLDOWN,
+                 loader_factory=load_loader):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Estratégia inválida: {strategy}")
+        self.strategy = strategy
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        # Avisa quem espera por uma sessão quando uma volta para a rotação
+        self._changed = threading.Condition(self._lock)
+        self._next = 0
+        self.sessions = []
+
+        for username in usernames if usernames is not None else configured_usernames():
+            try:
+                self.sessions.append(PooledSession(username, loader_factory(username)))
+                log_info(f"Sessão de {username} adicionada ao pool")
+            except Exception as e:
+                log_error(f"Erro ao carregar sessão de {username}: {str(e)}")
+
+        if not self.sessions:
+            raise NoSessionAvailable("Nenhuma sessão do Instagram pôde ser carregada")
+
+    def _pick(self, now):
+        available = [s for s in self.sessions if s.available(now)]
+        if not available:
+            return None
+        if self.strategy == "lru":
+            return min(available, key=lambda s: s.last_used)
+
+        for _ in range(len(self.sessions)):
+            session = self.sessions[self._next % len(self.sessions)]
+            self._next += 1
+            if session.available(now):
+                return session
+        return None
+
+    def acquire(self, timeout=None, hold=False):
+        """Retorna a próxima sessão disponível
+
+        Se todas estiverem em cooldown ou em renovação, aguarda a primeira
+        voltar, até `timeout` segundos (None espera indefinidamente). Com
+        `hold=True` a sessão conta como em uso até `release`.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                session = self._pick(now)
+                if session:
+                    if session.reason:
+                        log_info(f"Sessão de {session.username} voltou para a rotação")
+                        session.reason = None
+                    session.last_used = now
+                    session.uses += 1
+                    if hold:
+                        session.in_use += 1
+                    return session
+                healthy = [s for s in self.sessions if s.healthy]
+                if not healthy:
+                    raise NoSessionAvailable("Nenhuma sessão válida; renove-as com save_cookies.py")
+                # Sessões em renovação voltam quando o checkout termina (notify)
+                cooldowns = [s.cooldown_until for s in healthy if not s.refreshing]
+                wait = min(cooldowns) - now if cooldowns else None
+
+                if deadline is not None:
+                    wait = min(wait, deadline - now) if wait is not None else deadline - now
+                    if wait <= 0:
+                        raise NoSessionAvailable("Todas as sessões estão em cooldown ou em renovação")
+                if not cooldowns:
+                    log_info("Todas as sessões em renovação. Aguardando...")
+                else:
+                    log_info(f"Todas as sessões em cooldown. Aguardando {wait:.0f}s...")
+                self._changed.wait(wait)
+
+    def release(self, session):
+        """Devolve uma sessão obtida com acquire(hold=True)"""
+        with self._lock:
+            session.in_use -= 1
+            self._changed.notify_all()
+
+    @contextmanager
+    def checkout(self, session):
+        """Tira a sessão da rotação e espera os usos em andamento terminarem
+
+        Usado para renovar a sessão (session_health.py) sem que outra thread
+        use o loader durante a troca. A sessão volta à rotação ao sair.
+        """
+        with self._lock:
+            while session.refreshing:
+                self._changed.wait()
+            session.refreshing = True
+            while session.in_use:
+                self._changed.wait()
+        try:
+            yield session.loader
+        finally:
+            with self._lock:
+                session.refreshing = False
+                self._changed.notify_all()
+
+    def report_failure(self, session, exc):
+        """Registra a falha e tira a sessão de rotação se a conta foi bloqueada"""
+        with self._lock:
+            session.failures += 1
+            if is_blocking_error(exc):
+                session.cooldown_until = time.monotonic() + self.cooldown
+                session.reason = str(exc)
+                log_error(f"Sessão de {session.username} fora de rotação por "
+                          f"{self.cooldown:.0f}s: {str(exc)}")
+
+    def set_health(self, session, result, usable, cooldown=None):
+        """Registra o resultado da verificação de saúde da sessão
+
+        Sessões não utilizáveis saem da rotação até uma verificação passar;
+        com `cooldown`, a sessão continua válida mas fica fora por esse tempo.
+        """
+        with self._lock:
+            session.health = result
+            if usable and not session.healthy:
+                log_info(f"Sessão de {session.username} válida novamente")
+                session.reason = None
+            elif not usable and session.healthy:
+                log_error(f"Sessão de {session.username} fora de rotação: {result.status}")
+                session.reason = result.erro or result.status
+            session.healthy = usable
+            if cooldown:
+                session.cooldown_until = max(session.cooldown_until, time.monotonic() + cooldown)
+            self._changed.notify_all()
+
+    @contextmanager
+    def session(self, timeout=None):
+        """Context manager que entrega o loader e trata falhas de bloqueio"""
+        pooled = self.acquire(timeout, hold=True)
+        try:
+            yield pooled.loader
+        except Exception as e:
+            self.report_failure(pooled, e)
+            raise
+        finally:
+            self.release(pooled)
+
+    def status(self):
+        """Retorna o estado de cada sessão do pool"""
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                "username": s.username,
+                "disponivel": s.available(now),
+                "cooldown_restante": max(0.0, s.cooldown_until - now),
+                "usos": s.uses,
+                "falhas": s.failures,
+                "motivo": s.reason,
+                "saudavel": s.healthy,
+                "em_uso": s.in_use,
+                "renovando": s.refreshing,
+                "verificacao": s.health._asdict() if s.health else None,
+            } for s in self.sessions]
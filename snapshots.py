@@ -0,0 +1,285 @@
+import os
+import sys
+import time
+import fcntl
+import struct
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime
+from collections import namedtuple
+from urllib.parse import urlparse
+
+# Histórico de snapshots: um arquivo binário por perfil, só com anexação.
+# Cabeçalho: assinatura, tamanho do registro, digest da última foto enviada e
+# digest da foto do último registro.
+# Registro (21 bytes): timestamp, seguidores, seguindo, posts e flags.
+DEFAULT_DIR = Path("dados") / ".historico"
+MAGIC = b"IGS2"
+HEADER = struct.Struct("<4sH20s20s")
+RECORD = struct.Struct("<dIIIB")
+MAX_COUNT = 2 ** 32 - 1
+
+FLAG_PRIVATE = 1
+FLAG_VERIFIED = 2
+FLAG_PICTURE_CHANGED = 4
+
+# Snapshots idênticos ao anterior dentro deste intervalo (segundos) não são gravados
+DEFAULT_MIN_INTERVAL = 60 * 60
+
+METRIC_FIELDS = ("followers", "following", "mediacount")
+
+Snapshot = namedtuple("Snapshot", ("timestamp", "followers", "following", "mediacount",
+                                   "is_private", "is_verified", "picture_changed"))
+
+def log_info(message):
+    print(f"[INFO] {message}")
+
+def log_error(message):
+    print(f"[ERROR] {message}")
+
+def picture_identity(url):
+    """Identifica a foto pelo nome do arquivo na URL do CDN
+
+    Os parâmetros da URL (assinatura, expiração, servidor) mudam a cada
+    consulta, mas o nome do arquivo só muda quando a foto é trocada.
+    """
+    if not url:
+        return None
+    return Path(urlparse(url).path).name or url
+
+def picture_digest(url):
+    identity = picture_identity(url)
+    return hashlib.sha1(identity.encode("utf-8")).digest() if identity else bytes(20)
+
+def _count(value):
+    return min(max(int(value or 0), 0), MAX_COUNT)
+
+def _unpack(data):
+    timestamp, followers, following, mediacount, flags = RECORD.unpack(data)
+    return Snapshot(timestamp, followers, following, mediacount, bool(flags & FLAG_PRIVATE),
+                    bool(flags & FLAG_VERIFIED), bool(flags & FLAG_PICTURE_CHANGED))
+
+class SnapshotStore:
+    """Histórico compacto das métricas de cada perfil
+
+    Cada coleta vira um registro de tamanho fixo anexado ao arquivo do
+    perfil; consultas por período fazem busca binária pelo timestamp e leem
+    apenas os registros do intervalo. O cabeçalho guarda a identidade da
+    última foto enviada, usada para evitar baixar a mesma foto de novo, e a
+    da foto do último registro, usada para marcar FLAG_PICTURE_CHANGED.
+
+    O arquivo é travado com flock durante cada operação, então vários
+    processos (lote, daemon, scheduler) podem gravar no mesmo histórico.
+    """
+
+    def __init__(self, base_dir=DEFAULT_DIR, min_interval=DEFAULT_MIN_INTERVAL):
+        self.base_dir = Path(base_dir)
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+
+    def path_for(self, username):
+        return self.base_dir / f"{username.lower()}.bin"
+
+    def _create(self, path):
+        """Cria o arquivo do perfil só com o cabeçalho, se ainda não existir
+
+        O cabeçalho é gravado num arquivo temporário exclusivo e ligado ao
+        nome final com os.link, que falha se outro processo já o criou; assim
+        ninguém abre um arquivo sem cabeçalho.
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.temp")
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(HEADER.pack(MAGIC, RECORD.size, bytes(20), bytes(20)))
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+
+    def _open(self, username, lock=fcntl.LOCK_EX):
+        """Abre (criando, se preciso) e trava o arquivo do perfil
+
+        A trava (flock) é liberada quando o arquivo é fechado.
+        """
+        path = self.path_for(username)
+        if not path.exists():
+            self._create(path)
+        f = open(path, "r+b")
+        fcntl.flock(f, lock)
+        magic, record_size, *_ = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or record_size != RECORD.size:
+            f.close()
+            raise ValueError(f"Arquivo de histórico inválido: {path}")
+        return f
+
+    def _read_header(self, f):
+        f.seek(0)
+        return HEADER.unpack(f.read(HEADER.size))
+
+    def _count(self, f):
+        f.seek(0, os.SEEK_END)
+        return (f.tell() - HEADER.size) // RECORD.size
+
+    def _read(self, f, index):
+        f.seek(HEADER.size + index * RECORD.size)
+        return _unpack(f.read(RECORD.size))
+
+    def _bisect(self, f, count, timestamp):
+        """Índice do primeiro registro com timestamp >= `timestamp`"""
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._read(f, mid).timestamp < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def picture_changed(self, username, picture_url):
+        """Indica se a foto é diferente da última marcada com `mark_picture`"""
+        path = self.path_for(username)
+        if not path.exists():
+            return True
+        with self._lock, self._open(username, fcntl.LOCK_SH) as f:
+            _, _, sent, _ = self._read_header(f)
+        return sent != picture_digest(picture_url)
+
+    def mark_picture(self, username, picture_url):
+        """Registra a foto como baixada/enviada (chamar só após o sucesso)"""
+        with self._lock, self._open(username) as f:
+            magic, record_size, _, recorded = self._read_header(f)
+            f.seek(0)
+            f.write(HEADER.pack(magic, record_size, picture_digest(picture_url), recorded))
+
+    def record(self, username, profile_info, timestamp=None):
+        """Anexa um snapshot das métricas e retorna se a foto mudou
+
+        `profile_info` é o dicionário montado por build_profile_info. O
+        retorno compara a foto com a última enviada (mark_picture); a flag
+        FLAG_PICTURE_CHANGED compara com a foto do registro anterior.
+        """
+        timestamp = timestamp or time.time()
+        flags = ((FLAG_PRIVATE if profile_info.get("is_private") else 0)
+                 | (FLAG_VERIFIED if profile_info.get("is_verified") else 0))
+        values = tuple(_count(profile_info.get(field)) for field in METRIC_FIELDS)
+        with self._lock, self._open(username) as f:
+            magic, record_size, sent, recorded = self._read_header(f)
+            digest = picture_digest(profile_info.get("profile_pic_url"))
+            changed = digest != sent
+            if digest != recorded:
+                flags |= FLAG_PICTURE_CHANGED
+
+            count = self._count(f)
+            if count:
+                f.seek(HEADER.size + (count - 1) * RECORD.size)
+                last_timestamp, *last_values, last_flags = RECORD.unpack(f.read(RECORD.size))
+                if (not flags & FLAG_PICTURE_CHANGED and tuple(last_values) == values
+                        and last_flags & ~FLAG_PICTURE_CHANGED == flags
+                        and timestamp - last_timestamp < self.min_interval):
+                    return changed
+                # Mantém o arquivo ordenado para a busca binária
+                timestamp = max(timestamp, last_timestamp)
+            f.seek(0, os.SEEK_END)
+            f.write(RECORD.pack(timestamp, *values, flags))
+            if digest != recorded:
+                f.seek(0)
+                f.write(HEADER.pack(magic, record_size, sent, digest))
+        return changed
+
+    def history(self, username, start=None, end=None):
+        """Retorna os snapshots com start <= timestamp < end"""
+        path = self.path_for(username)
+        if not path.exists():
+            return []
+        with self._lock, self._open(username, fcntl.LOCK_SH) as f:
+            count = self._count(f)
+            first = self._bisect(f, count, start) if start is not None else 0
+            last = self._bisect(f, count, end) if end is not None else count
+            f.seek(HEADER.size + first * RECORD.size)
+            data = f.read((last - first) * RECORD.size)
+        return [_unpack(data[i:i + RECORD.size]) for i in range(0, len(data), RECORD.size)]
+
+    def latest(self, username):
+        path = self.path_for(username)
+        if not path.exists():
+            return None
+        with self._lock, self._open(username, fcntl.LOCK_SH) as f:
+            count = self._count(f)
+            return self._read(f, count - 1) if count else None
+
+    def delta(self, username, field="followers", days=30, now=None):
+        """Variação de `field` nos últimos `days` dias (None se não houver dados)"""
+        if field not in METRIC_FIELDS:
+            raise ValueError(f"Campo inválido: {field}")
+        now = now or time.time()
+        snapshots = self.history(username, start=now - days * 86400)
+        if not snapshots:
+            return None
+        first, last = snapshots[0], snapshots[-1]
+        return {
+            "username": username,
+            "campo": field,
+            "inicio": datetime.fromtimestamp(first.timestamp).isoformat(timespec="seconds"),
+            "fim": datetime.fromtimestamp(last.timestamp).isoformat(timespec="seconds"),
+            "valor_inicial": getattr(first, field),
+            "valor_final": getattr(last, field),
+            "delta": getattr(last, field) - getattr(first, field),
+            "snapshots": len(snapshots),
+        }
+
+    def usernames(self):
+        return sorted(p.stem for p in self.base_dir.glob("*.bin"))
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+def get_snapshot_store():
+    """Retorna o histórico compartilhado pelo processo (SNAPSHOT_DIR no .env)"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = SnapshotStore(
+                base_dir=os.getenv("SNAPSHOT_DIR", DEFAULT_DIR),
+                min_interval=float(os.getenv("SNAPSHOT_MIN_INTERVAL", DEFAULT_MIN_INTERVAL)))
+        return _default_store
+
+def main():
+    parser = argparse.ArgumentParser(description='Consulta o histórico de snapshots dos perfis')
+    parser.add_argument('--username', type=str,
+                      help='Perfil a consultar (padrão: todos os perfis com histórico)')
+    parser.add_argument('--days', type=int, default=30, help='Período em dias (padrão: 30)')
+    parser.add_argument('--field', choices=METRIC_FIELDS, default='followers',
+                      help='Métrica usada no cálculo da variação')
+    parser.add_argument('--history', action='store_true',
+                      help='Lista todos os snapshots do período em vez da variação')
+    args = parser.parse_args()
+
+    store = get_snapshot_store()
+    usernames = [args.username.lstrip('@')] if args.username else store.usernames()
+    if not usernames:
+        log_error("Nenhum histórico encontrado")
+        sys.exit(1)
+
+    if args.history:
+        start = time.time() - args.days * 86400
+        for username in usernames:
+            print(f"\n@{username}")
+            for s in store.history(username, start=start):
+                marker = " (nova foto)" if s.picture_changed else ""
+                print(f"{datetime.fromtimestamp(s.timestamp):%Y-%m-%d %H:%M}  "
+                      f"seguidores={s.followers} seguindo={s.following} "
+                      f"posts={s.mediacount}{marker}")
+        return
+
+    deltas = [d for d in (store.delta(u, args.field, args.days) for u in usernames) if d]
+    for d in sorted(deltas, key=lambda d: d["delta"], reverse=True):
+        print(f"@{d['username']}: {d['valor_inicial']} -> {d['valor_final']} "
+              f"({d['delta']:+d}) em {d['snapshots']} snapshots [{d['inicio']} a {d['fim']}]")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+import os
+import json
+import time
+import queue
+import atexit
+import base64
+import shutil
+import threading
+import contextvars
+from pathlib import Path
+from collections import namedtuple
+from concurrent.futures import Future, wait
+
+from dotenv import load_dotenv
+
+from minio_uploader import get_uploader, content_type_for, DEFAULT_UPLOAD_WORKERS
+from metrics import incr
+
+load_dotenv()
+
+# Destinos disponíveis (STORAGE_SINK no .env)
+SINKS = ("minio", "local", "memory")
+
+# Diretório do destino local: os objetos ficam em <dir>/<username>/...
+DEFAULT_LOCAL_DIR = "armazenamento"
+
+# Gravações enfileiradas antes de quem grava ter que esperar (backpressure)
+DEFAULT_QUEUE_SIZE = 256
+
+# Gravações que não terminaram quando o processo saiu; reenviadas na próxima execução
+SPILL_PATH = Path("dados") / ".storage_spill.ndjson"
+
+# Tempo máximo (segundos) esperando a fila esvaziar ao encerrar o processo
+DEFAULT_DRAIN_TIMEOUT = 60
+
+FILE = "arquivo"
+BYTES = "bytes"
+STREAM = "stream"
+TASK = "tarefa"
+
+_Write = namedtuple("_Write", ("kind", "object_name", "payload", "content_type", "future",
+                               "context"))
+
+def log_info(message):
+    print(f"[INFO] {message}")
+
+def log_error(message):
+    print(f"[ERROR] {message}")
+
+class LocalSink:
+    """Destino que grava os objetos num diretório local, com os mesmos nomes do bucket"""
+
+    def __init__(self, base_dir=DEFAULT_LOCAL_DIR):
+        self.base_dir = Path(base_dir)
+        self.writes = 0
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+
+    def ensure_bucket(self):
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+
+    def _target(self, object_name):
+        path = self.base_dir / object_name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def _written(self, object_name, size):
+        with self._lock:
+            self.writes += 1
+            self.bytes_written += size
+        log_info(f"Gravado em {self.base_dir / object_name}")
+        return True
+
+    def upload_file(self, file_path, object_name, content_type=None):
+        target = self._target(object_name)
+        if target.resolve() != Path(file_path).resolve():
+            tmp_path = target.with_name(target.name + ".temp")
+            shutil.copyfile(file_path, tmp_path)
+            os.replace(tmp_path, target)
+        return self._written(object_name, target.stat().st_size)
+
+    def upload_bytes(self, object_name, data: bytes, content_type=None):
+        target = self._target(object_name)
+        tmp_path = target.with_name(target.name + ".temp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, target)
+        return self._written(object_name, len(data))
+
+    def upload_stream(self, object_name, open_response, content_type=None):
+        target = self._target(object_name)
+        tmp_path = target.with_name(target.name + ".temp")
+        with open_response() as response:
+            response.raw.decode_content = True
+            with open(tmp_path, "wb") as f:
+                shutil.copyfileobj(response.raw, f)
+        os.replace(tmp_path, target)
+        size = target.stat().st_size
+        incr("bytes", size, direcao="download")
+        return self._written(object_name, size)
+
+    def flush(self, timeout=None):
+        return []
+
+    def report(self):
+        stats = {"gravacoes": self.writes, "bytes_gravados": self.bytes_written}
+        log_info(f"Resumo do armazenamento local ({self.base_dir}): "
+                 + ", ".join(f"{k}={v}" for k, v in stats.items()))
+        return stats
+
+    def close(self):
+        pass
+
+class MemorySink:
+    """Destino em memória (testes e benchmarks): {objeto: (conteúdo, content type)}"""
+
+    def __init__(self):
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def ensure_bucket(self):
+        pass
+
+    def get(self, object_name):
+        with self._lock:
+            entry = self.objects.get(object_name)
+        return entry[0] if entry else None
+
+    def upload_bytes(self, object_name, data: bytes, content_type=None):
+        with self._lock:
+            self.objects[object_name] = (bytes(data), content_type or content_type_for(object_name))
+        return True
+
+    def upload_file(self, file_path, object_name, content_type=None):
+        return self.upload_bytes(object_name, Path(file_path).read_bytes(), content_type)
+
+    def upload_stream(self, object_name, open_response, content_type=None):
+        with open_response() as response:
+            data = response.content
+        incr("bytes", len(data), direcao="download")
+        return self.upload_bytes(object_name, data, content_type)
+
+    def flush(self, timeout=None):
+        return []
+
+    def report(self):
+        with self._lock:
+            stats = {"objetos": len(self.objects),
+                     "bytes": sum(len(data) for data, _ in self.objects.values())}
+        log_info("Resumo do armazenamento em memória: "
+                 + ", ".join(f"{k}={v}" for k, v in stats.items()))
+        return stats
+
+    def close(self):
+        pass
+
+class WriteBehindStorage:
+    """Fila de escrita (write-behind) na frente de um destino de armazenamento
+
+    Os `submit_*` colocam a gravação numa fila limitada e retornam um
+    Future na hora; `workers` threads gravam no destino (Minio, diretório
+    local ou memória) em segundo plano, sem que a coleta espere pela latência
+    do armazenamento. Com a fila cheia, quem grava espera uma vaga
+    (backpressure) em vez de acumular perfis em memória.
+
+    Se o processo encerrar com gravações pendentes, elas vão para o arquivo
+    de spill e são reenviadas na próxima execução (`replay_spill`). Arquivos
+    e conteúdos em memória são preservados; streams e tarefas não têm como
+    ser serializados e só são registrados no log.
+
+    Tem a mesma interface do MinioUploader e pode ser passado como
+    `uploader` para as funções de coleta.
+    """
+
+    def __init__(self, sink, queue_size=DEFAULT_QUEUE_SIZE, workers=DEFAULT_UPLOAD_WORKERS,
+                 spill_path=SPILL_PATH):
+        self.sink = sink
+        self.spill_path = Path(spill_path)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._in_flight = {}
+        self._local = threading.local()
+        self._stopping = threading.Event()
+        self._closed = False
+        self.queued = 0
+        self.backpressure_waits = 0
+        self.backpressure_seconds = 0.0
+        self._threads = [threading.Thread(target=self._run, daemon=True, name=f"storage-{i}")
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def ensure_bucket(self):
+        self.sink.ensure_bucket()
+
+    # Gravações síncronas: vão direto ao destino, sem passar pela fila
+    def upload_file(self, file_path, object_name, content_type=None):
+        return self.sink.upload_file(file_path, object_name, content_type)
+
+    def upload_bytes(self, object_name, data: bytes, content_type=None):
+        return self.sink.upload_bytes(object_name, data, content_type)
+
+    def upload_stream(self, object_name, open_response, content_type=None):
+        return self.sink.upload_stream(object_name, open_response, content_type)
+
+    def _execute(self, item):
+        if item.kind == FILE:
+            return self.sink.upload_file(item.payload, item.object_name, item.content_type)
+        if item.kind == BYTES:
+            return self.sink.upload_bytes(item.object_name, item.payload, item.content_type)
+        if item.kind == STREAM:
+            return self.sink.upload_stream(item.object_name, item.payload, item.content_type)
+        fn, args = item.payload
+        return fn(*args)
+
+    def _process(self, item):
+        if not item.future.set_running_or_notify_cancel():
+            return
+        try:
+            result = item.context.run(self._execute, item)
+        except BaseException as e:
+            item.future.set_exception(e)
+        else:
+            item.future.set_result(result)
+
+    def _run(self):
+        self._local.worker = True
+        while not self._stopping.is_set():
+            try:
+                item = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            with self._lock:
+                self._in_flight[id(item)] = item
+            try:
+                self._process(item)
+            finally:
+                with self._lock:
+                    del self._in_flight[id(item)]
+
+    def _untrack(self, future):
+        with self._lock:
+            self._pending.discard(future)
+
+    def _enqueue(self, kind, object_name, payload, content_type=None):
+        if self._closed:
+            raise RuntimeError("Armazenamento já encerrado")
+        # Os uploads herdam o contexto de quem agendou (run_id das métricas)
+        item = _Write(kind, object_name, payload, content_type, Future(),
+                      contextvars.copy_context())
+        with self._lock:
+            self._pending.add(item.future)
+            self.queued += 1
+        item.future.add_done_callback(self._untrack)
+        if getattr(self._local, "worker", False):
+            # Agendado por uma tarefa da própria fila: esperar vaga travaria o worker
+            self._process(item)
+            return item.future
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            start = time.monotonic()
+            self._queue.put(item)
+            waited = time.monotonic() - start
+            with self._lock:
+                self.backpressure_waits += 1
+                self.backpressure_seconds += waited
+            incr("fila_escrita_cheia")
+        return item.future
+
+    def submit_file(self, file_path, object_name, content_type=None):
+        """Agenda a gravação de um arquivo e retorna o Future"""
+        return self._enqueue(FILE, object_name, str(file_path), content_type)
+
+    def submit_bytes(self, object_name, data: bytes, content_type=None):
+        """Agenda a gravação de um conteúdo em memória"""
+        return self._enqueue(BYTES, object_name, data, content_type)
+
+    def submit_stream(self, object_name, open_response, content_type=None):
+        """Agenda a gravação de uma resposta HTTP em stream"""
+        return self._enqueue(STREAM, object_name, open_response, content_type)
+
+    def submit_task(self, fn, *args):
+        """Agenda uma tarefa que grava objetos (ex.: variantes da foto); `flush` também a aguarda"""
+        return self._enqueue(TASK, None, (fn, args))
+
+    def submit_directory(self, user_dir: Path, names=None):
+        """Agenda a gravação dos arquivos do diretório do perfil (ou apenas `names`)"""
+        if names is None:
+            paths = [p for p in sorted(user_dir.glob('*')) if p.is_file()]
+        else:
+            paths = [user_dir / name for name in names]
+        return [self.submit_file(file_path, f"{user_dir.name}/{file_path.name}")
+                for file_path in paths]
+
+    def upload_directory(self, user_dir: Path, names=None):
+        """Grava o diretório do perfil (ou apenas `names`) e aguarda a conclusão"""
+        futures = self.submit_directory(user_dir, names)
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        for error in errors:
+            log_error(f"Erro ao gravar no armazenamento: {str(error)}")
+        self.sink.flush()
+        return not errors
+
+    def flush(self, timeout=None):
+        """Aguarda todas as gravações pendentes e retorna os erros ocorridos"""
+        with self._lock:
+            pending = list(self._pending)
+        done, not_done = wait(pending, timeout=timeout)
+        errors = [f.exception() for f in done if f.exception() is not None]
+        if not_done:
+            log_error(f"{len(not_done)} gravações ainda pendentes após o timeout")
+        errors.extend(self.sink.flush())
+        return errors
+
+    def report(self):
+        """Exibe e retorna o resumo do destino e da fila de escrita"""
+        stats = self.sink.report()
+        with self._lock:
+            log_info(f"Fila de escrita: {self.queued} gravações, {self.backpressure_waits} "
+                     f"esperas por vaga ({self.backpressure_seconds:.1f}s)")
+        return stats
+
+    def _spill(self, items):
+        """Grava no arquivo de spill as gravações que não terminaram"""
+        entries = []
+        for item in items:
+            if item.kind == FILE:
+                entries.append({"tipo": FILE, "objeto": item.object_name, "caminho": item.payload,
+                                "content_type": item.content_type})
+            elif item.kind == BYTES:
+                entries.append({"tipo": BYTES, "objeto": item.object_name,
+                                "dados": base64.b64encode(item.payload).decode("ascii"),
+                                "content_type": item.content_type})
+            else:
+                log_error(f"Gravação não concluída e não recuperável: "
+                          f"{item.object_name or item.payload[0].__name__}")
+        if not entries:
+            return 0
+        self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        incr("fila_escrita_spill", len(entries))
+        log_error(f"{len(entries)} gravações pendentes salvas em {self.spill_path}; "
+                  f"serão reenviadas na próxima execução")
+        return len(entries)
+
+    def replay_spill(self):
+        """Reenfileira as gravações salvas no spill por uma execução anterior
+
+        O spill é renomeado para `.replaying` antes de ser lido e só é
+        apagado depois que tudo foi reenfileirado; se o processo morrer no
+        meio, a próxima execução repete o replay (gravar de novo não faz mal).
+        """
+        replaying = self.spill_path.with_name(self.spill_path.name + ".replaying")
+        if self.spill_path.exists():
+            if replaying.exists():
+                # Replay anterior interrompido: junta os dois arquivos
+                with open(replaying, "a", encoding="utf-8") as f:
+                    f.write(self.spill_path.read_text(encoding="utf-8"))
+                self.spill_path.unlink()
+            else:
+                os.replace(self.spill_path, replaying)
+        if not replaying.exists():
+            return []
+        with open(replaying, encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        futures = []
+        for entry in entries:
+            if entry["tipo"] == BYTES:
+                futures.append(self.submit_bytes(entry["objeto"], base64.b64decode(entry["dados"]),
+                                                 entry["content_type"]))
+            elif os.path.exists(entry["caminho"]):
+                futures.append(self.submit_file(entry["caminho"], entry["objeto"],
+                                                entry["content_type"]))
+            else:
+                log_error(f"Arquivo do spill não existe mais: {entry['caminho']}")
+        # O que não for gravado até o fim desta execução volta para o spill em close()
+        replaying.unlink()
+        log_info(f"{len(futures)} gravações do spill reenfileiradas")
+        return futures
+
+    def close(self, timeout=None):
+        """Aguarda a fila esvaziar (até `timeout`), salva o que sobrou no spill e encerra"""
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+        self._stopping.set()
+        leftovers = []
+        while True:
+            try:
+                leftovers.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        with self._lock:
+            # Gravações em andamento são repetidas: gravar o mesmo objeto de novo não faz mal
+            leftovers.extend(item for item in self._in_flight.values() if not item.future.done())
+        self._spill(leftovers)
+        for thread in self._threads:
+            thread.join(timeout=1)
+        self.sink.close()
+
+def create_sink(kind=None):
+    """Cria o destino de STORAGE_SINK: minio (padrão), local ou memory"""
+    kind = kind or os.getenv("STORAGE_SINK", "minio")
+    if kind == "minio":
+        return get_uploader()
+    if kind == "local":
+        return LocalSink(os.getenv("STORAGE_LOCAL_DIR", DEFAULT_LOCAL_DIR))
+    if kind == "memory":
+        return MemorySink()
+    raise ValueError(f"STORAGE_SINK inválido: {kind} (use {', '.join(SINKS)})")
+
+_default_storage = None
+_default_storage_lock = threading.Lock()
+
+def _close_default_storage():
+    if _default_storage is not None:
+        _default_storage.close(timeout=float(os.getenv("STORAGE_DRAIN_TIMEOUT",
+                                                       DEFAULT_DRAIN_TIMEOUT)))
+
+def get_storage():
+    """Retorna o armazenamento do processo (destino de STORAGE_SINK com fila de escrita)
+
+    O tamanho da fila vem de STORAGE_QUEUE_SIZE. Na criação, reenfileira o
+    spill de uma execução anterior; ao sair, aguarda até STORAGE_DRAIN_TIMEOUT
+    segundos pelas gravações pendentes antes de salvá-las no spill.
+    """
+    global _default_storage
+    with _default_storage_lock:
+        if _default_storage is None:
+            _default_storage = WriteBehindStorage(
+                create_sink(),
+                queue_size=int(os.getenv("STORAGE_QUEUE_SIZE", DEFAULT_QUEUE_SIZE)),
+                spill_path=os.getenv("STORAGE_SPILL_FILE", SPILL_PATH))
+            atexit.register(_close_default_storage)
+            _default_storage.replay_spill()
+        return _default_storage
@@ -1,25 +1,30 @@
 import os
 import sys
 import json
-import shutil
 import argparse
 from pathlib import Path
 from datetime import datetime
-import time
-import random
 
 import instaloader
-from minio import Minio
 from dotenv import load_dotenv
 
+from session_pool import SessionPool, NoSessionAvailable, session_file_for
+from storage import get_storage
+from media_store import get_media_store
+from cdn_client import open_picture
+from rate_limiter import TokenBucketRateController
+from failures import call_with_policy
+from proxy_pool import attach_proxy_pool
+
 # Carrega variáveis de ambiente
 load_dotenv()
 
 # Configurações
 UPLOAD_TO_MINIO = True
 MAX_RETRIES = 3
-BASE_DELAY = 5
-USE_DELAY = True
+
+# Arquivos do perfil enviados ao Minio
+FILES = ["profile_info.json", "profile_pic.jpg"]
 
 def log_info(message):
     print(f"[INFO] {message}")
@@ -27,90 +32,78 @@ def log_info(message):
 def log_error(message):
     print(f"[ERROR] {message}")
 
-def random_delay():
-    """Implementa um delay aleatório para evitar detecção"""
-    if USE_DELAY:
-        delay = random.uniform(2, 5)
-        time.sleep(delay)
-
 class CustomInstaloader(instaloader.Instaloader):
-    def get_anonymous_session(self):
-        """Sobrescreve o método para adicionar delays"""
-        random_delay()
-        return super().get_anonymous_session()
+    def __init__(self, **kwargs):
+        """Usa o rate limiter compartilhado (token bucket) no lugar de delays aleatórios"""
+        kwargs.setdefault("rate_controller", TokenBucketRateController)
+        super().__init__(**kwargs)
 
 def setup_directory(username):
-    """Cria e retorna o diretório para o usuário"""
+    """Cria e retorna o diretório para o usuário
+
+    O conteúdo anterior é mantido: cada arquivo é substituído de forma
+    atômica e a foto é um hardlink para o store de mídias.
+    """
     base_dir = Path("dados")
     base_dir.mkdir(exist_ok=True)
     log_info("Diretório base 'dados' verificado")
     
     user_dir = base_dir / username
-    if user_dir.exists():
-        shutil.rmtree(user_dir)
-    user_dir.mkdir()
-    log_info(f"Diretório limpo criado em: {user_dir}")
+    user_dir.mkdir(exist_ok=True)
+    log_info(f"Diretório criado em: {user_dir}")
     
     return user_dir
 
-def get_minio_client():
-    """Configura e retorna o cliente Minio"""
-    try:
-        endpoint = "s3.supercaso.com.br"
-        with open('auth/credentials.json') as f:
-            credentials = json.load(f)
-        
-        log_info(f"Configurando Minio com endpoint: {endpoint}")
-        
-        client = Minio(
-            endpoint,
-            access_key=credentials["accessKey"],
-            secret_key=credentials["secretKey"],
-            secure=True
-        )
-        log_info("Cliente Minio configurado com sucesso")
-        return client
-    except Exception as e:
-        log_error(f"Erro ao configurar cliente Minio: {str(e)}")
-        raise
-
 def retry_operation(operation, max_retries=MAX_RETRIES):
-    """Tenta uma operação com retry e delay exponencial"""
-    for attempt in range(max_retries):
+    """Tenta uma operação com a política de retry de failures.py
+
+    Em caso de 429, aguarda só o tempo indicado pelo rate limiter; perfis
+    inexistentes ou privados não são tentados de novo.
+    """
+    return call_with_policy(operation, operation="teste_sessao",
+                            account=os.getenv("INSTAGRAM_USERNAME"), max_attempts=max_retries)
+
+_session_pool = None
+
+def create_loader():
+    """Cria o Instaloader configurado com rate limit"""
+    return CustomInstaloader(
+        download_pictures=True,
+        download_videos=False,
+        download_video_thumbnails=False,
+        download_geotags=False,
+        download_comments=False,
+        save_metadata=False,
+        request_timeout=30
+    )
+
+def load_pooled_loader(username):
+    """Cria o Instaloader com a sessão salva da conta"""
+    loader = create_loader()
+    loader.load_session_from_file(username, session_file_for(username))
+    attach_proxy_pool(loader)
+    return loader
+
+def get_session_pool():
+    """Retorna o pool de sessões das contas em INSTAGRAM_USERNAMES (ou None)"""
+    global _session_pool
+    if _session_pool is None:
         try:
-            return operation()
-        except Exception as e:
-            if attempt == max_retries - 1:
-                raise
-            delay = BASE_DELAY * (2 ** attempt) + random.uniform(1, 3)
-            log_info(f"Tentativa {attempt + 1} falhou. Aguardando {delay:.1f}s...")
-            time.sleep(delay)
+            _session_pool = SessionPool(loader_factory=load_pooled_loader)
+        except NoSessionAvailable:
+            log_info("Nenhuma sessão disponível. Continuando sem sessão")
+    return _session_pool
 
 def get_instagram_data(username):
     """Obtém dados do Instagram com retry"""
     def _get_data():
-        # Configura o Instaloader com delays
-        loader = CustomInstaloader(
-            download_pictures=True,
-            download_videos=False,
-            download_video_thumbnails=False,
-            download_geotags=False,
-            download_comments=False,
-            save_metadata=False,
-            request_timeout=30
-        )
-        
-        # Carrega sessão se disponível
-        try:
-            session_file = f"{os.getenv('INSTAGRAM_USERNAME')}_session"
-            if os.path.exists(session_file):
-                loader.load_session_from_file(os.getenv('INSTAGRAM_USERNAME'))
-                log_info("Sessão carregada")
-        except:
-            log_info("Continuando sem sessão")
-
-        random_delay()
-        profile = instaloader.Profile.from_username(loader.context, username)
+        pool = get_session_pool()
+        if pool is None:
+            loader = create_loader()
+            return loader, instaloader.Profile.from_username(loader.context, username)
+
+        with pool.session() as loader:
+            profile = instaloader.Profile.from_username(loader.context, username)
         return loader, profile
 
     return retry_operation(_get_data)
@@ -118,39 +111,7 @@ def get_instagram_data(username):
 def upload_to_minio(user_dir: Path):
     """Realiza upload dos arquivos para o Minio"""
     try:
-        client = get_minio_client()
-        bucket_name = os.getenv("BUCKET_NAME")
-        
-        if not bucket_name:
-            raise ValueError("BUCKET_NAME não encontrado no .env")
-        
-        if not client.bucket_exists(bucket_name):
-            client.make_bucket(bucket_name)
-            log_info(f"Bucket '{bucket_name}' criado")
-        
-        for file_path in user_dir.glob('*'):
-            file_name = file_path.name
-            object_name = f"{user_dir.name}/{file_name}"
-            content_type = 'image/jpeg' if file_name.endswith('.jpg') else 'application/json'
-            
-            def _upload():
-                try:
-                    client.remove_object(bucket_name, object_name)
-                except:
-                    pass
-                
-                log_info(f"Iniciando upload de {file_name}")
-                client.fput_object(
-                    bucket_name,
-                    object_name,
-                    str(file_path),
-                    content_type=content_type
-                )
-                log_info(f"Upload concluído: {object_name}")
-            
-            retry_operation(_upload)
-        
-        return True
+        return get_storage().upload_directory(user_dir, FILES)
         
     except Exception as e:
         log_error(f"Erro no upload para Minio: {str(e)}")
@@ -165,9 +126,6 @@ def save_instagram_data(username):
         loader, profile = get_instagram_data(username)
         log_info("Dados do perfil obtidos com sucesso")
         
-        # Define o diretório de download
-        loader.dirname_pattern = str(user_dir)
-        
         # Prepara informações
         profile_info = {
             "username": username,
@@ -184,23 +142,22 @@ def save_instagram_data(username):
         
         # Salva JSON
         json_path = user_dir / "profile_info.json"
-        with open(json_path, 'w', encoding='utf-8') as f:
+        tmp_path = json_path.with_suffix(".temp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
             json.dump(profile_info, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, json_path)
         log_info(f"Arquivo JSON criado: {json_path}")
         
-        # Download da foto com retry
+        # Download da foto com retry, direto para o store de mídias (pela
+        # mesma sessão HTTP e proxies do get_profile.py)
         def _download_pic():
-            loader.download_profilepic(profile)
-        retry_operation(_download_pic)
-        
-        # Renomeia a foto
-        for file in os.listdir(user_dir):
-            if file.endswith('_profile_pic.jpg'):
-                old_path = user_dir / file
-                new_path = user_dir / "profile_pic.jpg"
-                os.rename(old_path, new_path)
-                log_info("Foto de perfil renomeada")
-                break
+            with open_picture(profile.profile_pic_url) as response:
+                response.raw.decode_content = True
+                return get_media_store().save_stream(response.raw, user_dir / "profile_pic.jpg")
+        if retry_operation(_download_pic):
+            log_info("Foto de perfil salva em profile_pic.jpg")
+        else:
+            log_info("Foto de perfil sem alterações")
         
         # Exibe informações
         print("\nInformações do perfil:")
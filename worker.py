@@ -0,0 +1,167 @@
+import os
+import socket
+import signal
+import argparse
+import threading
+from concurrent.futures import wait
+
+from dotenv import load_dotenv
+
+import get_profile
+from get_profile import save_instagram_data, DEFAULT_WORKERS
+from session_pool import SessionPool, STRATEGIES, NoSessionAvailable
+from session_health import start_health_checker
+from storage import get_storage
+from job_queue import open_queue, DEFAULT_LEASE
+from failures import is_permanent, SkippedProfile
+from metrics import incr
+
+load_dotenv()
+
+# Intervalo (segundos) entre consultas à fila quando não há jobs disponíveis
+IDLE_POLL = 10
+
+def log_info(message):
+    print(f"[INFO] {message}")
+
+def log_error(message):
+    print(f"[ERROR] {message}")
+
+class LeaseKeeper:
+    """Renova periodicamente os leases dos jobs em andamento"""
+
+    def __init__(self, queue, lease_seconds):
+        self.queue = queue
+        self.lease_seconds = lease_seconds
+        self._jobs = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="lease-keeper")
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def add(self, job):
+        with self._lock:
+            self._jobs.add(job)
+
+    def remove(self, job):
+        with self._lock:
+            self._jobs.discard(job)
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            with self._lock:
+                jobs = list(self._jobs)
+            for job in jobs:
+                try:
+                    if not self.queue.extend(job, self.lease_seconds):
+                        log_error(f"Lease de @{job.username} perdido para outro worker")
+                except Exception as e:
+                    log_error(f"Erro ao renovar lease de @{job.username}: {str(e)}")
+
+    def stop(self):
+        self._stop.set()
+
+def process_job(job, pool, uploader, diskless):
+    """Coleta o perfil do job e aguarda o upload; levanta exceção em caso de falha"""
+    with pool.session() as loader:
+        uploads = save_instagram_data(job.username, loader=loader, uploader=uploader,
+                                      wait_upload=False, diskless=diskless)
+    wait(uploads)
+    errors = [f.exception() for f in uploads if f.exception() is not None]
+    if errors:
+        raise Exception(f"Falha no upload para Minio: {str(errors[0])}")
+
+def worker_loop(worker_id, queue, keeper, pool, uploader, args, stop):
+    """Reserva e processa jobs até a fila esvaziar (com --exit-when-empty) ou `stop`"""
+    processed = 0
+    while not stop.is_set():
+        jobs = queue.lease(worker_id, args.lease)
+        if not jobs:
+            stats = queue.stats()
+            if args.exit_when_empty and not stats["pending"] and not stats["leased"]:
+                break
+            stop.wait(IDLE_POLL)
+            continue
+
+        job = jobs[0]
+        keeper.add(job)
+        log_info(f"[{worker_id}] Processando @{job.username} "
+                 f"(tentativa {job.attempts}/{job.max_attempts})")
+        try:
+            process_job(job, pool, uploader, args.diskless)
+            queue.ack(job)
+            incr("jobs", resultado="ok")
+            processed += 1
+        except NoSessionAvailable as e:
+            queue.release(job)
+            log_error(f"[{worker_id}] {str(e)}; job devolvido à fila")
+        except SkippedProfile as e:
+            queue.fail(job, e, permanent=True)
+            incr("jobs", resultado="ignorado")
+            log_info(f"[{worker_id}] {str(e)}")
+        except Exception as e:
+            # Perfil inexistente ou privado não volta para a fila
+            queue.fail(job, e, permanent=is_permanent(e))
+            incr("jobs", resultado="falha")
+            log_error(f"[{worker_id}] Falha em @{job.username}: {str(e)}")
+        finally:
+            keeper.remove(job)
+    return processed
+
+def main():
+    parser = argparse.ArgumentParser(description='Worker que processa os perfis da fila (job_queue.py)')
+    parser.add_argument('--queue', type=str, help='Fila (padrão: JOB_QUEUE_URL ou jobs.db)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                      help=f'Perfis processados em paralelo neste processo (padrão: {DEFAULT_WORKERS})')
+    parser.add_argument('--lease', type=float, default=DEFAULT_LEASE,
+                      help=f'Duração do lease em segundos (padrão: {DEFAULT_LEASE})')
+    parser.add_argument('--exit-when-empty', action='store_true',
+                      help='Encerra quando não houver mais jobs pendentes')
+    parser.add_argument('--diskless', action='store_true',
+                      help='Envia JSON e foto direto ao Minio, sem gravar em dados/')
+    parser.add_argument('--session-strategy', choices=STRATEGIES, default='round_robin',
+                      help='Rotação entre as contas de INSTAGRAM_USERNAMES')
+    args = parser.parse_args()
+
+    queue = open_queue(args.queue)
+    pool = SessionPool(strategy=args.session_strategy)
+    health = start_health_checker(pool)
+    uploader = get_storage() if get_profile.UPLOAD_TO_MINIO else None
+    keeper = LeaseKeeper(queue, args.lease).start()
+    stop = threading.Event()
+
+    def _shutdown(signum, frame):
+        log_info("Encerrando após os jobs em andamento...")
+        stop.set()
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    log_info(f"Worker {prefix} iniciado com {args.workers} threads")
+    threads = []
+    results = [0] * max(1, args.workers)
+    for i in range(len(results)):
+        def _run(i=i):
+            results[i] = worker_loop(f"{prefix}:{i}", queue, keeper, pool, uploader, args, stop)
+        thread = threading.Thread(target=_run, name=f"worker-{i}")
+        thread.start()
+        threads.append(thread)
+
+    while any(t.is_alive() for t in threads):
+        for t in threads:
+            t.join(timeout=1)
+
+    keeper.stop()
+    if health:
+        health.stop()
+    if uploader:
+        uploader.close()
+    stats = queue.stats()
+    log_info(f"Worker encerrado: {sum(results)} perfis processados. Fila: "
+             + ", ".join(f"{status}={count}" for status, count in stats.items()))
+
+if __name__ == "__main__":
+    main()